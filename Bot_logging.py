@@ -0,0 +1,76 @@
+#===============================================================================
+# This file holds the tools used to log the bot's activity without slowing
+# the bot down.
+#
+# Log messages often include whole lists of rows, such as every quest in a
+# spreadsheet range. Those lists are wrapped in a payload, which is only
+# turned into text if the message is actually written, and is cut down to a
+# short sample unless the logger is set to DEBUG.
+#
+# Writing to the log files is done by a background thread. The loggers only
+# put their messages on a queue, so the bot never waits on the disk.
+#===============================================================================
+
+import logging
+import logging.handlers
+import queue
+
+# How much of a payload is written when the logger is not set to DEBUG
+SAMPLE_ROWS = 3 # rows shown from a list of rows
+MAX_CHARS = 500 # characters shown from any single payload
+
+class payload:
+    """Wraps a value which is being logged, such as a list of rows, so it is
+    only formatted if the message is written. At DEBUG the whole value is
+    written; otherwise lists are cut down to their first few rows and a
+    count, and the text is cut to MAX_CHARS
+    """
+    __slots__ = ("_value", "_logger")
+
+    def __init__(self, value, logger: str='bot activity'):
+        """Stores the value and the name of the logger it is written to"""
+        self._value = value
+        self._logger = logger
+
+    def __str__(self):
+        if logging.getLogger(self._logger).isEnabledFor(logging.DEBUG):
+            return str(self._value)
+        value = self._value
+        if isinstance(value, (list, tuple)) and len(value) > 0 and isinstance(value[0], (list, tuple, dict)):
+            # A list of rows; write a sample of them
+            text = str(list(value[:SAMPLE_ROWS]))
+            if len(value) > SAMPLE_ROWS:
+                text = text[:-1] + f", ... {len(value) - SAMPLE_ROWS} more]"
+        else:
+            text = str(value)
+        if len(text) > MAX_CHARS:
+            text = text[:MAX_CHARS] + f"... ({len(text) - MAX_CHARS} characters cut)"
+        return text
+
+    __repr__ = __str__
+
+def queueLogger(name: str, *handlers, level=logging.INFO, propagate=True):
+    """Sets up the given logger to send its messages through a queue to the
+    given handlers, which are run on a background thread. Returns the
+    QueueListener which runs the handlers; it needs to be started before
+    anything is written, and stopped when the bot closes so the last
+    messages are written out
+    """
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
+    logger.propagate = propagate
+    messages = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(messages))
+    return logging.handlers.QueueListener(messages, *handlers, respect_handler_level=True)
+
+def fileHandler(filename: str, format: str, maxBytes: int=0, backupCount: int=0):
+    """Creates a handler which writes to the given log file with the given
+    format. If maxBytes is given, the file is rolled over into backups once
+    it grows past that size; otherwise it is started over each time the bot starts
+    """
+    if maxBytes > 0:
+        handler = logging.handlers.RotatingFileHandler(filename=filename, encoding='utf-8', maxBytes=maxBytes, backupCount=backupCount)
+    else:
+        handler = logging.FileHandler(filename=filename, encoding='utf-8', mode='w')
+    handler.setFormatter(logging.Formatter(format))
+    return handler
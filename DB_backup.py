@@ -0,0 +1,243 @@
+#===============================================================================
+# This file holds the tools used to back up the quest system database
+# while the bot is running, and to check and restore those backups.
+#
+# Backups are taken with SQLite's backup API from a separate read-only
+# connection, a few pages at a time with a short pause between each step,
+# so the bot keeps writing to the database while the backup runs. Each
+# backup is gzipped into the backups folder, and only the newest few are kept.
+#
+# Databases attached to the quest system database, such as the quest log
+# archive, are backed up with it into a second file named after the backup,
+# such as QuestDB-20220401-030000.archive.gz, and restored along with it.
+#
+# To check a backup against the live database without the bot, run
+#   python DB_backup.py QuestDB.db backups/QuestDB-20220401-030000.db.gz QuestArchive.db
+#===============================================================================
+
+import datetime
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+_logger = logging.getLogger('bot activity')
+
+BACKUP_DIR = "./backups" # where the backups are kept
+KEEP = 14 # backups kept before the oldest is deleted
+PAGES = 256 # pages copied in each step of a backup
+PAUSE = 0.05 # seconds waited between steps, so the writer can get in
+MAX_RESTARTS = 5 # times a backup may start over before it is given up on
+# The tables compared when a backup is checked
+TABLES = ("adventurers", "quests", "questLog")
+# The tables of each attached database which are compared and restored
+ATTACHED_TABLES = {"archive": ("questLog",)}
+
+def backupName(dbPath: str, when: datetime.datetime=None):
+    """Returns the file name of a backup of the given database taken at
+    the given time, such as QuestDB-20220401-030000.db.gz. The names sort
+    in the order the backups were taken
+    """
+    when = when or datetime.datetime.now()
+    base = os.path.splitext(os.path.basename(dbPath))[0]
+    return f"{base}-{when.strftime('%Y%m%d-%H%M%S')}.db.gz"
+
+def attachedName(name: str, schema: str):
+    """Returns the file name of the backup of the database attached under
+    schema which was taken with the backup of the given name, such as
+    QuestDB-20220401-030000.archive.gz
+    """
+    return name[:-len(".db.gz")] + f".{schema}.gz"
+
+def listBackups(dbPath: str, folder: str=BACKUP_DIR):
+    """Returns the file names of every backup of the given database
+    in the folder, oldest first
+    """
+    if not os.path.isdir(folder):
+        return []
+    base = os.path.splitext(os.path.basename(dbPath))[0] + "-"
+    return sorted(name for name in os.listdir(folder) if name.startswith(base) and name.endswith(".db.gz"))
+
+def takeBackup(dbPath: str, folder: str=BACKUP_DIR, keep: int=KEEP, pages: int=PAGES, pause: float=PAUSE, attach: dict=None):
+    """Backs up the database into a gzipped file in the folder, deletes all
+    but the newest keep backups, and returns the path of the new backup.
+    attach pairs a schema name with the path of an attached database, such
+    as {"archive": "QuestArchive.db"}; each one is backed up into its own
+    file after the database, see attachedName.
+
+    This blocks until the backup is done, so run it on a thread. Pages are
+    copied pages at a time with a pause between each step. If the database
+    changes between two steps, SQLite starts the backup over; after
+    MAX_RESTARTS of those the backup is given up on with a RuntimeError
+    """
+    os.makedirs(folder, exist_ok=True)
+    name = backupName(dbPath)
+    path = os.path.join(folder, name)
+    start = time.perf_counter()
+    attach = attach or {}
+
+    source = sqlite3.connect(f"file:{dbPath}?mode=ro", uri=True)
+    written = []
+    try:
+        for schema, attachPath in attach.items():
+            source.execute("ATTACH DATABASE ? AS " + schema, (f"file:{attachPath}?mode=ro",))
+        # The database is backed up first. Entries are only deleted from it once
+        # they are in the archive, so a later backup of the archive still has them
+        for schema, schemaPath in [("main", path)] + [(schema, os.path.join(folder, attachedName(name, schema))) for schema in attach]:
+            state = _copyDatabase(source, schema, schemaPath, folder, pages, pause)
+            written.append(schemaPath)
+            _logger.info("DB_backup:takeBackup: backed up %s pages of %s %s to %s (%s bytes, started over %s times)",
+                         str(state["total"]), dbPath, schema, schemaPath, str(os.path.getsize(schemaPath)), str(state["restarts"]))
+    except BaseException:
+        # A backup missing any of its files is no backup at all
+        for schemaPath in written:
+            os.remove(schemaPath)
+        raise
+    finally:
+        source.close()
+
+    for old in listBackups(dbPath, folder)[:-keep]:
+        for oldName in [old] + [attachedName(old, schema) for schema in attach]:
+            if os.path.exists(os.path.join(folder, oldName)):
+                os.remove(os.path.join(folder, oldName))
+                _logger.info("DB_backup:takeBackup: deleted old backup %s", oldName)
+    _logger.info("DB_backup:takeBackup: backed up %s to %s in %.1f s", dbPath, path, time.perf_counter() - start)
+    return path
+
+def _copyDatabase(source, schema: str, path: str, folder: str, pages: int, pause: float):
+    """Copies the database attached to source under schema into a gzipped
+    file at path, pages at a time, and returns the number of pages copied
+    and the times the copy started over
+    """
+    state = {"remaining": None, "total": 0, "restarts": 0}
+
+    def progress(status, remaining, total):
+        # Fewer pages are left after every step unless the backup started over
+        if state["remaining"] is not None and remaining >= state["remaining"]:
+            state["restarts"] += 1
+            if state["restarts"] > MAX_RESTARTS:
+                raise RuntimeError(f"the database kept changing, the backup started over more than {MAX_RESTARTS} times")
+        state["remaining"] = remaining
+        state["total"] = total
+        time.sleep(pause)
+
+    # The pages are copied into a plain file first, then compressed
+    handle, rawPath = tempfile.mkstemp(suffix=".db", dir=folder)
+    os.close(handle)
+    try:
+        target = sqlite3.connect(rawPath)
+        try:
+            source.backup(target, pages=pages, progress=progress, name=schema)
+        finally:
+            target.close()
+        with open(rawPath, "rb") as raw, gzip.open(path + ".part", "wb") as packed:
+            shutil.copyfileobj(raw, packed)
+        # Only a finished file ever has the backup's name
+        os.replace(path + ".part", path)
+    finally:
+        os.remove(rawPath)
+        if os.path.exists(path + ".part"):
+            os.remove(path + ".part")
+    return state
+
+def rowCounts(connection):
+    """Returns the number of rows in each of the TABLES, or None for a
+    table the database doesn't have. The tables of the databases attached
+    to the connection which are in ATTACHED_TABLES are counted as well,
+    under names such as "archive.questLog"
+    """
+    counts = {}
+    schemas = [row[1] for row in connection.execute("PRAGMA database_list").fetchall()]
+    tables = list(TABLES) + [f"{schema}.{table}" for schema in schemas for table in ATTACHED_TABLES.get(schema, ())]
+    for table in tables:
+        try:
+            counts[table] = connection.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+        except sqlite3.OperationalError:
+            counts[table] = None
+    return counts
+
+def unpackBackup(path: str):
+    """Decompresses a backup into a temporary file and returns its path.
+    The caller deletes the file once it is done with it
+    """
+    handle, rawPath = tempfile.mkstemp(suffix=".db")
+    with os.fdopen(handle, "wb") as raw, gzip.open(path, "rb") as packed:
+        shutil.copyfileobj(packed, raw)
+    return rawPath
+
+def checkBackup(rawPath: str, attach: dict=None):
+    """Checks an unpacked backup, along with the unpacked backups of its
+    attached databases in attach, a schema name paired with each path.
+    Returns the result of their integrity checks ("ok" if nothing is wrong)
+    and the row counts of their tables
+    """
+    connection = sqlite3.connect(f"file:{rawPath}?mode=ro", uri=True)
+    try:
+        for schema, attachPath in (attach or {}).items():
+            connection.execute("ATTACH DATABASE ? AS " + schema, (f"file:{attachPath}?mode=ro",))
+        problems = []
+        for schema in ["main"] + list(attach or {}):
+            integrity = connection.execute(f"PRAGMA {schema}.integrity_check").fetchone()[0]
+            if integrity != "ok":
+                problems.append(f"{schema}: {integrity}")
+        return "ok" if problems == [] else "; ".join(problems), rowCounts(connection)
+    finally:
+        connection.close()
+
+def restoreInto(connection, rawPath: str, pages: int=PAGES):
+    """Copies an unpacked backup over the database of the given connection,
+    replacing everything in it. The connection can't be in a transaction
+    """
+    backup = sqlite3.connect(f"file:{rawPath}?mode=ro", uri=True)
+    try:
+        backup.backup(connection, pages=pages)
+    finally:
+        backup.close()
+
+def restoreAttached(connection, schema: str, rawPath: str):
+    """Replaces the tables in ATTACHED_TABLES of the database attached to
+    the connection under schema with the ones in an unpacked backup of it,
+    in one transaction. The connection can't be in a transaction
+    """
+    connection.execute("ATTACH DATABASE ? AS restoreSource", (f"file:{rawPath}?mode=ro",))
+    try:
+        connection.execute("BEGIN")
+        try:
+            for table in ATTACHED_TABLES.get(schema, ()):
+                connection.execute(f"DELETE FROM {schema}.{table}")
+                connection.execute(f"INSERT INTO {schema}.{table} SELECT * FROM restoreSource.{table}")
+        except BaseException:
+            connection.rollback()
+            raise
+        connection.commit()
+    finally:
+        connection.execute("DETACH DATABASE restoreSource")
+
+if __name__ == "__main__":
+    # Checks a backup and compares its row counts with the given
+    # database, and the archive if one is given. Neither of them is changed
+    import sys
+    logging.basicConfig(level=logging.INFO)
+    dbPath = sys.argv[1] if len(sys.argv) > 1 else "QuestDB.db"
+    path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(BACKUP_DIR, listBackups(dbPath)[-1])
+    archivePath = sys.argv[3] if len(sys.argv) > 3 else None
+    rawPaths = {"main": unpackBackup(path)}
+    archiveBackup = os.path.join(os.path.dirname(path), attachedName(os.path.basename(path), "archive"))
+    if archivePath is not None and os.path.exists(archiveBackup):
+        rawPaths["archive"] = unpackBackup(archiveBackup)
+    try:
+        integrity, counts = checkBackup(rawPaths["main"], {schema: rawPath for schema, rawPath in rawPaths.items() if schema != "main"})
+    finally:
+        for rawPath in rawPaths.values():
+            os.remove(rawPath)
+    live = sqlite3.connect(f"file:{dbPath}?mode=ro", uri=True)
+    if archivePath is not None:
+        live.execute("ATTACH DATABASE ? AS archive", (f"file:{archivePath}?mode=ro",))
+    liveCounts = rowCounts(live)
+    live.close()
+    print(f"{path}: integrity check {integrity}")
+    for table in list(liveCounts) + [table for table in counts if table not in liveCounts]:
+        print(f"  {table}: {counts.get(table)} in the backup, {liveCounts.get(table)} in {dbPath}")
@@ -0,0 +1,365 @@
+#===============================================================================
+# This file creates the connection manager which runs all work done on the
+# quest system database. One manager is made when the bot starts, and every
+# cog which uses the database shares it.
+#
+# sqlite3 is a blocking library, so any query made directly inside of a
+# coroutine stops the whole bot (heartbeats included) until it finishes.
+# Instead, every change is handed to a dedicated writer thread which owns
+# the only writable connection, and queries are handed to a small pool of
+# threads with read-only connections. The coroutine awaits the result.
+#
+# The database runs in WAL mode, so the readers never block the writer
+# and the writer never blocks the readers.
+#
+# Changes which belong together, such as awarding a quest and updating the
+# member's level, are grouped into a unit of work. Everything done inside
+# the unit is committed once when it ends, or rolled back if any part of
+# it fails. Units started inside another unit join it.
+#===============================================================================
+
+import sqlite3
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import logging
+import contextlib
+import contextvars
+
+class workUnit:
+    """A unit of work started by db_connection.unitOfWork. Holds whether
+    the unit has failed and what should happen once it ends
+    """
+    def __init__(self, atomic: bool=True):
+        """Creates the unit. A unit which is not atomic does not group
+        anything; every change made inside of it commits on its own
+        """
+        self.atomic = atomic
+        self.failed = False
+        self._task = asyncio.current_task() # only the task which started the unit is a part of it
+        self._onCommit = [] # coroutine functions run once the unit commits
+        self._onEnd = [] # functions run once the unit ends, whether it committed or not
+
+    def fail(self):
+        """Marks the unit as failed, so everything done in it is rolled back when it ends"""
+        self.failed = True
+
+    def onCommit(self, callback):
+        """Runs await callback() once the unit has committed. Used for
+        anything which can't be undone, like sending messages
+        """
+        self._onCommit.append(callback)
+
+    def onEnd(self, callback):
+        """Runs callback() once the unit ends, whether it committed or rolled back"""
+        self._onEnd.append(callback)
+
+class db_connection:
+    """Owns the connections to the database and the threads
+    they are used from. Changes are queued on the writer thread
+    in the order they are made, so they never overlap each other
+    """
+    def __init__(self, db_path, readers: int=2, attach: dict=None):
+        """Stores the path to the database and creates the
+        writer and reader threads. The connections themselves are
+        opened by the threads the first time they are needed, and stay
+        open until the manager is closed, no matter how many times the
+        bot reconnects to discord.
+        
+        attach pairs a schema name with the path of another database which
+        every connection attaches under that name, such as {"archive": "QuestArchive.db"}.
+        The writer creates the file if it doesn't exist
+        """
+        self._logger = logging.getLogger('bot activity')
+        self._dbpath = db_path
+        self._attach = attach or {}
+        self._connection = None
+        self._readConnections = [] # every read-only connection, so they can be closed
+        self._local = threading.local() # holds the read-only connection of each reader thread
+        self._lock = threading.Lock()
+        # A single writer means every change runs one after the
+        # other, in the order it was made
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="QuestDB writer")
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="QuestDB reader")
+        # Held by the unit of work using the writer connection. Changes made
+        # outside of the unit wait for it, so they are never committed with it
+        self._unitLock = asyncio.Lock()
+        # The unit of work of the running task, if it is in one
+        self._unit = contextvars.ContextVar("QuestDB unit of work", default=None)
+
+    @property
+    def path(self):
+        """The path to the database file"""
+        return self._dbpath
+
+    @property
+    def attached(self):
+        """The schema name of each attached database paired with its path"""
+        return dict(self._attach)
+
+    def _connect(self):
+        """Returns the writable connection to the database, opening it
+        if it does not exist yet. Only call this from the writer thread
+        """
+        if self._connection is None:
+            connection = sqlite3.connect(self._dbpath)
+            # WAL is saved in the database file, so this only
+            # needs to be done by the writer
+            connection.execute("PRAGMA journal_mode=WAL")
+            # In WAL mode, NORMAL only syncs at checkpoints and is still
+            # safe from corruption if the bot crashes
+            connection.execute("PRAGMA synchronous=NORMAL")
+            for name, path in self._attach.items():
+                connection.execute("ATTACH DATABASE ? AS " + name, (path,))
+                connection.execute(f"PRAGMA {name}.journal_mode=WAL")
+                connection.execute(f"PRAGMA {name}.synchronous=NORMAL")
+            self._tune(connection)
+            self._connection = connection
+            self._logger.info("DB_connection:connect: opened writer connection to %s", self._dbpath)
+        return self._connection
+
+    def _connectReader(self):
+        """Returns the read-only connection of the current reader
+        thread, opening it if it does not exist yet
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # The connection is only ever used by this thread, but it is
+            # closed by whichever thread closes the manager
+            connection = self._openReadOnly(check_same_thread=False)
+            self._local.connection = connection
+            with self._lock:
+                self._readConnections.append(connection)
+            self._logger.info("DB_connection:connectReader: opened read-only connection to %s", self._dbpath)
+        return connection
+
+    def _openReadOnly(self, **kwargs):
+        """Opens a new read-only connection to the database, with
+        every attached database attached read-only as well
+        """
+        connection = sqlite3.connect(f"file:{self._dbpath}?mode=ro", uri=True, **kwargs)
+        for name, path in self._attach.items():
+            connection.execute("ATTACH DATABASE ? AS " + name, (f"file:{path}?mode=ro",))
+        self._tune(connection)
+        return connection
+
+    def _tune(self, connection):
+        """Sets the per-connection settings used by every connection"""
+        connection.execute("PRAGMA busy_timeout=5000") # wait up to 5 seconds on a locked database
+        connection.execute("PRAGMA cache_size=-16000") # about 16MB of page cache
+        connection.execute("PRAGMA mmap_size=268435456") # map up to 256MB of the file into memory
+
+    def _call(self, func, args):
+        """Runs a function with the writer connection. Used by the writer thread"""
+        return func(self._connect(), *args)
+
+    def _read(self, func, args):
+        """Runs a function with a read-only connection. Used by the reader threads"""
+        return func(self._connectReader(), *args)
+
+    def _readOnce(self, func, args):
+        """Runs a function with a new read-only connection, then closes it.
+        Used by the reader threads
+        """
+        connection = self._openReadOnly()
+        try:
+            return func(connection, *args)
+        finally:
+            connection.close()
+
+    def _transaction(self, func, args):
+        """Runs a function with the connection, then commits
+        everything it did. If the function raises, everything
+        it did is rolled back instead and the error is passed on
+        """
+        connection = self._connect()
+        try:
+            result = func(connection, *args)
+        except Exception:
+            connection.rollback()
+            raise
+        else:
+            connection.commit()
+            return result
+
+    def runBlocking(self, func, *args):
+        """Runs func(connection, *args) on the writer thread and
+        waits for it to finish. This blocks the caller, so it is only
+        meant to be used while the bot is starting up
+        """
+        return self._executor.submit(self._transaction, func, args).result()
+
+    async def _submit(self, executor, func, *args):
+        """Runs func(*args) on one of the executors and waits for it"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, func, *args)
+
+    async def _joined(self, unit, func, args):
+        """Runs func(connection, *args) on the writer as part of the given
+        unit of work. If it fails, the whole unit is marked as failed, since
+        the function may have made part of its changes already
+        """
+        try:
+            return await self._submit(self._executor, self._call, func, args)
+        except Exception:
+            unit.fail()
+            raise
+
+    def currentUnit(self):
+        """Returns the unit of work the running task is in, or None if
+        it isn't in one (or is in one that is not atomic). Tasks started
+        from inside a unit are not a part of it
+        """
+        unit = self._unit.get()
+        if unit is None or not unit.atomic or unit._task is not asyncio.current_task():
+            return None
+        return unit
+
+    @contextlib.asynccontextmanager
+    async def unitOfWork(self, atomic: bool=True):
+        """Groups every change made inside of it into one transaction:
+        
+            async with dbconn.unitOfWork() as unit:
+                ...
+        
+        The changes are committed once when the block ends, or rolled back
+        if the block raises or unit.fail() was called. While the unit is open,
+        reads go to the writer connection so they see the unit's own changes,
+        and changes made outside of the unit wait until it ends.
+        
+        A unit started inside another unit joins it, and the outer unit
+        commits for both. A unit with atomic=False opts out: changes made
+        inside of it (nested units included) commit on their own, the same
+        as with no unit at all. This is meant for admin tools which should
+        keep whatever they finished even if a later step fails, and can't be
+        used from inside an atomic unit
+        """
+        current = self.currentUnit()
+        if current is not None and not atomic:
+            # Its changes would have to wait for the open unit to end
+            raise RuntimeError("can't opt out of a unit of work from inside another one")
+        if current is not None:
+            try:
+                yield current
+            except BaseException:
+                current.fail()
+                raise
+            return
+        
+        unit = workUnit(atomic)
+        token = self._unit.set(unit)
+        try:
+            if not atomic:
+                yield unit
+            else:
+                async with self._unitLock:
+                    def begin(connection):
+                        # Anything left uncommitted before the unit started is not a part of it
+                        if connection.in_transaction:
+                            connection.commit()
+                        connection.execute("BEGIN")
+                    await self._submit(self._executor, self._call, begin, ())
+                    try:
+                        yield unit
+                    except BaseException:
+                        unit.fail()
+                        raise
+                    finally:
+                        if unit.failed:
+                            await self._submit(self._executor, self._call, lambda connection: connection.rollback(), ())
+                        else:
+                            try:
+                                await self._submit(self._executor, self._call, lambda connection: connection.commit(), ())
+                            except Exception:
+                                unit.fail()
+                                await self._submit(self._executor, self._call, lambda connection: connection.rollback(), ())
+                                raise
+        finally:
+            self._unit.reset(token)
+            for callback in unit._onEnd:
+                callback()
+        # Only reached if the unit ended without an error
+        if not unit.failed:
+            for callback in unit._onCommit:
+                await callback()
+
+    async def run(self, func, *args):
+        """Runs func(connection, *args) on the writer thread
+        and waits for it to finish without blocking the bot.
+        Nothing is committed automatically
+        """
+        unit = self.currentUnit()
+        if unit is not None:
+            return await self._joined(unit, func, args)
+        async with self._unitLock:
+            return await self._submit(self._executor, self._call, func, args)
+
+    async def transaction(self, func, *args):
+        """Works the same as run, but commits the changes made by
+        the function once it finishes, or rolls them back if it fails.
+        Inside a unit of work, the changes are committed with the unit instead
+        """
+        unit = self.currentUnit()
+        if unit is not None:
+            return await self._joined(unit, func, args)
+        async with self._unitLock:
+            return await self._submit(self._executor, self._transaction, func, args)
+
+    async def read(self, func, *args):
+        """Runs func(connection, *args) on a reader thread with a
+        read-only connection. The connection only sees committed changes,
+        so inside a unit of work the writer connection is used instead
+        """
+        if self.currentUnit() is not None:
+            return await self._submit(self._executor, self._call, func, args)
+        return await self._submit(self._readers, self._read, func, args)
+
+    async def readOnce(self, func, *args):
+        """Runs func(connection, *args) on a reader thread with a read-only
+        connection of its own, which is closed once it finishes. Read-only
+        connections can still be changed, by PRAGMAs, ATTACH or TEMP tables,
+        so anything which runs SQL the bot didn't write uses this rather than
+        the connections every other read shares
+        """
+        return await self._submit(self._readers, self._readOnce, func, args)
+
+    async def fetch(self, command: str, parameters=()):
+        """Runs a single query on a reader thread and returns every row it selected"""
+        return await self.read(lambda connection: connection.execute(command, parameters).fetchall())
+
+    async def commit(self):
+        """Commits any changes waiting on the writer connection.
+        Inside a unit of work, this is left to the unit
+        """
+        if self.currentUnit() is None:
+            await self.run(lambda connection: connection.commit())
+
+    async def rollback(self):
+        """Rolls back any changes waiting on the writer connection.
+        Inside a unit of work, the whole unit is rolled back when it ends
+        """
+        unit = self.currentUnit()
+        if unit is not None:
+            unit.fail()
+        else:
+            await self.run(lambda connection: connection.rollback())
+
+    def close(self):
+        """Closes every connection and stops the threads
+        once every request already queued has finished
+        """
+        self._readers.shutdown(wait=True)
+        with self._lock:
+            for connection in self._readConnections:
+                # The reader threads are finished, so their connections
+                # can be closed from here
+                connection.close()
+            self._readConnections = []
+
+        def close(connection):
+            connection.close()
+            self._connection = None
+        if self._connection is not None:
+            self._executor.submit(self._call, close, ())
+        self._executor.shutdown(wait=True)
+        self._logger.info("DB_connection:close: closed all connections to %s", self._dbpath)
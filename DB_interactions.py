@@ -7,64 +7,118 @@
 #===============================================================================
 
 import discord
-from discord.ext import commands
-import sqlite3
+from discord.ext import commands, tasks
 import datetime
-import dateparser
 import logging
+import time
+import asyncio
+import contextlib
+# used to see which tables the admin command console changes
+import sqlite3
+# used to build the query console's attachments
+import csv
+import gzip
+import io
+import os
+# used for the adventurer cache
+from collections import OrderedDict
+from DB_migrations import runMigrations, createArchiveLog, memberNameKey, sqlDate, QUEST_LOG_COLUMNS
+from Quest_catalog import questCatalog
+from Progression import progressionTable
+from Filter_compiler import compileFilter, seasonClause
+from Bot_logging import payload
+from DB_backup import takeBackup, listBackups, attachedName, unpackBackup, checkBackup, restoreInto, restoreAttached, rowCounts, BACKUP_DIR
 
 # member database contents:
 # -- adventurers:
 # ---- discord ID, first name, last name, discord display name, rank, experience, gold, quests completed
 # -- quests:
 # ---- number, name, description + non-rank requirements, rank, exp reward, gold reward, type
-# -- quest logs:
-# ---- quest number, quest name, rank, exp reward, gold reward, type, times completed, date of last completion
+# -- questLog (one row per member and quest):
+# ---- member ID, quest number, quest name, rank, exp reward, gold reward, type, times completed, date of last completion
 
 class db_interact(commands.Cog):
     """Handles any bot action which involves
     queries made to the database
     """
-    def __init__ (self, bot, db_path):
+    def __init__ (self, bot, dbconn, flushInterval: int=0, flushOps: int=32, archiveAfter: int=365):
         """Initializes the cog.
         Stores the parent bot and creates a logger and
         references for all local data that is used
         in methods, such as level requirements, rank requirements,
-        and the database path. Also checks to make sure the database
-        exists in the path.
+        and the shared database connection manager. Also makes sure
+        the database can be reached and its tables are up to date.
+        
+        flushInterval and flushOps set up write-behind mode, see setWriteBehind.
+        It is off unless flushInterval is given.
+        
+        If the connection manager attaches an "archive" database, quest log
+        entries last completed more than archiveAfter days ago are moved
+        into it once a day, see archiveQuestLogs
         """
         self._bot = bot
         self._logger = logging.getLogger('bot activity')
-        self._levelref = {} # level requirements
-        with open("./references/levels.txt", "r") as file:
-            file.readline()
-            levelList = file.read().split("\n")
-            for item in levelList:
-                item = item.split(" - ")
-                self._levelref[int(item[0])] = int(item[2])
-        self._rankref = {} # rank requirements
-        with open("./references/ranks.txt", "r") as file:
-            file.readline()
-            rankList = file.read().split("\n")
-            for item in rankList:
-                item = item.split(" - ")
-                self._rankref[item[0]] = item[1].split("/")
+        # level and rank requirements, compiled into lookup tables
+        self._progression = progressionTable.fromFiles()
+        # The columns of adventurers which editMemberItems is allowed to change,
+        # keyed by their lowercase name. Filled in once the database is reached
+        self._memberColumns = {}
             
-        self._dbpath = db_path
+        # Every query is run on the database threads, so
+        # the bot keeps running while it waits on the database
+        self._dbconn = dbconn
+        # Cache of recently used adventurers rows, keyed by discord ID.
+        # Every write to adventurers updates or removes the member's row,
+        # so the cache never holds an outdated row
+        self._memberCache = OrderedDict()
+        self._memberCacheSize = 256 # most rows kept at once; the oldest used row is dropped first
+        self._memberCacheVersion = 0 # increased on every write, see _cacheMember
+        self._cacheHits = 0
+        self._cacheMisses = 0
+        # In-memory copy of the quests table, used for every quest lookup.
+        # It is only replaced by loadQuests, so it never needs to be checked against the database
+        self._catalog = questCatalog()
+        # Whether the questSearch full text index can be used to search quests
+        self._questSearch = False
+        # Write-behind mode. Deferred member edits wait in the queue and are
+        # committed together, every flushInterval milliseconds or once
+        # flushOps edits are waiting, whichever comes first
+        self._flushInterval = flushInterval
+        self._flushOps = flushOps
+        self._writeQueue = [] # (member ID, SET clause, parameters, edits, time queued, onFail) of each waiting edit
+        self._queuedMembers = {} # member ID: number of their edits waiting or being committed
+        self._flushLock = asyncio.Lock() # only one flush runs at a time, so edits are committed in order
+        self._flushTask = None # the task which flushes the queue once flushInterval passes
+        self._writeStats = {"flushes": 0, "edits": 0, "failed": 0, "commitTime": 0.0, "maxCommitTime": 0.0,
+                            "flushTime": 0.0, "maxFlushTime": 0.0}
+        # Whether old quest log entries are kept in the attached archive database
+        self._archive = False
+        self._archiveAfter = archiveAfter
         try:
-            test = sqlite3.connect(db_path)
-            test.close()
+            self._dbconn.runBlocking(runMigrations)
+            # The full text index is skipped by the migrations if SQLite can't create it
+            self._questSearch = self._dbconn.runBlocking(
+                lambda connection: connection.execute("SELECT 1 FROM sqlite_master WHERE name='questSearch'").fetchone() is not None)
+            columns = self._dbconn.runBlocking(lambda connection: connection.execute("PRAGMA table_info(adventurers)").fetchall())
+            self._memberColumns = {column[1].lower(): column[1] for column in columns if column[1].lower() != "id"}
+            self._catalog = questCatalog(self._dbconn.runBlocking(lambda connection: connection.execute("SELECT * FROM quests").fetchall()), 1)
+            self._archive = self._dbconn.runBlocking(
+                lambda connection: "archive" in [row[1] for row in connection.execute("PRAGMA database_list")])
+            if self._archive:
+                self._dbconn.runBlocking(createArchiveLog, "archive")
         except Exception as e:
             self._logger.critical("DB_interactions:init:Connection Error: %s", str(e))
+        
+        self.backupTimer.start()
+        self.archiveTimer.start()
     
     @commands.Cog.listener()
     async def on_connect(self):
-        """Creates the database connection and cursor and
-        gathers a reference for the Google_interactions and
-        Member_interactions cogs for use in methods
+        """Gathers a reference for the Google_interactions and
+        Member_interactions cogs for use in methods. The database
+        connections are shared and opened once, so reconnecting
+        to discord does not open new ones
         """
-        self._connection = sqlite3.connect(self._dbpath)
-        self._cursor = self._connection.cursor()
         self._api = self._bot.get_cog("google_interact")
         self._members = self._bot.get_cog("memb_interact")
             
@@ -90,37 +144,32 @@ class db_interact(commands.Cog):
         # Gather data for the tuple
         discordName = member.name + "#" + member.discriminator
         date = datetime.date.today().strftime("%m/%d/%Y")
-        # Create the tuple to insert into adventurers, and
-        # the command which will create the user's quest log
+        # Create the tuple to insert into adventurers. Their quest log
+        # lives in the shared questLog table, so nothing else is created
         memberInfo = (discordID, first, last, discordName, alignment, date)
-        dbname = str(discordID) + "questLog" # The name of the new table
-        
-        addCommand = f"""CREATE TABLE '{dbname}' (
-                            number INTEGER,
-                            name TEXT,
-                            rank INTEGER,
-                            expReward INTEGER,
-                            goldReward INTEGER,
-                            type TEXT,
-                            timesCompleted INTEGER,
-                            dateCompleted NUMERIC
-                            )"""
             
-        try: # Try adding the adventurer
-            self._cursor.execute('INSERT INTO adventurers VALUES (?, ?, ?, ?,"-", ?, 0, 1, 0, "F", "Adventurer", "N/A", "N/A", 0, ?)',
-                        memberInfo)
-            self._cursor.execute(addCommand)
-            await self._members.updateRole(discordID, None, 'F')
-        except Exception as e: # If anything fails, rollback and quit
+        def insert(connection):
+            connection.execute('INSERT INTO adventurers VALUES (?, ?, ?, ?,"-", ?, 0, 1, 0, "F", "Adventurer", "N/A", "N/A", 0, ?)',
+                               memberInfo)
+            return self._unnamedMembers(connection, [discordID])
+            
+        try: # Try adding the adventurer. If anything fails, the unit is rolled back
+            async with self.unitOfWork():
+                unnamed = await self._dbconn.run(insert)
+                # Their role is only given once they are registered
+                await self._roleAfterCommit(discordID, None, 'F')
+        except Exception as e: # If anything fails, quit
             self._logger.error("DB_interactions:addMember:Insertion Error: %s", str(e))
-            self._connection.rollback()
+            self._uncacheMember(discordID)
             return('Something went wrong, try again later')
-        else: # If not, return a success to the user and commit
-            self._connection.commit()
+        else: # If not, the unit committed, so return a success to the user
+            self._uncacheMember(discordID)
+            if unnamed:
+                self._logger.warning("DB_interactions:addMember:Name Warning: another member already has the discord name %s, so member %s can't be found by it",
+                                     discordName, str(discordID))
             self._logger.info("DB_interactions:addMember: added values %s to adventurers",
                               str((memberInfo[0], memberInfo[1], memberInfo[2], memberInfo[3], "-",
                               memberInfo[4], 0, 1, 0, "F", "Adventurer", "N/A", "N/A", 0, memberInfo[5])))
-            self._logger.info("DB_interactions:addMember: added table %s to database", dbname)
             return(f"Congratulations, {first}! you've been registered to the quest system! "
                    + "Use this private channel to check your stats or change your profile "
                    + "in the guild's archives")
@@ -131,21 +180,26 @@ class db_interact(commands.Cog):
         if you have good reason
         """
         memberInfo = await self.fetchMember(memberId)
-        dbname = str(memberId) + "questLog"
+        
+        def delete(connection):
+            connection.execute("DELETE FROM adventurers WHERE ID=?", (memberId,))
+            connection.execute("DELETE FROM questLog WHERE memberId=?", (memberId,))
+            if self._archive:
+                connection.execute("DELETE FROM archive.questLog WHERE memberId=?", (memberId,))
         
         try:
-            self._cursor.execute("DELETE FROM adventurers WHERE ID=?", (memberId,))
-            self._cursor.execute(f"DROP TABLE '{dbname}'")
-            await self._members.updateRole(memberId, memberInfo[9], None)
+            async with self.unitOfWork():
+                await self._dbconn.run(delete)
+                await self._roleAfterCommit(memberId, memberInfo[9], None)
         except Exception as e:
             self._logger.error("DB_interactions:deleteMember:Deletion Error: %s", str(e))
-            self._connection.rollback()
+            self._uncacheMember(memberId)
         else:
+            self._uncacheMember(memberId)
             self._logger.info("DB_interactions:deleteMember: removed tuple with ID %s from adventurers", str(memberId))
-            self._logger.info("DB_interactions:deleteMember: removed table %s from database", dbname)
-            self._connection.commit()
+            self._logger.info("DB_interactions:deleteMember: removed quest log of member %s from questLog", str(memberId))
             
-    async def editMemberItems(self, memberId, edits: list):
+    async def editMemberItems(self, memberId, edits: list, deferred: bool=False, onFail=None):
         """Edits a member's record in the database. This can change any column,
         including their experience, titles, ect.
         
@@ -158,69 +212,362 @@ class db_interact(commands.Cog):
         field:newValue
         the value can be lead by a + or - to add or subtract it from
         the current value respectively
+        
+        Every edit is applied by a single UPDATE statement, so the values are
+        added in the database rather than read, changed and written back
+        
+        If deferred is True and write-behind mode is on, the edits are only
+        checked and queued, and are committed with the next flush. True then
+        means the edits were queued; if they fail when they are committed,
+        the error is logged and await onFail() is called, if given, so the
+        member who asked for them can be told. Edits made inside a unit of
+        work are never deferred
         """
-        numericFields = ["gold", "exp", "questsCompleted", "level"] # numeric and string fields are treated differently
-        try :
-            for item in edits: # for each requested edit
-                # Separate the fields and values
-                edit = item.split(":", 1)
-                field = edit[0].lower()
-                if field == "# of completed quests" or field == "quests completed":
-                    field = "questsCompleted"
-                elif field == "discordname" or field == "discord name":
-                    field = "discordName"
-                
-                value = edit[1]
-                if field in numericFields: # If it is a numeric field
-                    if value.startswith("+") or value.startswith("-"): # Check if the new value is being added/subtracted
-                        # Get old value and add the difference
-                        original = self._cursor.execute(f"SELECT {field} FROM adventurers WHERE ID=?", (memberId,)).fetchall()[0][0]
-                    
-                        value = original + int(value)
-                    elif value.startswith("'"): # If it is a literal, just remove the apostrophe
-                        value = int(value[1:])
-                    else: # otherwise, just convert the item
-                        value = int(value)
-                else: # If it is a string
-                    if value.startswith("+"): # If it's being added to the old value
-                        # Append it
-                        original = self._cursor.execute(f"SELECT {field} FROM adventurers WHERE ID=?", (memberId,)).fetchall()[0][0]
-                    
-                        value = original + ", " + value
-                    elif value.startswith("'"):
-                        value = value[1:]
+        def edit(connection):
+            # A single statement applies every edit and returns the updated row,
+            # so it can be written to the cache
+            rows = connection.execute(f"UPDATE adventurers SET {assignments} WHERE ID=? RETURNING *", parameters + [memberId]).fetchall()
+            if rows == []:
+                raise LookupError(f"no member with ID {memberId}")
+            return rows
                 
-                self._cursor.execute(f"UPDATE adventurers SET {field}=? WHERE ID=?", (value, memberId))
+        try :
+            assignments, parameters = self._compileEdits(edits)
+        except Exception as e:
+            self._logger.error("DB_interactions:editMemberItems:Edit Error: %s in %s", str(e), str(edits))
+            return False
+        if assignments == "": # There is nothing to change
+            return True
+        
+        if self._dbconn.currentUnit() is None:
+            if deferred and self._flushInterval > 0:
+                await self._queueEdit(memberId, assignments, parameters, edits, onFail)
+                return True
+            # Any edits of the member still waiting in the queue were made first
+            await self._showWrites(memberId)
+        try:
+            rows = await self._dbconn.transaction(edit)
         # If any of the edits fails, the bot aborts all edits which would be done.
         # You can edit it to still change other edits, but I do not recommend it
         except Exception as e:
             self._logger.error("DB_interactions:editMemberItems:Update Error: %s", str(e))
-            self._connection.rollback()
             return False
         else:
-            self._logger.info("DB_interactions:editMemberItems: edited tuple with ID %s with values %s", str(memberId), str(edits))
-            self._connection.commit()
+            self._memberWritten(memberId, rows[0])
+            self._logger.info("DB_interactions:editMemberItems: edited tuple with ID %s with values %s", memberId, payload(edits))
             return True
+    
+    async def _queueEdit(self, memberId, assignments: str, parameters: list, edits: list, onFail=None):
+        """Adds a member edit to the write-behind queue, and flushes the
+        queue once it holds flushOps edits. The first edit added to an
+        empty queue starts the timer which flushes it
+        """
+        self._writeQueue.append((int(memberId), assignments, parameters, edits, time.perf_counter(), onFail))
+        self._queuedMembers[int(memberId)] = self._queuedMembers.get(int(memberId), 0) + 1
+        self._logger.info("DB_interactions:queueEdit: queued edit of member %s with values %s", memberId, payload(edits))
+        if len(self._writeQueue) >= self._flushOps:
+            await self.flushWrites()
+        elif self._flushTask is None:
+            self._flushTask = asyncio.create_task(self._flushLater())
+    
+    async def _flushLater(self):
+        """Flushes the write-behind queue once flushInterval milliseconds
+        have passed. Cancelled if the queue is flushed before then
+        """
+        await asyncio.sleep(self._flushInterval / 1000)
+        # The flush has started, so it must not be cancelled part way through
+        self._flushTask = None
+        await self.flushWrites()
+    
+    async def _showWrites(self, memberId=None):
+        """Flushes the write-behind queue if it holds edits of the given
+        member, or any edits if no member is given, so a read made after
+        queueing an edit sees it. Inside a unit of work nothing is flushed,
+        since the queued edits would be committed or rolled back with the
+        unit; the queue is always flushed before a unit starts
+        """
+        if self._dbconn.currentUnit() is not None:
+            return
+        if (memberId is None and self._queuedMembers != {}) or int(memberId or 0) in self._queuedMembers:
+            await self.flushWrites()
+    
+    async def flushWrites(self):
+        """Commits every edit in the write-behind queue in a single transaction.
+        Each edit gets a savepoint, so one which fails is undone by itself
+        without affecting the others. The onFail callback of each edit which
+        failed is awaited once the flush is finished
+        """
+        failed = [] # onFail callbacks of the edits which failed
+        async with self._flushLock:
+            if self._flushTask is not None:
+                self._flushTask.cancel()
+                self._flushTask = None
+            batch, self._writeQueue = self._writeQueue, []
+            if batch == []:
+                return
+            start = time.perf_counter()
+            try:
+                results = await self._dbconn.transaction(self._applyEdits, batch)
+            except Exception as e:
+                self._logger.error("DB_interactions:flushWrites:Update Error: %s in %s queued edit(s)", str(e), str(len(batch)))
+                results = [e] * len(batch)
+            end = time.perf_counter()
+            
+            for (memberId, assignments, parameters, edits, queued, onFail), result in zip(batch, results):
+                self._queuedMembers[memberId] -= 1
+                if self._queuedMembers[memberId] == 0:
+                    del self._queuedMembers[memberId]
+                if isinstance(result, Exception):
+                    self._writeStats["failed"] += 1
+                    self._uncacheMember(memberId)
+                    self._logger.error("DB_interactions:flushWrites:Update Error: %s from queued edit of member %s: %s", str(result), memberId, str(edits))
+                    if onFail is not None:
+                        failed.append((memberId, onFail))
+                else:
+                    self._memberWritten(memberId, result)
+            self._recordFlush(len(batch), end - start, end - batch[0][4])
+        
+        # The members are told outside of the lock, so the next flush never waits on discord
+        for memberId, onFail in failed:
+            try:
+                await onFail()
+            except Exception as e:
+                self._logger.error("DB_interactions:flushWrites:Notice Error: %s telling member %s their edit failed", str(e), memberId)
+    
+    def _applyEdits(self, connection, batch):
+        """Applies a batch of queued member edits on the writer connection.
+        Returns the updated row of each edit, or the error it raised
+        """
+        results = []
+        for memberId, assignments, parameters, edits, queued, onFail in batch:
+            connection.execute("SAVEPOINT queuedEdit")
+            try:
+                rows = connection.execute(f"UPDATE adventurers SET {assignments} WHERE ID=? RETURNING *", parameters + [memberId]).fetchall()
+                if rows == []:
+                    raise LookupError(f"no member with ID {memberId}")
+            except Exception as e:
+                connection.execute("ROLLBACK TO queuedEdit")
+                results.append(e)
+            else:
+                results.append(rows[0])
+            connection.execute("RELEASE queuedEdit")
+        return results
+    
+    def _recordFlush(self, edits: int, commitTime: float, flushTime: float):
+        """Adds a flush to the write-behind stats. commitTime is how long the
+        transaction took, and flushTime how long the oldest edit in it waited
+        from being queued to being committed, both in seconds
+        """
+        stats = self._writeStats
+        stats["flushes"] += 1
+        stats["edits"] += edits
+        stats["commitTime"] += commitTime
+        stats["maxCommitTime"] = max(stats["maxCommitTime"], commitTime)
+        stats["flushTime"] += flushTime
+        stats["maxFlushTime"] = max(stats["maxFlushTime"], flushTime)
+        self._logger.info("DB_interactions:flushWrites: committed %s queued edit(s) in %.1f ms, the oldest waited %.1f ms",
+                          str(edits), commitTime * 1000, flushTime * 1000)
+    
+    def flushWritesBlocking(self):
+        """Commits anything left in the write-behind queue without the event
+        loop. Used once the bot has shut down, before the database is closed.
+        Discord can't be reached by then, so failed edits are only logged
+        """
+        # The bot cancels its tasks as it shuts down, so a flush still
+        # waiting to run never will. This flush takes its place
+        if self._flushTask is not None:
+            if not self._flushTask.done():
+                self._flushTask.cancel()
+            self._flushTask = None
+        batch, self._writeQueue = self._writeQueue, []
+        self._queuedMembers = {}
+        if batch == []:
+            return
+        start = time.perf_counter()
+        results = self._dbconn.runBlocking(self._applyEdits, batch)
+        end = time.perf_counter()
+        for (memberId, assignments, parameters, edits, queued, onFail), result in zip(batch, results):
+            if isinstance(result, Exception):
+                self._writeStats["failed"] += 1
+                self._logger.error("DB_interactions:flushWritesBlocking:Update Error: %s from queued edit of member %s: %s", str(result), memberId, str(edits))
+        self._recordFlush(len(batch), end - start, end - batch[0][4])
+    
+    async def setWriteBehind(self, flushInterval: int, flushOps: int=32):
+        """Turns write-behind mode on or off. While it is on, deferred member
+        edits are committed together every flushInterval milliseconds, or as
+        soon as flushOps of them are waiting. A flushInterval of 0 turns it
+        off, and anything still waiting is committed right away
+        """
+        self._flushInterval = max(flushInterval, 0)
+        self._flushOps = max(flushOps, 1)
+        if self._flushInterval == 0:
+            await self.flushWrites()
+        self._logger.warning("DB_interactions:setWriteBehind: flush interval set to %s ms, flushing at %s edits", str(self._flushInterval), str(self._flushOps))
+    
+    def writeStats(self):
+        """Returns the write-behind settings, the number of flushes and edits
+        committed, and the average and longest commit and flush times in milliseconds
+        """
+        stats = self._writeStats
+        flushes = max(stats["flushes"], 1)
+        return {"interval": self._flushInterval, "ops": self._flushOps, "waiting": len(self._writeQueue),
+                "flushes": stats["flushes"], "edits": stats["edits"], "failed": stats["failed"],
+                "commitTime": round(stats["commitTime"] / flushes * 1000, 1), "maxCommitTime": round(stats["maxCommitTime"] * 1000, 1),
+                "flushTime": round(stats["flushTime"] / flushes * 1000, 1), "maxFlushTime": round(stats["maxFlushTime"] * 1000, 1)}
+    
+    @contextlib.asynccontextmanager
+    async def unitOfWork(self, atomic: bool=True):
+        """Groups every change made inside of it into a single commit:
+        
+            async with self.unitOfWork() as unit:
+                ...
+        
+        Methods like editMemberItems and checkMemberLevel join the unit
+        they are called in instead of committing on their own, so a logical
+        operation such as submitting a quest is committed once, or not at all.
+        Call unit.fail() to roll the unit back without raising.
+        
+        Admin tools pass atomic=False to opt out, so each change they make
+        is committed as soon as it finishes. The write-behind queue is
+        flushed before a new unit starts, so it never holds edits made
+        before the unit
+        """
+        if self._dbconn.currentUnit() is None:
+            await self.flushWrites()
+        async with self._dbconn.unitOfWork(atomic) as unit:
+            yield unit
+    
+    async def _afterCommit(self, callback):
+        """Runs await callback() once the current unit of work commits,
+        or right away if there is no unit. Used for anything which
+        can't be taken back, like messages and roles
+        """
+        unit = self._dbconn.currentUnit()
+        if unit is None:
+            await callback()
+        else:
+            unit.onCommit(callback)
+    
+    async def _roleAfterCommit(self, memberId, oldRole, newRole):
+        """Changes a member's rank role in the server once the current unit
+        of work commits. Nothing waits on discord while the unit is open, and
+        the change in the database stands even if the role can't be changed,
+        so that is logged rather than raised
+        """
+        async def change():
+            try:
+                await self._members.updateRole(memberId, oldRole, newRole)
+            except Exception as e:
+                self._logger.error("DB_interactions:roleAfterCommit:Role Error: %s changing the role of member %s from %s to %s",
+                                   str(e), str(memberId), oldRole, newRole)
+        await self._afterCommit(change)
+    
+    def _memberWritten(self, memberId, row):
+        """Updates the cache after a member's row was written. Any read which
+        started before the write is now outdated, so the version is increased
+        before caching the new row.
+        
+        Inside a unit of work the row isn't committed yet and could still be
+        rolled back, so it is not cached; the member is removed from the cache
+        again once the unit ends in case an outdated row was read in between
+        """
+        self._uncacheMember(memberId)
+        unit = self._dbconn.currentUnit()
+        if unit is None:
+            self._cacheMember(memberId, row, self._memberCacheVersion)
+        else:
+            unit.onEnd(lambda: self._uncacheMember(memberId))
+    
+    def _compileEdits(self, edits: list):
+        """Turns a list of "field:value" edits into the SET clause of a single
+        UPDATE statement and the parameters it uses. Only columns of the
+        adventurers table can be edited, and never the ID.
+        
+        Edits to the same field are combined in the order they are given, so
+        ["exp:+5", "exp:+10"] becomes exp=exp+? with 15 as the parameter
+        """
+        numericFields = ("gold", "exp", "questscompleted", "level") # numeric and string fields are treated differently
+        changes = {} # the combined change of each column, as [kind, value]
+        for item in edits: # for each requested edit
+            # Separate the fields and values
+            edit = item.split(":", 1)
+            field = edit[0].lower()
+            if field == "# of completed quests" or field == "quests completed":
+                field = "questscompleted"
+            elif field == "discord name":
+                field = "discordname"
+            # Only real columns can be edited, which keeps the column names safe to put into the statement
+            if field not in self._memberColumns:
+                raise ValueError(f"{edit[0]} is not an editable field")
+            column = self._memberColumns[field]
+            change = changes.get(column)
+            
+            value = edit[1]
+            if field in numericFields: # If it is a numeric field
+                if value.startswith("+") or value.startswith("-"): # Check if the new value is being added/subtracted
+                    if change is None:
+                        change = ["add", int(value)]
+                    else: # set and add both just add on to the previous change's value
+                        change[1] = change[1] + int(value)
+                elif value.startswith("'"): # If it is a literal, just remove the apostrophe
+                    change = ["set", int(value[1:])]
+                else: # otherwise, just convert the item
+                    change = ["set", int(value)]
+            else: # If it is a string
+                if value.startswith("+"): # If it's being added to the old value
+                    if change is None:
+                        change = ["append", ", " + value[1:]]
+                    else:
+                        change[1] = change[1] + ", " + value[1:]
+                elif value.startswith("'"):
+                    change = ["set", value[1:]]
+                else:
+                    change = ["set", value]
+            changes[column] = change
+        
+        assignments = []
+        parameters = []
+        for column, (kind, value) in changes.items():
+            if kind == "add":
+                assignments.append(f"{column}={column}+?")
+            elif kind == "append":
+                assignments.append(f"{column}={column}||?")
+            else:
+                assignments.append(f"{column}=?")
+            parameters.append(value)
+        return ", ".join(assignments), parameters
         
     async def questSubmit(self, memberID, questNumber, date):
         """Adds a quest to a member's quest log and edits
         their tuple in the adventurers table to award the
         exp and gold from the given quest. It also
         runs the checkMemberLevel method to update their
-        level and rank automatically
+        level and rank automatically.
+        
+        Everything is done in one unit of work, so the reward,
+        the log entry and the new level are committed together.
+        Returns True only if the unit was committed
         """
         quest = await self.fetchQuest(questNumber) # The quest details
         # If the quest is not found, log and quit
         if quest == "none found" or quest == "error":
             self._logger.warning("DB_interactions:questSubmit:Quit Warning: Could not find quest number %s in database", str(questNumber))
             return False
+        async with self.unitOfWork() as unit:
+            submitted = await self._questSubmit(unit, memberID, quest, date)
+        # A failed level check rolls back the whole unit, reward included
+        if submitted and unit.failed:
+            self._logger.warning("DB_interactions:questSubmit:Quit Warning: quest number %s for member %s was rolled back", str(quest[0]), str(memberID))
+        return submitted and not unit.failed
+    
+    async def _questSubmit(self, unit, memberID, quest, date):
+        """The part of questSubmit which runs inside its unit of work"""
         member = await self.fetchMember(memberID) # The member's info
         # If the member is not found, log and quit
         if member == "none found" or member == "error":
             self._logger.warning("DB_interactions:questSubmit:Quit Warning: Could not find member with ID %s in database", str(memberID))
             return False
         
-        dbname = str(memberID) + "questLog"
         reward = [f"exp:+{quest[4]}", f"gold:+{quest[5]}", "quests completed:+1"] # Made to be used by the editMemberItems method
         # If the member has the quest registered, automatically remove it
         if member[11] == quest[0]:
@@ -228,38 +575,43 @@ class db_interact(commands.Cog):
         elif member[12] == quest[0]:
             reward.append("currentHeroicQuest:'N/A")
         
+        def log(connection):
+            # Add the quest to the member's log. If they have already
+            # completed it before, update the times completed instead
+            connection.execute(f"""INSERT INTO questLog (memberId, {QUEST_LOG_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?)
+                                   ON CONFLICT (memberId, number) DO UPDATE
+                                   SET timesCompleted=timesCompleted + 1, dateCompleted=excluded.dateCompleted""",
+                               (memberID, quest[0], quest[1], quest[3], quest[4], quest[5], quest[6], date))
+        
+        # Send the edit request and quit if it did not finish
+        complete = await self.editMemberItems(memberID, reward)
+        if not complete:
+            self._logger.warning("DB_interactions:questSubmit:Quit Warning: Could not submit reward edits: %s", str(reward))
+            unit.fail()
+            return False
+        
         try:
-            # Send the edit request and quit if it did not finish
-            complete = await self.editMemberItems(memberID, reward)
-            if not complete:
-                self._logger.warning("DB_interactions:questSubmit:Quit Warning: Could not submit reward edits: %s", str(reward))
-                return False
-            # See if the user has already completed the quest before
-            errorType = "Selection"
-            present = self._cursor.execute(f"SELECT * FROM '{dbname}' WHERE number=?", (quest[0],)).fetchall()
-            if present != []: # If they have, update the times completed
-                present = present[0]
-                errorType = "Update"
-                self._cursor.execute(f"UPDATE '{dbname}' SET timesCompleted=?, dateCompleted=? WHERE number=?", (present[4] + 1, date, quest[0]))
-            else: # If not, insert the quest into the table
-                errorType = "Insertion"
-                self._cursor.execute(f"INSERT INTO '{dbname}' VALUES (?,?,?,?,?,?, ?, ?)", (quest[0], quest[1], quest[3], quest[4], quest[5], quest[6], 1, date))
-                
-        except Exception as e: # If an error occurs, rollback and quit
-            self._logger.error("DB_interactions:questSubmit:%s Error: %s", errorType, str(e))
-            self._connection.rollback()
+            await self._dbconn.transaction(log)
+        except Exception as e: # If an error occurs, the reward and log changes are rolled back
+            self._logger.error("DB_interactions:questSubmit:Log Error: %s", str(e))
+            unit.fail()
             return False
         
-        else: # If not, commit and check the member's level/rank
-            self._logger.info("DB_interactions:questSubmit: Updated table %s with quest number %s", dbname, str(questNumber))
-            self._connection.commit()
+        else: # If not, check the member's level/rank
+            self._logger.info("DB_interactions:questSubmit: Updated quest log of member %s with quest number %s", str(memberID), str(quest[0]))
             await self.checkMemberLevel(memberID)
             return True
         
     async def checkMemberLevel(self, memberID):
         """This method ensures the member's level and rank
-        match the member's current experience.
+        match the member's current experience. Inside a unit of
+        work, the member is congratulated once the unit commits
         """
+        async with self.unitOfWork():
+            await self._checkMemberLevel(memberID)
+    
+    async def _checkMemberLevel(self, memberID):
+        """The part of checkMemberLevel which runs inside its unit of work"""
         # Fetch the member's info and ensure they exist
         member = await self.fetchMember(memberID)
         if member == "none found" or member == "error":
@@ -272,61 +624,208 @@ class db_interact(commands.Cog):
         edits = []
         
         # Level Check
-        for level, exp in self._levelref.items():
-            # Look for a level which is either 1 over the max level
-            # or has an exp requirement above the member's exp
-            if memberExp < exp or exp < 0:
-                if memberLevel != level - 1: # If the member is not the level
-                    edits.append("level:" + str(level - 1))
-                    number = ((level - 1) // 10) - (memberLevel // 10) # Figure out how many 10s are between the two
-                    if number > 0:
-                        await self._members.sendCongratMessage(member, "class", number)
-                    memberLevel = int(level - 1)
-                    
-                break
+        # Find the highest level whose exp requirement the member meets
+        level = self._progression.levelFor(memberExp)
+        if memberLevel != level: # If the member is not the level
+            edits.append("level:" + str(level))
                 
         # Rank Check
-        for rank, levels in self._rankref.items():
-            # Look for a rank where the member's current level is between the
-            # level caps of the rank
-            if memberLevel >= int(levels[0]) and memberLevel <= int(levels[1]):
-                if memberRank != rank:
-                    edits.append("rank:" + rank)
-                    await self._members.updateRole(memberID, memberRank, rank) # Update the member's role in the server
-                    await self._members.sendCongratMessage(member, "rank", rank)
-                    
-                break
-            
+        # Find the rank whose level caps the member's new level is between
+        rank = self._progression.rankFor(level)
+        if rank is not None and memberRank != rank:
+            edits.append("rank:" + rank)
+        
+        await self._afterCommit(lambda: self._announceProgress(member, level, rank))
+        memberLevel = level
+        if rank is not None:
+            memberRank = rank
+        
+        if edits == []: # Nothing changed, so there is nothing to save
+            return
         complete = await self.editMemberItems(memberID, edits)
         if not complete:
-            self._logger.warning("DB_interactions:checkMemberLevel:Quit Warning: Could not update member ID %s with new level/rank: %s", edits)
+            self._logger.warning("DB_interactions:checkMemberLevel:Quit Warning: Could not update member ID %s with new level/rank: %s", str(memberID), str(edits))
         else:
             self._logger.info("DB_interactions:checkMemberLevel: Updated member ID %s with level %s and rank %s", str(memberID), str(memberLevel), memberRank)
             
+    async def _announceProgress(self, member, level, rank):
+        """Congratulates a member on any class promotions or rank up
+        between their row in the database and their new level and rank,
+        and updates their rank role in the server
+        """
+        number = (level // 10) - (member[7] // 10) # Figure out how many 10s are between the two
+        if number > 0:
+            await self._members.sendCongratMessage(member, "class", number)
+        if rank is not None and member[9] != rank:
+            await self._members.updateRole(member[0], member[9], rank) # Update the member's role in the server
+            await self._members.sendCongratMessage(member, "rank", rank)
+    
+    async def questSubmitBatch(self, submissions: list):
+        """Processes a list of approved quest submissions from the
+        "Pending Quests submits" sheet all at once. Each submission is a
+        row of the sheet, which holds the member's ID at index 0, the quest
+        number at index 3 and the date completed at index 9.
+        
+        Every reward and quest log entry is written in a single transaction,
+        and each affected member's level and rank are checked once at the end.
+        A submission which fails is undone by itself without affecting the
+        others. Returns the list of submissions which failed
+        """
+        failed = [] # submissions which could not be processed
+        work = [] # (submission, member ID, quest, date) for each valid submission
+        for submission in submissions:
+            try:
+                memberID = int(submission[0])
+                quest = self._catalog.get(submission[3])
+                date = submission[9]
+            except Exception as e:
+                self._logger.warning("DB_interactions:questSubmitBatch:Quit Warning: Could not read submission %s: %s", str(submission), str(e))
+                failed.append(submission)
+                continue
+            if quest is None:
+                self._logger.warning("DB_interactions:questSubmitBatch:Quit Warning: Could not find quest number %s in database", str(submission[3]))
+                failed.append(submission)
+                continue
+            work.append((submission, memberID, quest, date))
+        
+        def submit(connection):
+            # Everything below is one transaction; each submission
+            # gets a savepoint so it can be undone by itself
+            if not connection.in_transaction:
+                connection.execute("BEGIN")
+            errors = []
+            members = {} # member ID: [row before the level check, row after]
+            for submission, memberID, quest, date in work:
+                connection.execute("SAVEPOINT submission")
+                try:
+                    # Award the exp and gold, and remove the quest from the
+                    # member's active quests if they had it registered
+                    rows = connection.execute("""UPDATE adventurers SET exp=exp+?, gold=gold+?, questsCompleted=questsCompleted+1,
+                                                 currentRankedQuest=CASE WHEN currentRankedQuest=? THEN 'N/A' ELSE currentRankedQuest END,
+                                                 currentHeroicQuest=CASE WHEN currentRankedQuest!=? AND currentHeroicQuest=? THEN 'N/A' ELSE currentHeroicQuest END
+                                                 WHERE ID=? RETURNING *""",
+                                              (quest[4], quest[5], str(quest[0]), str(quest[0]), str(quest[0]), memberID)).fetchall()
+                    if rows == []:
+                        raise LookupError(f"no member with ID {memberID}")
+                    connection.execute(f"""INSERT INTO questLog (memberId, {QUEST_LOG_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?)
+                                           ON CONFLICT (memberId, number) DO UPDATE
+                                           SET timesCompleted=timesCompleted + 1, dateCompleted=excluded.dateCompleted""",
+                                       (memberID, quest[0], quest[1], quest[3], quest[4], quest[5], quest[6], date))
+                except Exception as e:
+                    connection.execute("ROLLBACK TO submission")
+                    errors.append((submission, str(e)))
+                else:
+                    members[memberID] = [rows[0], rows[0]]
+                connection.execute("RELEASE submission")
+            
+            # Check the level and rank of each member once
+            for memberID, member in members.items():
+                level = self._progression.levelFor(member[1][6])
+                rank = self._progression.rankFor(level)
+                if rank is None:
+                    rank = member[1][9]
+                if level != member[1][7] or rank != member[1][9]:
+                    member[1] = connection.execute("UPDATE adventurers SET level=?, rank=? WHERE ID=? RETURNING *",
+                                                   (level, rank, memberID)).fetchall()[0]
+            return errors, members
+        
+        if work != []:
+            # The rewards are added to whatever the members' rows hold once the queue is committed
+            await self._showWrites()
+            try:
+                errors, members = await self._dbconn.transaction(submit)
+            except Exception as e:
+                self._logger.error("DB_interactions:questSubmitBatch:Submission Error: %s", str(e))
+                return failed + [item[0] for item in work]
+            
+            for submission, error in errors:
+                self._logger.warning("DB_interactions:questSubmitBatch:Quit Warning: Could not submit %s: %s", str(submission), error)
+                failed.append(submission)
+            for memberID, (before, after) in members.items():
+                self._memberWritten(memberID, after)
+                await self._afterCommit(lambda before=before, after=after: self._announceProgress(before, after[7], after[9]))
+            self._logger.info("DB_interactions:questSubmitBatch: submitted %s quest(s) for %s member(s), %s failed",
+                              str(len(work) - len(errors)), str(len(members)), str(len(failed)))
+        return failed
+    
     async def fetchMember(self, memberID) :
-        """Retrieves a single member from the database based on their ID"""
+        """Retrieves a single member from the database based on their ID.
+        Recently used members are kept in the cache, so they are returned
+        without querying the database
+        """
+        await self._showWrites(memberID)
+        memberInfo = self._memberCache.get(int(memberID))
+        if memberInfo is not None: # If the member is cached, mark them as recently used and return them
+            self._memberCache.move_to_end(int(memberID))
+            self._cacheHits += 1
+            self._logger.info("DB_interactions:fetchMember: gathered member with ID %s from cache: %s", memberID, payload(memberInfo))
+            return(memberInfo)
+        
+        self._cacheMisses += 1
+        version = self._memberCacheVersion
         try :
-            memberInfo = self._cursor.execute("SELECT * FROM adventurers WHERE ID=?", (memberID,)).fetchall()
+            memberInfo = await self._dbconn.fetch("SELECT * FROM adventurers WHERE ID=?", (memberID,))
             if memberInfo == []: # If no member is found, update accordingly
                 memberInfo = "none found"
-            else: # Else, grab the info from the returned list
+            else: # Else, grab the info from the returned list and cache it
                 memberInfo = memberInfo[0]
+                # Inside a unit of work the row may hold changes which aren't committed yet
+                if self._dbconn.currentUnit() is None:
+                    self._cacheMember(memberID, memberInfo, version)
         except Exception as e:
             self._logger.error("DB_interactions:fetchMember:Selection Error: %s", str(e))
             return("error")
         else :
-            self._logger.info("DB_interactions:fetchMember: gathered member with ID %s from adventurers: %s", str(memberID), str(memberInfo))
+            self._logger.info("DB_interactions:fetchMember: gathered member with ID %s from adventurers: %s", memberID, payload(memberInfo))
             return(memberInfo)
+    
+    def _cacheMember(self, memberID, memberInfo, version):
+        """Stores a member's row in the cache, dropping the least recently
+        used row if the cache is full.
+        
+        version is the value of _memberCacheVersion from before the row was
+        read. If any write happened since then, the row may already be
+        outdated, so it is not cached
+        """
+        if version != self._memberCacheVersion:
+            return
+        self._memberCache[int(memberID)] = memberInfo
+        self._memberCache.move_to_end(int(memberID))
+        if len(self._memberCache) > self._memberCacheSize:
+            self._memberCache.popitem(last=False)
+    
+    def _uncacheMember(self, memberID=None):
+        """Removes a member's row from the cache around a write.
+        If no member is given, the whole cache is cleared
+        """
+        self._memberCacheVersion += 1
+        if memberID is None:
+            self._memberCache.clear()
+        else:
+            self._memberCache.pop(int(memberID), None)
+    
+    def cacheStats(self):
+        """Returns the hit and miss counts of the adventurer cache,
+        along with how many rows it is currently holding
+        """
+        return {"hits": self._cacheHits, "misses": self._cacheMisses,
+                "size": len(self._memberCache), "maxSize": self._memberCacheSize}
         
     async def fetchMemberName(self, memberName):
         """Retrieves a single member from the database based on their
-        discord username. Since this is inherently a much looser identification method
-        than using their ID, there is an extra check than what is present in fetchMember.
-        Besides that, this method works the same as the one above
+        discord username, or a name they used to have. Names are matched
+        without case, through the memberNames and memberAliases indexes.
+        Besides that, this method works the same as fetchMember.
+        To look up many names at once, use fetchMemberNames instead
         """
+        await self._showWrites()
         try:
-            memberInfo = self._cursor.execute("SELECT * FROM adventurers WHERE discordName LIKE ?", ("%" + memberName + "%",)).fetchall()
-            if memberInfo == [] or len(memberInfo) > 1: # If there is any number of members other than 1 returned
+            key = memberNameKey(memberName)
+            memberInfo = await self._dbconn.fetch("""SELECT * FROM adventurers WHERE ID=(
+                                                         SELECT memberId FROM memberNames WHERE nameKey=?
+                                                         UNION ALL SELECT memberId FROM memberAliases WHERE nameKey=?
+                                                         LIMIT 1)""", (key, key))
+            if memberInfo == []:
                 memberInfo = "none found"
             else:
                 memberInfo = memberInfo[0]
@@ -334,199 +833,579 @@ class db_interact(commands.Cog):
             self._logger.error("DB_interactions:fetchMemberName:Selection Error: %s", str(e))
             return("error")
         else:
-            self._logger.info("DB_interactions:fetchMemberName: gathered member with name %s from adventurers: %s", str(memberName), str(memberInfo))
+            self._logger.info("DB_interactions:fetchMemberName: gathered member with name %s from adventurers: %s", memberName, payload(memberInfo))
             return(memberInfo)
+    
+    async def fetchMemberNames(self):
+        """Returns a dictionary of every normalised discord name (see
+        DB_migrations.memberNameKey) paired with the ID of its member, built
+        with one query. Current names take priority over old names, and
+        "name#0000" names can also be found by just "name" if no other
+        member shares it. Used to find the members of many submissions at once
+        """
+        try:
+            rows = await self._dbconn.fetch("""SELECT nameKey, memberId FROM memberNames WHERE nameKey IS NOT NULL
+                                               UNION ALL SELECT nameKey, memberId FROM memberAliases""")
+        except Exception as e:
+            self._logger.error("DB_interactions:fetchMemberNames:Selection Error: %s", str(e))
+            return("error")
+        
+        names = {}
+        for key, memberId in rows: # current names come first, so old names never replace them
+            names.setdefault(key, memberId)
+        # Names without their discriminator, kept only if they point to one member
+        shortNames = {}
+        for key, memberId in names.items():
+            if "#" in key:
+                shortNames.setdefault(key[:key.rindex("#")], set()).add(memberId)
+        for key, members in shortNames.items():
+            if len(members) == 1 and key not in names:
+                names[key] = members.pop()
+        self._logger.info("DB_interactions:fetchMemberNames: gathered %s name(s) for %s member(s)", str(len(names)), str(len(set(names.values()))))
+        return names
          
-    async def loadQuests(self, quests):
+    async def fetchDiscordNames(self):
+        """Returns a dictionary of every member's ID paired with
+        the discord name stored for them, read with one query
+        """
+        await self._showWrites()
+        try:
+            rows = await self._dbconn.fetch(f"SELECT ID, {self._memberColumns['discordname']} FROM adventurers")
+        except Exception as e:
+            self._logger.error("DB_interactions:fetchDiscordNames:Selection Error: %s", str(e))
+            return("error")
+        return dict(rows)
+    
+    async def updateDiscordNames(self, names: dict):
+        """Sets the discord name of each member in names, a dictionary of
+        member IDs paired with their new name. Every name is written by a
+        single executemany in one transaction. Returns False if they could
+        not be written
+        """
+        if not names:
+            return True
+        await self._showWrites()
+        try:
+            column = self._memberColumns["discordname"]
+            def update(connection):
+                connection.executemany(f"UPDATE adventurers SET {column}=? WHERE ID=?", [(name, memberId) for memberId, name in names.items()])
+                return self._unnamedMembers(connection, names)
+            unnamed = await self._dbconn.transaction(update)
+        except Exception as e:
+            self._logger.error("DB_interactions:updateDiscordNames:Update Error: %s", str(e))
+            return False
+        unit = self._dbconn.currentUnit()
+        for memberId in names:
+            self._uncacheMember(memberId)
+            if unit is not None:
+                unit.onEnd(lambda memberId=memberId: self._uncacheMember(memberId))
+        self._logger.info("DB_interactions:updateDiscordNames: changed the discord names of %s member(s)\n%s", str(len(names)), payload(names))
+        if unnamed:
+            self._logger.warning("DB_interactions:updateDiscordNames:Name Warning: other members already have the discord names of %s member(s), so they can't be found by them: %s",
+                                 str(len(unnamed)), str({memberId: names[memberId] for memberId in unnamed}))
+        return True
+    
+    def _unnamedMembers(self, connection, memberIds):
+        """Returns which of the given members have no current name in
+        memberNames, since another member already holds their discord name.
+        The name triggers never take a name from the member who holds it
+        """
+        rows = connection.execute("SELECT ID FROM adventurers WHERE ID NOT IN (SELECT memberId FROM memberNames)").fetchall()
+        return [memberId for (memberId,) in rows if memberId in memberIds]
+    
+    async def fetchMemberChanges(self):
+        """Returns the members changed since the Members sheet last received
+        them, from the memberChanges log, as a tuple of the last change read
+        and a dictionary of each changed member's ID paired with their row,
+        or None if they were deleted. The dictionary is None instead if every
+        member has to be written again. Once the sheet has the changes, pass
+        the last change to clearMemberChanges
+        """
+        await self._showWrites()
+        def changes(connection):
+            lastChange, full = connection.execute("SELECT ifnull(max(change), 0), count(*) - count(memberId) FROM memberChanges").fetchone()
+            if full > 0:
+                return lastChange, None
+            # Changes made after the log was read are left for next time
+            rows = connection.execute("""SELECT changed.memberId, adventurers.* FROM
+                                         (SELECT DISTINCT memberId FROM memberChanges WHERE change<=?) AS changed
+                                         LEFT JOIN adventurers ON adventurers.ID=changed.memberId""", (lastChange,)).fetchall()
+            return lastChange, {row[0]: (row[1:] if row[1] is not None else None) for row in rows}
+        
         try:
-            errorType = "Deletion"
-            self._cursor.execute("DELETE FROM quests")
+            lastChange, members = await self._dbconn.read(changes)
+        except Exception as e:
+            self._logger.error("DB_interactions:fetchMemberChanges:Selection Error: %s", str(e))
+            return("error")
+        self._logger.info("DB_interactions:fetchMemberChanges: gathered changes up to %s for %s", str(lastChange),
+                          "every member" if members is None else str(len(members)) + " member(s)")
+        return lastChange, members
+    
+    async def clearMemberChanges(self, lastChange: int):
+        """Deletes the memberChanges log up to the given change,
+        once the Members sheet has received them
+        """
+        try:
+            await self._dbconn.transaction(lambda connection: connection.execute("DELETE FROM memberChanges WHERE change<=?", (lastChange,)))
+        except Exception as e:
+            self._logger.error("DB_interactions:clearMemberChanges:Deletion Error: %s", str(e))
+            return False
+        return True
+         
+    async def loadQuests(self, quests):
+        """Makes the quests table match the given list of quest tuples.
+        Only the quests which were added, changed or removed are written,
+        all in one transaction, and the quest catalog and search index are
+        only rebuilt if something changed.
+        
+        Returns a dictionary with the number of quests "inserted", "updated"
+        and "deleted", or False if the quests could not be loaded
+        """
+        def load(connection):
+            columns = [column[1] for column in connection.execute("PRAGMA table_info(quests)").fetchall()]
+            # The new list is loaded into a temporary copy of quests first, so its values
+            # are converted the same way as the table's and can be compared directly
+            connection.execute("DROP TABLE IF EXISTS temp.questLoad")
+            connection.execute("CREATE TEMP TABLE questLoad AS SELECT * FROM quests WHERE 0")
+            connection.executemany(f"INSERT INTO questLoad VALUES ({', '.join('?' * len(columns))})", quests)
             
-            errorType = "Insertion"
-            self._cursor.executemany("INSERT INTO quests VALUES (?, ?, ?, ?, ?, ?, ?)", quests)
+            deleted = [row[0] for row in connection.execute(
+                "DELETE FROM quests WHERE number NOT IN (SELECT number FROM questLoad) RETURNING number").fetchall()]
+            changes = " OR ".join(f"quests.{column} IS NOT questLoad.{column}" for column in columns[1:])
+            updated = [row[0] for row in connection.execute(
+                f"""UPDATE quests SET {', '.join(f'{column}=questLoad.{column}' for column in columns[1:])}
+                    FROM questLoad WHERE quests.number=questLoad.number AND ({changes}) RETURNING quests.number""").fetchall()]
+            inserted = [row[0] for row in connection.execute(
+                "INSERT INTO quests SELECT * FROM questLoad WHERE number NOT IN (SELECT number FROM quests) RETURNING number").fetchall()]
+            connection.execute("DROP TABLE temp.questLoad")
+            
+            # The search index is changed in the same transaction,
+            # so searches never see a different list than the table
+            if self._questSearch and (deleted or updated or inserted):
+                changed = deleted + updated
+                connection.executemany("DELETE FROM questSearch WHERE number=?", [(number,) for number in changed])
+                connection.executemany("INSERT INTO questSearch (number, name, description) SELECT number, name, description FROM quests WHERE number=?",
+                                       [(number,) for number in updated + inserted])
+            # Read the quests back so the catalog holds the values as the database stored them
+            rows = None
+            if deleted or updated or inserted:
+                rows = connection.execute("SELECT * FROM quests").fetchall()
+            return {"inserted": len(inserted), "updated": len(updated), "deleted": len(deleted)}, rows
+            
+        try:
+            counts, rows = await self._dbconn.transaction(load)
         except Exception as e:
-            self._logger.error("DB_interactions:loadQuests:%s Error: %s", errorType, str(e))
-            self._connection.rollback()
+            self._logger.error("DB_interactions:loadQuests:Load Error: %s", str(e))
             return False
         else:
-            self._logger.info("DB_interactions:loadQuests: removed all items from quests")
-            self._logger.info("DB_interactionsloadQuests: loaded %s new quest(s) into quests\n%s", str(len(quests)), quests)
-            self._connection.commit()
-            return True
+            self._logger.info("DB_interactions:loadQuests: inserted %s, updated %s and deleted %s quest(s) out of %s",
+                              str(counts["inserted"]), str(counts["updated"]), str(counts["deleted"]), str(len(quests)))
+            if rows is not None:
+                # Swap in the new catalog all at once
+                self._catalog = questCatalog(rows, self._catalog.version + 1)
+                self._logger.info("DB_interactions:loadQuests: built quest catalog version %s with %s quest(s)", str(self._catalog.version), str(len(self._catalog)))
+            return counts
+    
+    def getProgression(self):
+        """Returns the compiled level and rank requirements"""
+        return self._progression
+    
+    def getCatalog(self):
+        """Returns the current quest catalog. The catalog is never
+        changed once it is built, so it is safe to hold on to
+        """
+        return self._catalog
             
     async def fetchQuest(self, questNum):
-        """Retrieves a single quest from the database
+        """Retrieves a single quest from the quest catalog
         based on their quest number. This method works the same
         as the fetchMember method
         """
-        try:
-            quest = self._cursor.execute("SELECT * FROM quests WHERE number=?", (questNum,)).fetchall()
-            if quest == []:
-                quest = "none found"
-            else:
-                quest = quest[0]
-        except Exception as e:
-            self._logger.error("DB_interactions:fetchQuest:Selection Error: %s", str(e))
-            return("error")
-        else:
-            self._logger.info("DB_interactions:fetchQuest:Selection: selected quest number %s from quests: %s", str(questNum), str(quest))
-            return quest
+        quest = self._catalog.get(questNum)
+        if quest is None:
+            quest = "none found"
+        self._logger.info("DB_interactions:fetchQuest:Selection: selected quest number %s from catalog version %s: %s", questNum, self._catalog.version, payload(quest))
+        return quest
         
-    async def getFromTableFilter(self, table: str, args="", fields: tuple=(), fieldTypes: dict={}, shorthands: dict={}, operators: tuple=(), order: str="none"):
+    async def getFromTableFilter(self, table: str, args="", order: str="none", memberId=None):
         """Retrieves a list of tuples from a given table with a filter
         based on the given arguments. If there are no arguments provided,
-        it just retrieves all items with the given order. If you provide arguments,
-        you also need to provide fields, fieldTypes, and operators.
-        
-        fields contains any field you want the args to be able to filter by. This can include any
-        column in the table you are searching in.
+        it just retrieves all items with the given order.
         
-        fieldTypes requires every field in fields to be paired with their type, such as numberic, string, ect.
+        Filters can only be used with the tables in Filter_compiler's FILTERS,
+        which lists the fields each table can be searched by and their shorthands.
+        The filter is compiled once and reused for every search with the same
+        arguments, see Filter_compiler for the filter syntax. Quest names and
+        descriptions are searched with the questSearch index when it is available
         
-        The shorthands dictionary requires one item, "fields", which contains a dictionary with any fields that have
-        a shortened reference. It can also include fields that you want to have shortened values in, like writing "true"
-        as "t". To do so, name the item after the field and include a dictionary with any conversions
-        
-        To see an example of how to format the filtering items, see the questList or questLog methods in
-        the Member_interactions cog
+        memberId is used when searching the questLog table, and limits the
+        results to the quest log of the given member. Archived quest log
+        entries are only searched if the filter asks for them
         """
+        if table == "adventurers":
+            await self._showWrites()
+        source, sourceParams = self._filterSource(table, memberId)
+        command = f"SELECT * FROM {source}"
         try:
             if args == "": # If no arguments are provided
-                if order == "none": # If no order is given, do a basic fetch all
-                    command = f"SELECT * FROM '{table}'"
-                else: # Else, add the order to the command
-                    command = f"SELECT * FROM '{table}' ORDER BY {order}"
-                
-                items = self._cursor.execute(command).fetchall()
-            else: # If there are args
-                command = f"SELECT * FROM '{table}' WHERE" # The beginning of the command
-                keywords = [] # The search values
-                defaultOrder = str(order)
-                op = "" # The operator of a given filter
-                error = True # If an issue occurs with a keyword, this is used to keep track of it
-                # Split the arguments by spaces and sort through the words
-                searchField = args.split(" ")
-                for item in searchField:
-                    # Check if any of the operators are in the word
-                    for operator in operators:
-                        if operator in item:
-                            # If it is, split the word by the operator.
-                            # The word to the left of the op is the field,
-                            # and the right is the value
-                            item = item.split(operator)
-                            field = item[0].lower()
-                            value = item[1]
-                            op = operator # Store the operator
-                            if op == ":": # colon is treated as an equal sign 
-                                op = "="
-                            break
-                    if type(item) != type([]): # If the item was not caught by the operator check
-                        # check if the item falls under another category for keywords
-                        
-                        # Writing "sort by x" works the same as using "order=x"
-                        # The first two checks handle this function
-                        if item == "sort" or item == "ordered" or item == "order":
-                            order = "ORDER"
-                        elif item == "by" and order == "ORDER":
-                            order = "ORDER BY"
-                        # writing "descending" or a shorthand of it reverses the ordering
-                        elif (item == "descending" or item == "desc" or item == "d") and order != "none":
-                            order = order.replace(" ASC", " DESC", 1)
-                        # If the first two ordering items were matched, the next non-operator
-                        # item is assumed to be the new order
-                        elif order == "ORDER BY":
-                            order = item + " ASC"
-                        # Otherwise, the item is assumed to be a part of the last item added
-                        # to the values. Therefore, it is added to the keywords list unless
-                        # an error was caught in a previous keyword that hasn't resolved
-                        elif not error:
-                            keywords[-1] = keywords[-1][:len(keywords[-1]) - 1] + " " + item + "%"
-                        continue
-                    # If the field is order, set the order
-                    if field == "order" or field == "o":
-                        order = item[1] + " ASC"
-                    else: # The word is a filter
-                        # If the field is in shorthands list, apply shorthand conversion
-                        if field in shorthands["fields"]:
-                            field = shorthands["fields"][field]
-                        # check if the field is a valid search field
-                        if field not in fields:
-                            # If it isn't, log an error and ignore the current word
-                            error = True
-                            continue
-                        
-                        #values with special shorthand
-                        if field in shorthands:
-                            if value in shorthands[field]:
-                                value = shorthands[field][value]
-                        
-                        # numeric values
-                        if fieldTypes[field] == "numeric":
-                            value = int(value)
-                            command = command + f" AND {field}{op}?"
-                        # boolean values
-                        elif fieldTypes[field] == "bool":
-                            if value.lower() == "true" or value.lower() == "yes":
-                                value = True
-                            elif value.lower() == "false" or value.lower() == "no":
-                                value = False
-                            command = command + f" AND {field}{op}?"
-                        # date values
-                        elif fieldTypes[field] == "date":
-                            value = dateparser.parse(value).date()
-                            command = command + f" AND {field}{op}?"
-                        # string and other catchall values
-                        else:
-                            if op == "=":
-                                command = command + f" AND {field} LIKE ?"
-                                value = "%" + value + "%"
-                            elif op == "!=":
-                                command = command + f" AND {field} NOT LIKE ?"
-                                value = "%" + value + "%"
-                            else:
-                                command = command + f" AND {field}{op}?"
-                        keywords.append(value)
-                        error = False # reset the error from previous words
-                        
-                # if there are no keywords arguments, meaning the only
-                # argument is an order by, I remove the WHERE clause
-                if len(keywords) == 0:
-                    command = command.replace(" WHERE", "", 1)
-                # if at least one keyword argument, cut out the extra AND statement in the command
-                else:
-                    command = command.replace(" AND", "", 1)
-                if order != "none": # if an order was provided
-                    if order[:order.index(" ")] in shorthands['fields']: # check for conversion
-                        order = shorthands['fields'][order[:order.index(" ")]] + order[order.index(" "):] # replace everything before the ASC/DESC
-                    if order[:order.index(" ")] in fields: # if the given order is a valid field
-                        command = command + f" ORDER BY {order}"
-                    elif defaultOrder != "none":
-                        command = command + f" ORDER BY {defaultOrder}"
-                
-                items = self._cursor.execute(command, keywords).fetchall()
+                if order != "none": # add the order to the command if given
+                    command = command + f" ORDER BY {order}"
+                parameters = sourceParams
+            else: # If there are args, compile them into a filter
+                plan = compileFilter(table, args, order, self._questSearch)
+                source, sourceParams = self._filterSource(table, memberId, plan.archived, plan.seasons)
+                command = plan.command(source)
+                parameters = sourceParams + plan.parameters()
+            
+            items = await self._dbconn.fetch(command, parameters)
         except Exception as e:
             self._logger.error("DB_interactions:getFromTableFilter:Selection Error: %s", str(e))
             return "error"
         else:
-            self._logger.info("DB_interactions:getFromTableFilter: selected items from %s using command %s:\n%s", table, command, str(items))
+            self._logger.info("DB_interactions:getFromTableFilter: selected items from %s using command %s:\n%s", table, command, payload(items))
             return items
     
+    def _filterSource(self, table: str, memberId=None, archived: bool=False, seasons: tuple=()):
+        """Returns the table or subquery a filter is applied to, and its parameters.
+        Every member's log is kept in the questLog table, so their rows are
+        selected first and the filter is applied to those.
+        
+        If archived is True, the archived entries of the quest log are added
+        in. A quest completed both before and after it was archived has a row
+        in each, so they are combined into one row with the total times
+        completed and the latest date. A row found in both databases, left by
+        an interrupted move, is only counted once. If seasons are given, only the rows
+        completed during them are selected, before they are combined
+        """
+        if table != "questLog":
+            return f"'{table}'", []
+        clauses, parameters = [], []
+        if memberId is not None:
+            clauses.append("memberId=?")
+            parameters.append(memberId)
+        season, seasonParams = seasonClause(seasons)
+        if season != "":
+            clauses.append(season)
+            parameters.extend(seasonParams)
+        where = "" if clauses == [] else " WHERE " + " AND ".join(clauses)
+        columns = QUEST_LOG_COLUMNS if memberId is not None else "memberId, " + QUEST_LOG_COLUMNS
+        
+        if archived and self._archive:
+            combined = (f"SELECT memberId, number, name, rank, expReward, goldReward, type, SUM(timesCompleted) AS timesCompleted, "
+                        f"dateCompleted, MAX({sqlDate('dateCompleted')}) FROM ("
+                        f"SELECT memberId, {QUEST_LOG_COLUMNS} FROM main.questLog{where} UNION "
+                        f"SELECT memberId, {QUEST_LOG_COLUMNS} FROM archive.questLog{where}) GROUP BY memberId, number")
+            return f"(SELECT {columns} FROM ({combined}))", parameters * 2
+        if where == "" and memberId is None:
+            return "'questLog'", []
+        return f"(SELECT {columns} FROM questLog{where})", parameters
+    
+    async def countFromTableFilter(self, table: str, args="", memberId=None):
+        """Returns how many rows of the given table match the filter,
+        without selecting them. Works the same as getFromTableFilter
+        """
+        try:
+            plan = compileFilter(table, args, "none", self._questSearch)
+            source, sourceParams = self._filterSource(table, memberId, plan.archived, plan.seasons)
+            count = (await self._dbconn.fetch(plan.count(source), sourceParams + plan.parameters()))[0][0]
+        except Exception as e:
+            self._logger.error("DB_interactions:countFromTableFilter:Selection Error: %s", str(e))
+            return "error"
+        else:
+            self._logger.info("DB_interactions:countFromTableFilter: counted %s item(s) in %s matching '%s'", count, table, args)
+            return count
+    
+    async def pageFromTableFilter(self, table: str, args="", order: str="none", memberId=None, cursor=None, backward: bool=False, size: int=5):
+        """Retrieves one page of the rows getFromTableFilter would return,
+        so a long list never needs to be selected all at once.
+        
+        cursor is the cursor of the row the page starts after, and if backward
+        is True the page holds the rows before it instead. With no cursor, the
+        first page is returned, or the last page if backward is True.
+        Returns the rows in list order, along with the cursors of the first
+        and last rows, which are used to find the pages on either side
+        """
+        try:
+            plan = compileFilter(table, args, order, self._questSearch)
+            source, sourceParams = self._filterSource(table, memberId, plan.archived, plan.seasons)
+            command = plan.page(source, cursor is not None, backward)
+            parameters = sourceParams + plan.parameters() + ([] if cursor is None else list(cursor)) + [size]
+            rows = await self._dbconn.fetch(command, parameters)
+        except Exception as e:
+            self._logger.error("DB_interactions:pageFromTableFilter:Selection Error: %s", str(e))
+            return "error"
+        if backward:
+            rows.reverse()
+        # The last two columns of each row are its cursor
+        items = [row[:-2] for row in rows]
+        first = None if rows == [] else tuple(rows[0][-2:])
+        last = None if rows == [] else tuple(rows[-1][-2:])
+        self._logger.info("DB_interactions:pageFromTableFilter: selected %s item(s) from %s after %s:\n%s", len(items), table, cursor, payload(items))
+        return items, first, last
+    
     async def _runCommand(self, command: str, parameters: ()):
         """Runs a given command from the cursor.
-        Designed to be used with the "accessDatabase" command in admin cog
+        Designed to be used with the "accessDatabase" command in admin cog.
+        The command is never part of a unit of work; it is committed
+        as soon as it finishes
         """
+        def run(connection):
+            # sqlite reports every table the command writes to, triggers
+            # included, so only what it changed has to be reloaded
+            rowWrites = set()
+            tableChanges = set()
+            def authorizer(action, arg1, arg2, database, trigger):
+                if action in (sqlite3.SQLITE_INSERT, sqlite3.SQLITE_UPDATE, sqlite3.SQLITE_DELETE):
+                    rowWrites.add(arg1.lower())
+                elif action == sqlite3.SQLITE_DROP_TABLE:
+                    tableChanges.add(arg1.lower())
+                elif action == sqlite3.SQLITE_ALTER_TABLE:
+                    tableChanges.add(arg2.lower())
+                return sqlite3.SQLITE_OK
+            changes = connection.total_changes
+            connection.set_authorizer(authorizer)
+            try:
+                result = connection.execute(command, parameters).fetchall()
+            finally:
+                connection.set_authorizer(None)
+            # A write the command could have made, but which changed no rows, changed nothing
+            changed = tableChanges | (rowWrites if connection.total_changes != changes else set())
+            # Keep the search index matching any change made to quests
+            if self._questSearch and "quests" in changed:
+                connection.execute("DELETE FROM questSearch")
+                connection.execute("INSERT INTO questSearch (number, name, description) SELECT number, name, description FROM quests")
+            return result, changed
+        
         try:
-            self._cursor.execute(command, parameters)
-            result = self._cursor.fetchall()
+            async with self.unitOfWork(atomic=False):
+                result, changed = await self._dbconn.transaction(run)
         except Exception as e:
+            # The command was rolled back, so nothing has to be reloaded
             self._logger.error("DB_interactions:runCommand: %s from %s", str(e), command)
-            self._connection.rollback()
             return ("Error: " + str(e))
+        
+        self._logger.info("DB_interactions:runCommand: ran command %s with params %s, changing %s", command, parameters, str(sorted(changed)))
+        # Rebuilding the quest catalog clears the adventurer cache as well
+        if "quests" in changed:
+            await self._reloadCatalog()
+        elif "adventurers" in changed:
+            self._uncacheMember()
+        if result == []:
+            return ("complete")
         else:
-            self._logger.info("DB_interactions:runCommand: ran command %s with params %s", command, parameters)
-            if result == []:
-                self._connection.commit()
-                return ("complete")
-            else:
-                self._connection.commit()
-                return ("complete: " + str(result))
+            return ("complete: " + str(result))
+    
+    async def _reloadCatalog(self):
+        """Clears the adventurer cache and rebuilds the quest catalog,
+        after something outside of this cog changed the database
+        """
+        self._uncacheMember()
+        try:
+            rows = await self._dbconn.fetch("SELECT * FROM quests")
+            self._catalog = questCatalog(rows, self._catalog.version + 1)
+        except Exception as e:
+            self._logger.error("DB_interactions:reloadCatalog:Catalog Error: %s", str(e))
+    
+    async def _runQuery(self, command: str, parameters: (), rowLimit: int=50000, timeout: float=5.0, inlineRows: int=20):
+        """Runs a query for the "queryDatabase" command in admin cog.
+        The query runs on a read-only connection opened just for it, so it can
+        never change the database or the connections the bot reads with, and
+        is stopped if it takes longer than timeout seconds.
+        At most rowLimit rows are read.
+        
+        Returns a dictionary with the "columns" of the result, the first
+        inlineRows "rows", the number of rows read as "count", and whether the
+        result was cut off at the row limit as "truncated". If there are more
+        rows than inlineRows, every row read is also written to a gzipped CSV
+        file, returned as bytes under "attachment". The file is built on the
+        database thread, so large results never hold up the bot
+        """
+        def query(connection):
+            deadline = time.monotonic() + timeout
+            # Called every few thousand steps of the query; returning True stops it
+            connection.set_progress_handler(lambda: time.monotonic() > deadline, 10000)
+            try:
+                cursor = connection.execute(command, parameters)
+                columns = [] if cursor.description is None else [column[0] for column in cursor.description]
+                rows = cursor.fetchmany(inlineRows + 1)
+                result = {"columns": columns, "rows": rows[:inlineRows], "count": len(rows), "truncated": False, "attachment": None}
+                if len(rows) > inlineRows:
+                    # Stream the rest of the rows into the file rather than holding them all
+                    buffer = io.BytesIO()
+                    with gzip.GzipFile(fileobj=buffer, mode="wb") as file:
+                        text = io.TextIOWrapper(file, encoding="utf-8", newline="")
+                        writer = csv.writer(text)
+                        writer.writerow(columns)
+                        writer.writerows(rows)
+                        while result["count"] < rowLimit:
+                            rows = cursor.fetchmany(min(1000, rowLimit - result["count"]))
+                            if rows == []:
+                                break
+                            writer.writerows(rows)
+                            result["count"] += len(rows)
+                        result["truncated"] = result["count"] >= rowLimit and cursor.fetchone() is not None
+                        text.flush()
+                        text.detach()
+                    result["attachment"] = buffer.getvalue()
+                return result
+            finally:
+                connection.set_progress_handler(None, 0)
+        
+        await self._showWrites()
+        try:
+            result = await self._dbconn.readOnce(query)
+        except Exception as e:
+            if str(e) == "interrupted":
+                e = f"the query took longer than {timeout} seconds"
+            self._logger.error("DB_interactions:runQuery: %s from %s", str(e), command)
+            return ("Error: " + str(e))
+        else:
+            self._logger.info("DB_interactions:runQuery: ran query %s with params %s, read %s row(s)", command, parameters, result["count"])
+            return result
+    
+    async def backupDatabase(self):
+        """Takes a backup of the database while the bot keeps running, see
+        DB_backup. The backup runs on its own thread and connection, so the
+        bot is not held up. The attached archive is backed up along with it.
+        Returns the path of the backup, or an error message
+        """
+        await self._showWrites() # Anything waiting in the write-behind queue goes into the backup
+        try:
+            loop = asyncio.get_running_loop()
+            path = await loop.run_in_executor(None, lambda: takeBackup(self._dbconn.path, attach=self._dbconn.attached))
+        except Exception as e:
+            self._logger.error("DB_interactions:backupDatabase:Backup Error: %s", str(e))
+            return ("Error: " + str(e))
+        else:
+            return path
+    
+    @tasks.loop(hours=12.0)
+    async def backupTimer(self):
+        """Backs up the database when the bot starts, then every 12 hours"""
+        await self.backupDatabase()
+    
+    @backupTimer.before_loop
+    async def before_backup(self):
+        await self._bot.wait_until_ready()
+    
+    async def restoreBackup(self, name: str="latest", restore: bool=False):
+        """Checks a backup of the database, and restores it if restore is True.
+        name is the file name of a backup in the backups folder, or "latest".
+        
+        The backup is unpacked to a temporary file along with the backup of the
+        archive taken with it, their integrity is checked, and the row counts
+        of their adventurers, quests and questLog tables are compared with the
+        live databases. If it is restored, the live database is replaced by the
+        backup through the writer connection, brought up to date by the
+        migrations, the archive's quest log is replaced as well, and the row
+        counts are checked again. A backup taken without an archive leaves
+        the archive as it is.
+        
+        Returns a dictionary with the "backup" used, its "integrity" check,
+        the "backupCounts" and "liveCounts" of each table, whether it was
+        "restored", and whether the restored counts were "verified" to match
+        the backup. Returns an error message if anything fails
+        """
+        backups = listBackups(self._dbconn.path)
+        if backups == []:
+            return ("Error: there are no backups")
+        if name == "latest":
+            name = backups[-1]
+        elif name not in backups: # Only files from the list can be used, so nothing outside the folder is opened
+            return (f"Error: there is no backup named {name}")
+        
+        loop = asyncio.get_running_loop()
+        rawPath = None
+        rawAttached = {} # the unpacked backup of each attached database
+        try:
+            rawPath = await loop.run_in_executor(None, unpackBackup, os.path.join(BACKUP_DIR, name))
+            for schema in self._dbconn.attached:
+                attachedPath = os.path.join(BACKUP_DIR, attachedName(name, schema))
+                if os.path.exists(attachedPath):
+                    rawAttached[schema] = await loop.run_in_executor(None, unpackBackup, attachedPath)
+            integrity, backupCounts = await loop.run_in_executor(None, checkBackup, rawPath, rawAttached)
+            await self._showWrites()
+            result = {"backup": name, "integrity": integrity, "backupCounts": backupCounts,
+                      "liveCounts": await self._dbconn.read(rowCounts), "restored": False, "verified": False}
+            if restore:
+                if integrity != "ok":
+                    return (f"Error: {name} failed its integrity check: {integrity}")
+                
+                def replace(connection):
+                    if connection.in_transaction:
+                        connection.commit()
+                    restoreInto(connection, rawPath)
+                    for schema, attachedPath in rawAttached.items():
+                        restoreAttached(connection, schema, attachedPath)
+                    # Backups taken before a migration was released are brought up to date
+                    runMigrations(connection)
+                    # The Members sheet no longer matches any of the backup's changes
+                    connection.execute("INSERT INTO memberChanges (memberId) VALUES (NULL)")
+                    connection.commit()
+                    return rowCounts(connection)
+                
+                async with self.unitOfWork(atomic=False):
+                    result["liveCounts"] = await self._dbconn.run(replace)
+                result["restored"] = True
+                result["verified"] = result["liveCounts"] == backupCounts
+                await self._reloadCatalog()
+        except Exception as e:
+            self._logger.error("DB_interactions:restoreBackup:Restore Error: %s from %s", str(e), name)
+            return ("Error: " + str(e))
+        finally:
+            for path in [rawPath] + list(rawAttached.values()):
+                if path is not None:
+                    os.remove(path)
+        
+        if result["restored"]:
+            self._logger.warning("DB_interactions:restoreBackup: restored %s, counts %s, verified: %s", name, str(result["liveCounts"]), str(result["verified"]))
+        else:
+            self._logger.info("DB_interactions:restoreBackup: checked %s, integrity %s, counts %s against live %s",
+                              name, integrity, str(backupCounts), str(result["liveCounts"]))
+        return result
+    
+    async def archiveQuestLogs(self, days: int=None):
+        """Moves every quest log entry last completed more than the given
+        number of days ago (archiveAfter by default) into the archive
+        database, so the quest logs the bot reads every day stay small.
+        Returns how many entries were moved, or an error message.
+        
+        SQLite can't commit to both databases atomically while they use WAL,
+        so the entries are copied in one transaction and only deleted from
+        the quest log in a second one, once the archive has them. If the bot
+        stops in between, the next run copies nothing new and finishes the move
+        """
+        if not self._archive:
+            return ("Error: there is no archive database")
+        days = self._archiveAfter if days is None else days
+        cutoff = (datetime.date.today() - datetime.timedelta(days=days)).isoformat()
+        
+        def copy(connection):
+            connection.execute(f"""INSERT OR IGNORE INTO archive.questLog (memberId, {QUEST_LOG_COLUMNS})
+                                   SELECT memberId, {QUEST_LOG_COLUMNS} FROM main.questLog WHERE {sqlDate('dateCompleted')} < ?""", (cutoff,))
+        
+        def delete(connection):
+            # Only the entries the archive already has are deleted
+            return connection.execute(f"""DELETE FROM main.questLog WHERE {sqlDate('dateCompleted')} < ? AND EXISTS (
+                                              SELECT 1 FROM archive.questLog AS archived WHERE archived.memberId=questLog.memberId
+                                              AND archived.number=questLog.number AND archived.dateCompleted=questLog.dateCompleted)""", (cutoff,)).rowcount
+        
+        try:
+            await self._dbconn.transaction(copy)
+            moved = await self._dbconn.transaction(delete)
+        except Exception as e:
+            self._logger.error("DB_interactions:archiveQuestLogs:Archive Error: %s", str(e))
+            return ("Error: " + str(e))
+        else:
+            self._logger.info("DB_interactions:archiveQuestLogs: moved %s quest log entries completed before %s to the archive", str(moved), cutoff)
+            return moved
+    
+    @tasks.loop(hours=24.0)
+    async def archiveTimer(self):
+        """Archives old quest log entries when the bot starts, then once a day"""
+        if self._archive and self._archiveAfter > 0:
+            await self.archiveQuestLogs()
+    
+    @archiveTimer.before_loop
+    async def before_archive(self):
+        await self._bot.wait_until_ready()
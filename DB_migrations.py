@@ -0,0 +1,313 @@
+#===============================================================================
+# This file holds the changes which need to be made to an existing
+# quest system database when the layout of its tables changes.
+#
+# Each migration has a version number. The database stores the version of
+# the last migration it received in PRAGMA user_version, and runMigrations
+# applies every newer migration in order when the bot starts, each in its
+# own transaction. To change the layout, add a new migration to the end of
+# MIGRATIONS; never change one that has already been released.
+#
+# The migrations also check whether they still need to run, since databases
+# from before user_version was used may already have some of them applied.
+# They are tested in tests/test_db_migrations.py
+#===============================================================================
+
+import logging
+import string
+import sqlite3
+
+_logger = logging.getLogger('bot activity')
+
+# The columns shared by every quest log entry, in the order they are
+# returned to the rest of the bot
+QUEST_LOG_COLUMNS = "number, name, rank, expReward, goldReward, type, timesCompleted, dateCompleted"
+
+# SQLite's lower() only changes A-Z, so names are normalised the same way
+# in Python to match the keys stored by the database
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+def sqlDate(column: str):
+    """Returns an SQL expression which turns a mm/dd/yyyy date stored in the
+    given column into yyyy-mm-dd, so dates compare and sort in date order
+    """
+    return f"(substr({column}, 7, 4) || '-' || substr({column}, 1, 2) || '-' || substr({column}, 4, 2))"
+
+def memberNameKey(name: str):
+    """Returns the normalised form of a discord name, matching the
+    lower(trim(discordName)) keys kept in memberNames and memberAliases.
+    A leading @ is dropped, since members often type their name as a mention
+    """
+    key = str(name).strip(" ").translate(_ASCII_LOWER)
+    if key.startswith("@"):
+        key = key[1:].strip(" ")
+    return key
+
+def migrateBaseTables(connection):
+    """Creates the tables the bot has always used, if they do not exist yet.
+    Older databases were made by hand, so this only matters for new ones;
+    their column names may differ, which is fine since the bot reads
+    these tables by position
+    """
+    connection.execute("""CREATE TABLE IF NOT EXISTS adventurers (
+                            ID INTEGER PRIMARY KEY,
+                            firstname TEXT,
+                            lastname TEXT,
+                            discordName TEXT,
+                            title TEXT,
+                            alignment TEXT,
+                            exp INTEGER,
+                            level INTEGER,
+                            gold INTEGER,
+                            rank TEXT,
+                            class TEXT,
+                            currentRankedQuest TEXT,
+                            currentHeroicQuest TEXT,
+                            questsCompleted INTEGER,
+                            joinDate NUMERIC
+                            )""")
+    connection.execute("""CREATE TABLE IF NOT EXISTS quests (
+                            number INTEGER PRIMARY KEY,
+                            name TEXT,
+                            description TEXT,
+                            rank INTEGER,
+                            expReward INTEGER,
+                            goldReward INTEGER,
+                            type TEXT
+                            )""")
+    connection.execute("CREATE TABLE IF NOT EXISTS eventAnnounce (number INTEGER, announceDate NUMERIC, endDate NUMERIC)")
+    connection.execute("CREATE TABLE IF NOT EXISTS weeklyAnnounce (number INTEGER, announceDate NUMERIC)")
+
+def migrateQuestLogs(connection):
+    """Creates the shared questLog table and folds every old
+    per-member "<discord ID>questLog" table into it.
+
+    Older versions of the bot created one quest log table for each
+    adventurer. Each of those tables is copied into questLog with the
+    member's ID attached to every row, then dropped. The whole migration
+    is done in one transaction, so a failure leaves the old tables untouched
+    """
+    createQuestLog(connection)
+
+    # Find every old quest log, which are named after the member's discord ID
+    tables = connection.execute("SELECT name FROM sqlite_master WHERE type='table' AND name LIKE '%questLog'").fetchall()
+    moved = 0
+    for (table,) in tables:
+        memberId = table[:-len("questLog")]
+        if not memberId.isdigit():
+            continue
+        # Older versions could hold a quest more than once, so only the
+        # most recent row for each quest number is kept: the one with the
+        # latest completion date, or the last one added if the dates match
+        connection.execute(f"""INSERT OR REPLACE INTO questLog ({"memberId, " + QUEST_LOG_COLUMNS})
+                               SELECT ?, {QUEST_LOG_COLUMNS} FROM '{table}' AS log
+                               WHERE rowid=(SELECT rowid FROM '{table}' AS other WHERE other.number IS log.number
+                                            ORDER BY {sqlDate("other.dateCompleted")} DESC, rowid DESC LIMIT 1)""", (int(memberId),))
+        connection.execute(f"DROP TABLE '{table}'")
+        moved += 1
+    if moved > 0:
+        _logger.info("DB_migrations:migrateQuestLogs: moved %s member quest log(s) into questLog", str(moved))
+
+def createQuestLog(connection, schema: str="main"):
+    """Creates the questLog table and its indexes in the given schema,
+    if they don't exist yet. The archive database's copy of the table
+    is made by createArchiveLog instead
+    """
+    connection.execute(f"""CREATE TABLE IF NOT EXISTS {schema}.questLog (
+                            memberId INTEGER NOT NULL,
+                            number INTEGER NOT NULL,
+                            name TEXT,
+                            rank INTEGER,
+                            expReward INTEGER,
+                            goldReward INTEGER,
+                            type TEXT,
+                            timesCompleted INTEGER,
+                            dateCompleted NUMERIC,
+                            PRIMARY KEY (memberId, number)
+                            )""")
+    connection.execute(f"CREATE INDEX IF NOT EXISTS {schema}.questLogDate ON questLog (memberId, dateCompleted)")
+    connection.execute(f"CREATE INDEX IF NOT EXISTS {schema}.questLogNumber ON questLog (number)")
+
+def createArchiveLog(connection, schema: str="archive"):
+    """Creates the questLog table of the archive database and its indexes,
+    if they don't exist yet. A quest can be archived for a member more than
+    once, each time it was completed again after the last move, so the key
+    includes the date it was completed. Moving a row a second time then
+    changes nothing, which keeps an interrupted move safe to run again.
+    
+    An archive made with the key of the quest log is rebuilt with this one
+    """
+    keys = [column[1] for column in connection.execute(f"PRAGMA {schema}.table_info(questLog)").fetchall() if column[5] > 0]
+    rebuild = keys != [] and "dateCompleted" not in keys
+    if not connection.in_transaction:
+        connection.execute("BEGIN")
+    if rebuild:
+        connection.execute(f"DROP INDEX IF EXISTS {schema}.questLogDate")
+        connection.execute(f"DROP INDEX IF EXISTS {schema}.questLogNumber")
+        connection.execute(f"ALTER TABLE {schema}.questLog RENAME TO questLogOld")
+    connection.execute(f"""CREATE TABLE IF NOT EXISTS {schema}.questLog (
+                            memberId INTEGER NOT NULL,
+                            number INTEGER NOT NULL,
+                            name TEXT,
+                            rank INTEGER,
+                            expReward INTEGER,
+                            goldReward INTEGER,
+                            type TEXT,
+                            timesCompleted INTEGER,
+                            dateCompleted NUMERIC,
+                            PRIMARY KEY (memberId, number, dateCompleted)
+                            )""")
+    connection.execute(f"CREATE INDEX IF NOT EXISTS {schema}.questLogDate ON questLog (memberId, dateCompleted)")
+    connection.execute(f"CREATE INDEX IF NOT EXISTS {schema}.questLogNumber ON questLog (number)")
+    if rebuild:
+        connection.execute(f"""INSERT INTO {schema}.questLog (memberId, {QUEST_LOG_COLUMNS})
+                               SELECT memberId, {QUEST_LOG_COLUMNS} FROM {schema}.questLogOld""")
+        connection.execute(f"DROP TABLE {schema}.questLogOld")
+        _logger.info("DB_migrations:createArchiveLog: rebuilt %s.questLog with the archive's key", schema)
+
+def migrateQuestSearch(connection):
+    """Creates the questSearch full text index of quest names and
+    descriptions, filling it from the quests table if it is new.
+    loadQuests keeps it up to date from then on.
+
+    The index is split into trigrams, so a search matches any part of a
+    word the same way LIKE '%...%' does ("agon" finds "Dragon"). SQLite can
+    be built without full text search, and versions before 3.34 have no
+    trigram tokenizer; either way the index is skipped and searches fall
+    back to scanning quests
+    """
+    exists = connection.execute("SELECT 1 FROM sqlite_master WHERE name='questSearch'").fetchone() is not None
+    connection.execute("SAVEPOINT questSearch")
+    try:
+        # The quest number is only stored to find the quest, so it isn't indexed
+        connection.execute("CREATE VIRTUAL TABLE IF NOT EXISTS questSearch USING fts5(number UNINDEXED, name, description, tokenize='trigram')")
+        if not exists:
+            connection.execute("INSERT INTO questSearch (number, name, description) SELECT number, name, description FROM quests")
+    except sqlite3.OperationalError as e:
+        _logger.warning("DB_migrations:migrateQuestSearch: full text search is unavailable, searching quests without it: %s", str(e))
+        connection.execute("ROLLBACK TO questSearch")
+    connection.execute("RELEASE questSearch")
+
+def migrateMemberNames(connection):
+    """Creates the memberNames and memberAliases tables used to find
+    members by their discord name, and the triggers which keep them
+    matching adventurers.
+
+    memberNames holds the normalised current name of each member under a
+    unique index. When a member's name changes, their old name is kept in
+    memberAliases so submissions made under it still reach them. The names
+    are kept outside of adventurers so its rows keep the same columns.
+
+    A name belongs to the member who held it first: a member given a name
+    another member already holds is left without a current name rather than
+    taking it from them, and the bot logs a warning (see
+    db_interact._unnamedMembers). A current name does replace another
+    member's old name, since the alias is only kept as a fallback
+    """
+    exists = connection.execute("SELECT 1 FROM sqlite_master WHERE name='memberNames'").fetchone() is not None
+    connection.execute("CREATE TABLE IF NOT EXISTS memberNames (memberId INTEGER PRIMARY KEY, nameKey TEXT)")
+    connection.execute("CREATE UNIQUE INDEX IF NOT EXISTS memberNameKey ON memberNames (nameKey)")
+    connection.execute("CREATE TABLE IF NOT EXISTS memberAliases (nameKey TEXT PRIMARY KEY, memberId INTEGER NOT NULL)")
+    connection.execute("CREATE INDEX IF NOT EXISTS memberAliasMember ON memberAliases (memberId)")
+    connection.execute("""CREATE TRIGGER IF NOT EXISTS adventurerNameInsert AFTER INSERT ON adventurers
+                          BEGIN
+                              INSERT OR IGNORE INTO memberNames VALUES (NEW.ID, lower(trim(NEW.discordName)));
+                              DELETE FROM memberAliases WHERE nameKey IN (SELECT nameKey FROM memberNames WHERE memberId=NEW.ID);
+                          END""")
+    connection.execute("""CREATE TRIGGER IF NOT EXISTS adventurerNameUpdate AFTER UPDATE OF discordName ON adventurers
+                          WHEN lower(trim(OLD.discordName)) IS NOT lower(trim(NEW.discordName))
+                          BEGIN
+                              INSERT OR IGNORE INTO memberAliases SELECT nameKey, memberId FROM memberNames WHERE memberId=OLD.ID AND nameKey IS NOT NULL;
+                              DELETE FROM memberNames WHERE memberId=OLD.ID;
+                              INSERT OR IGNORE INTO memberNames VALUES (NEW.ID, lower(trim(NEW.discordName)));
+                              DELETE FROM memberAliases WHERE nameKey IN (SELECT nameKey FROM memberNames WHERE memberId=NEW.ID);
+                          END""")
+    connection.execute("""CREATE TRIGGER IF NOT EXISTS adventurerNameDelete AFTER DELETE ON adventurers
+                          BEGIN
+                              DELETE FROM memberNames WHERE memberId=OLD.ID;
+                              DELETE FROM memberAliases WHERE memberId=OLD.ID;
+                          END""")
+    if not exists:
+        # Two members with the same name can't both be found by it,
+        # so only the first of them is given the name
+        added = connection.execute("""INSERT OR IGNORE INTO memberNames
+                                      SELECT ID, lower(trim(discordName)) FROM adventurers""").rowcount
+        total = connection.execute("SELECT COUNT(*) FROM adventurers").fetchone()[0]
+        if added < total:
+            _logger.warning("DB_migrations:migrateMemberNames: %s member(s) share a discord name and can't be found by it", str(total - added))
+
+def migrateIndexes(connection):
+    """Adds the indexes used by the bot's most common queries"""
+    # The announcement cycles select and delete announcements by date
+    connection.execute("CREATE INDEX IF NOT EXISTS weeklyAnnounceDate ON weeklyAnnounce (announceDate)")
+    connection.execute("CREATE INDEX IF NOT EXISTS eventAnnounceDate ON eventAnnounce (announceDate)")
+    # The Members sheet is written in last name order
+    connection.execute("CREATE INDEX IF NOT EXISTS adventurerLastName ON adventurers (lastname)")
+
+def migrateMemberChanges(connection):
+    """Creates the memberChanges log, and the triggers which add the ID of
+    every member inserted, changed or deleted in adventurers to it.
+
+    The Members sheet is kept up to date from the log: only the members in
+    it are read and written again, and the entries are deleted once the
+    sheet has them. An entry without a member means every member has to be
+    written again, such as after the database was replaced. The log is kept
+    outside of adventurers so its rows keep the same columns
+    """
+    connection.execute("CREATE TABLE IF NOT EXISTS memberChanges (change INTEGER PRIMARY KEY, memberId INTEGER)")
+    connection.execute("""CREATE TRIGGER IF NOT EXISTS adventurerChangeInsert AFTER INSERT ON adventurers
+                          BEGIN
+                              INSERT INTO memberChanges (memberId) VALUES (NEW.ID);
+                          END""")
+    connection.execute("""CREATE TRIGGER IF NOT EXISTS adventurerChangeUpdate AFTER UPDATE ON adventurers
+                          BEGIN
+                              INSERT INTO memberChanges (memberId) SELECT OLD.ID WHERE OLD.ID IS NOT NEW.ID;
+                              INSERT INTO memberChanges (memberId) VALUES (NEW.ID);
+                          END""")
+    connection.execute("""CREATE TRIGGER IF NOT EXISTS adventurerChangeDelete AFTER DELETE ON adventurers
+                          BEGIN
+                              INSERT INTO memberChanges (memberId) VALUES (OLD.ID);
+                          END""")
+    # The sheet was written before the log existed
+    connection.execute("INSERT INTO memberChanges (memberId) VALUES (NULL)")
+
+# Every migration, paired with the version the database is at once it is applied.
+# Versions must go up by one, in order
+MIGRATIONS = (
+    (1, migrateBaseTables),
+    (2, migrateQuestLogs),
+    (3, migrateQuestSearch),
+    (4, migrateMemberNames),
+    (5, migrateIndexes),
+    (6, migrateMemberChanges),
+    )
+
+def schemaVersion(connection):
+    """Returns the version of the last migration applied to the database"""
+    return connection.execute("PRAGMA user_version").fetchone()[0]
+
+def runMigrations(connection, migrations=MIGRATIONS):
+    """Applies every migration newer than the database's version, in order.
+    Each migration and the version change after it are committed together,
+    so a failed migration leaves the database at the last version which
+    succeeded, and the error is passed on. Returns the new version
+    """
+    version = schemaVersion(connection)
+    for migration_version, migration in migrations:
+        if migration_version <= version:
+            continue
+        try:
+            # DDL does not start a transaction by itself, so one is started here
+            if not connection.in_transaction:
+                connection.execute("BEGIN")
+            migration(connection)
+            connection.execute(f"PRAGMA user_version={int(migration_version)}")
+        except Exception as e:
+            _logger.critical("DB_migrations:runMigrations:Migration Error: %s in migration %s (%s)", str(e), str(migration_version), migration.__name__)
+            connection.rollback()
+            raise
+        else:
+            connection.commit()
+            version = migration_version
+            _logger.info("DB_migrations:runMigrations: applied migration %s (%s)", str(migration_version), migration.__name__)
+    return version
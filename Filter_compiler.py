@@ -0,0 +1,353 @@
+#===============================================================================
+# This file compiles the search filters members type into the questList and
+# questLog commands into parameterised SQL.
+#
+# A filter such as "r:c exp>=50 sort by gold desc" is parsed into a small
+# tree of conditions and an ordering, every field is checked against the
+# fields allowed for that list, and the result is turned into a WHERE and
+# ORDER BY clause whose values are all passed as parameters. Compiled
+# filters are cached, so repeating a search skips the parsing entirely.
+#===============================================================================
+
+from collections import namedtuple
+import functools
+import re
+import dateparser
+from DB_migrations import sqlDate
+
+# The filters each list can be searched with.
+# fields are the columns that can be searched, fieldTypes pair each field with
+# how its values are compared, and shorthands hold shortened names for fields
+# (under "fields") and for the values of specific fields.
+# operators are checked in order, so longer operators must come before the
+# operators they contain. Tables with a full text index also have "search",
+# and tables with entries in the archive database have "archive"
+QUEST_FILTER = {
+    "fields": ("name", "description", "rank", "expReward", "goldReward", "type"),
+    "fieldTypes": {"name":"string", "description":"string", "rank":"numeric", "expReward":"numeric", "goldReward":"numeric", "type":"string"},
+    "shorthands": {
+        "fields":{"n":"name", "d":"description", "desc":"description", "r":"rank", "e":"expReward",
+                  "exp":"expReward", "experience":"expReward", "g":"goldReward", "gold":"goldReward", "t":"type"},
+        "type":{"1":"repeatable", "re":"repeatable", "repeat":"repeatable",
+                "2":"ranked", "ra":"ranked",
+                "3":"special", "s":"special", "spec":"special",
+                "4":"heroic", "h":"heroic", "hero":"heroic"},
+        "rank":{"none":-1, "-":-1, "f":0, "e":1, "d":2, "c":3, "b":4, "a":5, "s":6, "s+":7,
+                "F":0, "E":1, "D":2, "C":3, "B":4, "A":5, "S":6, "S+":7}
+        },
+    "operators": (":", "!=", ">=", "<=", "<", ">", "="),
+    # name and description are searched through the questSearch full text index.
+    # columns are the columns of the table, in the order they are returned
+    "search": {"table": "questSearch", "fields": ("name", "description"),
+               "columns": "number, name, description, rank, expReward, goldReward, type"}
+    }
+
+QUEST_LOG_FILTER = {
+    "fields": ("number", "name", "rank", "expReward", "goldReward", "type", "timesCompleted", "dateCompleted", "season"),
+    "fieldTypes": {"number":"numeric","name":"string", "rank":"numeric", "expReward":"numeric", "goldReward":"numeric",
+                   "type":"string", "repeatable":"bool", "timesCompleted":"numeric", "dateCompleted":"date", "season":"season"},
+    "shorthands": {
+        "fields":{"num":"number", "n":"name", "r":"rank", "e":"expReward", "exp":"expReward", "g":"goldReward", "gold":"goldReward", "t":"type",
+                  "tc":"timesCompleted", "timescompleted":"timesCompleted", "dc":"dateCompleted", "datecompleted":"dateCompleted",
+                  "se":"season"},
+        "type":{"1":"repeatable", "re":"repeatable", "repeat":"repeatable",
+                "2":"ranked", "ra":"ranked",
+                "3":"special", "s":"special", "spec":"special",
+                "4":"heroic", "h":"heroic", "hero":"heroic"},
+        "rank":{"none":-1, "-":-1, "f":0, "e":1, "d":2, "c":3, "b":4, "a":5, "a+":6, "s":7,
+                "F":0, "E":1, "D":2, "C":3, "B":4, "A":5, "A+":6, "S":7}
+        },
+    "operators": (":", "!=", ">=", "<=", "<", ">", "="),
+    # Old entries are moved to the archive. Writing "all" or searching by
+    # season (such as season:fall2022) includes them
+    "archive": True
+    }
+
+# The filter used for each table
+FILTERS = {"quests": QUEST_FILTER, "questLog": QUEST_LOG_FILTER}
+
+# The parsed form of a filter.
+# A condition compares one field to one value, and an ordering
+# sorts the results by one field in one direction. Writing "all" is
+# kept as a condition on the "archive" field, which has no clause
+condition = namedtuple("condition", ("field", "op", "fieldType", "value"))
+ordering = namedtuple("ordering", ("field", "direction"))
+
+class filterPlan:
+    """A compiled filter. Builds the query for a table or member quest log,
+    and creates the parameters for it each time it runs.
+
+    If the table has a full text index, "has" filters (such as n:dragon) on
+    its searchable fields are matched against the index instead of scanning
+    the table, and the results are ranked by how well they match unless a
+    member chose an order
+    """
+    def __init__(self, conditions: tuple, order, search: dict=None, table: str="", ranked: bool=False, dates: tuple=()):
+        """Builds the clauses from the parsed conditions and ordering.
+        search is the "search" entry of the filter spec, or None if the
+        full text index should not be used. dates are the fields holding
+        dates, which are sorted in date order rather than as text
+        """
+        self._conditions = conditions
+        self._match = [] # match expressions of the conditions searched through the index
+        self._bindings = [] # how the parameter of each WHERE clause is made, in order
+        self._source = None # the ranked search, which replaces the table the query selects from
+        self._columns = "*"
+        # Whether the archived entries are searched as well
+        self.archived = any(item.fieldType in ("scope", "season") for item in conditions)
+        # The seasons searched. They limit the rows of the source rather than
+        # the filter's results, see seasonClause
+        self.seasons = tuple(item.value for item in conditions if item.fieldType == "season")
+        clauses = []
+        for item in conditions:
+            if item.fieldType == "scope" or item.fieldType == "season":
+                continue
+            terms = _matchTerms(item.value) if search is not None and item.field in search["fields"] else ""
+            if terms != "" and item.op == "=":
+                self._match.append(f"{item.field} : ({terms})")
+                continue
+            elif terms != "" and item.op == "!=":
+                clauses.append(f"number NOT IN (SELECT number FROM {search['table']} WHERE {search['table']} MATCH ?)")
+                self._bindings.append(("match", f"{item.field} : ({terms})"))
+                continue
+            elif item.fieldType == "string" and item.op == "=":
+                clauses.append(f"{item.field} LIKE ?")
+            elif item.fieldType == "string" and item.op == "!=":
+                clauses.append(f"{item.field} NOT LIKE ?")
+            elif item.fieldType == "date":
+                # Dates are stored as mm/dd/yyyy, so they are compared as yyyy-mm-dd
+                clauses.append(f"{sqlDate(item.field)}{item.op}?")
+            else:
+                clauses.append(f"{item.field}{item.op}?")
+            self._bindings.append(("condition", item))
+        self.where = " AND ".join(clauses) # empty if there are no conditions
+        sortField = None if order is None else (sqlDate(order.field) if order.field in dates else order.field)
+        self.order = None if order is None else f"{sortField} {order.direction}"
+        if self._match:
+            # Every searched condition is combined into one MATCH,
+            # and the rows of the table are joined to their match
+            index = search["table"]
+            self._source = (f"(SELECT {table}.*, bm25({index}) AS searchRank FROM {index} "
+                            f"JOIN {table} ON {table}.number={index}.number WHERE {index} MATCH ?)")
+            self._columns = search["columns"]
+            if ranked:
+                self.order = "searchRank" if self.order is None else f"searchRank, {self.order}"
+        # The value pages are sorted by, with the quest number breaking ties (see page).
+        # Missing values are sorted first, the same way ORDER BY sorts NULL
+        if self._match and ranked:
+            self._sortKey, self._direction = "searchRank", "ASC"
+        elif order is not None and order.field != "number":
+            self._sortKey, self._direction = f"IFNULL({sortField}, -1e308)", order.direction
+        else:
+            self._sortKey, self._direction = "number", "ASC" if order is None else order.direction
+
+    @property
+    def conditions(self):
+        """The parsed conditions of the filter"""
+        return self._conditions
+
+    def _select(self, source: str, columns: str):
+        """Returns a query selecting the given columns from
+        every row of the source which matches the filter
+        """
+        command = f"SELECT {columns} FROM {source if self._source is None else self._source}"
+        if self.where != "":
+            command = command + f" WHERE {self.where}"
+        return command
+
+    def command(self, source: str):
+        """Returns the query which applies the filter to the given
+        table or subquery. A full text search replaces the source
+        """
+        command = self._select(source, self._columns)
+        if self.order is not None:
+            command = command + f" ORDER BY {self.order}"
+        return command
+
+    def count(self, source: str):
+        """Returns a query which counts the rows matching the filter"""
+        return self._select(source, "COUNT(*)")
+
+    def page(self, source: str, cursor: bool=False, backward: bool=False):
+        """Returns a query for one page of the rows matching the filter.
+        Every row ends with its sort key and quest number, which together
+        are the cursor used to find the page next to it.
+
+        The query's parameters are the filter's parameters, then the cursor
+        of the row to start after (if cursor is True), then the page size.
+        Pages are found by comparing against the cursor rather than skipping
+        rows, so every page takes the same time to find. If backward is
+        True, the page holds the rows before the cursor instead (or the last
+        rows, with no cursor), returned in reverse order
+        """
+        ascending = (self._direction == "ASC") != backward
+        direction = "ASC" if ascending else "DESC"
+        command = f"SELECT * FROM ({self._select(source, f'{self._columns}, {self._sortKey} AS sortKey, number AS sortNumber')})"
+        if cursor:
+            command = command + f" WHERE (sortKey, sortNumber) {'>' if ascending else '<'} (?, ?)"
+        return command + f" ORDER BY sortKey {direction}, sortNumber {direction} LIMIT ?"
+
+    def parameters(self):
+        """Returns the values for the query, in order. Dates are converted
+        here rather than when compiling, since values like "yesterday" change
+        """
+        values = []
+        if self._match:
+            values.append(" AND ".join(self._match))
+        for kind, item in self._bindings:
+            if kind == "match":
+                values.append(item)
+            elif item.fieldType == "date":
+                values.append(dateparser.parse(item.value).date().isoformat())
+            elif item.fieldType == "string" and (item.op == "=" or item.op == "!="):
+                values.append("%" + item.value + "%")
+            else:
+                values.append(item.value)
+        return values
+
+def _matchTerms(value):
+    """Turns a searched value into the terms of a full text match. The
+    index is split into trigrams, so the whole value is quoted as one
+    phrase and matches anywhere in the text, the same as LIKE '%value%'.
+    Returns an empty string if the value is too short for the index,
+    in which case it is searched with LIKE instead
+    """
+    value = str(value).strip()
+    if len(value) < 3:
+        return ""
+    return '"' + value.replace('"', '""') + '"'
+
+def seasonRange(value: str):
+    """Returns the first day of a season and the first day after it, as
+    yyyy-mm-dd. A season is a year (2022), or the spring (January to June)
+    or fall (July to December) of one, written as spring2022 or fall2022.
+    Raises a ValueError for anything else
+    """
+    found = re.fullmatch(r"(spring|fall)?-?(\d{4})", str(value).lower())
+    if found is None:
+        raise ValueError(f"{value} is not a season, try a year like 2022 or a half like fall2022")
+    half, year = found.group(1), int(found.group(2))
+    if half == "spring":
+        return f"{year}-01-01", f"{year}-07-01"
+    elif half == "fall":
+        return f"{year}-07-01", f"{year + 1}-01-01"
+    return f"{year}-01-01", f"{year + 1}-01-01"
+
+def seasonClause(seasons: tuple):
+    """Returns a WHERE clause selecting the rows completed during every one
+    of the given seasons, and its parameters. Returns an empty clause if
+    there are no seasons
+    """
+    clauses = []
+    values = []
+    for season in seasons:
+        clauses.append(f"{sqlDate('dateCompleted')} >= ? AND {sqlDate('dateCompleted')} < ?")
+        values.extend(seasonRange(season))
+    return " AND ".join(clauses), values
+
+def parseFilter(spec: dict, args: str, defaultOrder: str="none"):
+    """Parses a filter string into a tuple of conditions, an ordering, and
+    whether the ordering was chosen in the filter rather than being the
+    default, using the fields of the given filter spec. Words which are not a valid
+    filter are ignored, the same way the lists always have.
+
+    Writing "sort by x", "order by x", "order=x" or "o=x" orders the results
+    by x, and "descending"/"desc"/"d" reverses the order. If the spec has an
+    archive, "all" searches the archived entries too. Any other plain word
+    is added on to the value of the filter before it, so "n:giant spider"
+    searches for names containing "giant spider"
+    """
+    fields = spec["fields"]
+    fieldTypes = spec["fieldTypes"]
+    shorthands = spec["shorthands"]
+    conditions = []
+    order = defaultOrder # the order as written, such as "exp ASC", or ORDER/ORDER BY while reading "sort by"
+    error = True # If an issue occurs with a keyword, this is used to keep track of it
+
+    for word in args.split(" "):
+        # Check if any of the operators are in the word
+        for operator in spec["operators"]:
+            if operator in word:
+                break
+        else:
+            # check if the word falls under another category for keywords
+            if word == "sort" or word == "ordered" or word == "order":
+                order = "ORDER"
+            elif word == "by" and order == "ORDER":
+                order = "ORDER BY"
+            # writing "descending" or a shorthand of it reverses the ordering
+            elif (word == "descending" or word == "desc" or word == "d") and order != "none":
+                order = order.replace(" ASC", " DESC", 1)
+            elif word.lower() == "all" and spec.get("archive", False):
+                conditions.append(condition("archive", "=", "scope", True))
+            # If the first two ordering words were matched, the next
+            # word is assumed to be the new order
+            elif order == "ORDER BY":
+                order = word + " ASC"
+            # Otherwise, the word is a part of the value of the last filter,
+            # unless that filter was invalid or isn't a string
+            elif not error and word != "" and conditions[-1].fieldType == "string":
+                conditions[-1] = conditions[-1]._replace(value=conditions[-1].value + " " + word)
+            continue
+
+        # The word to the left of the op is the field, and the right is the value
+        item = word.split(operator)
+        field = item[0].lower()
+        value = item[1]
+        op = "=" if operator == ":" else operator # colon is treated as an equal sign
+        # If the field is order, set the order
+        if field == "order" or field == "o":
+            order = value + " ASC"
+            continue
+        # If the field is in shorthands list, apply shorthand conversion
+        field = shorthands["fields"].get(field, field)
+        # check if the field is a valid search field. If it isn't, ignore the word
+        if field not in fields:
+            error = True
+            continue
+        # values with special shorthand
+        if field in shorthands and value in shorthands[field]:
+            value = shorthands[field][value]
+
+        fieldType = fieldTypes[field]
+        if fieldType == "numeric":
+            value = int(value)
+        elif fieldType == "season":
+            seasonRange(value) # checks the season is valid
+        elif fieldType == "bool":
+            if str(value).lower() == "true" or str(value).lower() == "yes":
+                value = True
+            elif str(value).lower() == "false" or str(value).lower() == "no":
+                value = False
+        conditions.append(condition(field, op, fieldType, value))
+        error = False # reset the error from previous words
+
+    return (tuple(conditions),) + _parseOrder(spec, order, defaultOrder)
+
+def _parseOrder(spec: dict, order: str, defaultOrder: str):
+    """Turns a written order such as "exp DESC" into an ordering, as long
+    as the field is a valid field. Falls back to the default order if not,
+    which is given by the bot rather than a member and so is not checked.
+    Returns the ordering and whether the written order was used
+    """
+    if order != "none" and " " in order:
+        field, direction = order.split(" ", 1)
+        field = spec["shorthands"]["fields"].get(field, field)
+        if field in spec["fields"] and direction in ("ASC", "DESC"):
+            return ordering(field, direction), order != defaultOrder
+    if defaultOrder != "none":
+        return ordering(*defaultOrder.split(" ", 1)), False
+    return None, False
+
+@functools.lru_cache(maxsize=256)
+def compileFilter(table: str, args: str, defaultOrder: str="none", search: bool=True):
+    """Compiles a filter for the given table into a filterPlan.
+    Plans are cached by table, arguments and default order, so repeated
+    searches skip parsing. search is turned off if the table's full text
+    index can't be used. Raises a KeyError if the table can't be filtered,
+    or a ValueError if a value doesn't match its field
+    """
+    spec = FILTERS[table]
+    conditions, order, chosen = parseFilter(spec, args, defaultOrder)
+    dates = tuple(field for field, fieldType in spec["fieldTypes"].items() if fieldType == "date")
+    return filterPlan(conditions, order, spec.get("search") if search else None, table, not chosen, dates)
@@ -0,0 +1,198 @@
+#===============================================================================
+# This file holds the adapter used to make Google API requests without
+# holding up the bot.
+#
+# Every request made through googleapiclient blocks until Google answers,
+# so the requests are run on a small pool of threads instead of the event
+# loop, and the bot keeps answering discord while a sync is running. The
+# client's connections can't be shared between threads, so each thread
+# makes its requests through its own authorised connection.
+#
+# It also holds the batcher which collects the writes a sync makes to one
+# spreadsheet and sends them together.
+#===============================================================================
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import re
+import threading
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.http import MediaIoBaseDownload
+
+class asyncGoogle:
+    """Runs requests built from the Sheets and Drive services on a bounded
+    thread pool. Requests are built the usual way and passed in unexecuted:
+
+        result = await google.execute(sheets.spreadsheets().values().get(...))
+
+    Every request has a timeout. The connection of each thread stops waiting
+    on a silent socket after the timeout as well, so a request which timed
+    out doesn't hold its thread for long
+    """
+    def __init__(self, credentials, workers: int=4, timeout: float=30.0):
+        """Stores the credentials the requests are made with and creates the
+        threads. At most workers requests are made at once, and each one is
+        given up on after timeout seconds unless it is given its own timeout
+        """
+        self._logger = logging.getLogger('bot activity')
+        self._credentials = credentials
+        self._timeout = timeout
+        self._local = threading.local() # holds the connection of each thread
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="Google API")
+
+    def _http(self):
+        """Returns the connection of the current thread, creating it if it
+        does not exist yet. Only call this from the pool's threads
+        """
+        http = getattr(self._local, "http", None)
+        if http is None:
+            http = AuthorizedHttp(self._credentials, http=httplib2.Http(timeout=self._timeout))
+            self._local.http = http
+        return http
+
+    async def _run(self, timeout, func, *args):
+        """Runs func(*args) on the pool and waits up to timeout seconds for it"""
+        loop = asyncio.get_running_loop()
+        return await asyncio.wait_for(loop.run_in_executor(self._executor, func, *args),
+                                      self._timeout if timeout is None else timeout)
+
+    async def execute(self, request, timeout: float=None):
+        """Executes a request on the pool and returns its response.
+        Raises asyncio.TimeoutError if it takes longer than the timeout
+        """
+        return await self._run(timeout, lambda: request.execute(http=self._http()))
+
+    async def download(self, request, path: str, timeout: float=None):
+        """Downloads the media of a request, such as files().get_media(...),
+        into the file at path, one chunk at a time on the pool. A download
+        which fails or times out is deleted, so it is tried again next time
+        """
+        def download():
+            request.http = self._http()
+            with open(path, "wb") as file:
+                downloader = MediaIoBaseDownload(file, request)
+                done = False
+                while not done:
+                    status, done = downloader.next_chunk()
+                    self._logger.info("Google_async:download: Download %s", str(int(status.progress() * 100)))
+
+        try:
+            await self._run(timeout, download)
+        except BaseException:
+            if os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError: # still open in a thread which timed out
+                    pass
+            raise
+
+    def close(self):
+        """Stops the threads once the requests already started have finished"""
+        self._executor.shutdown(wait=True)
+
+# A range in A1 notation, such as "Members!A3:O" or "Members!B1:B1"
+_A1 = re.compile(r"^(?P<sheet>.+)!(?P<startCol>[A-Z]+)(?P<startRow>[0-9]+)(?::(?P<endCol>[A-Z]+)(?P<endRow>[0-9]*))?$")
+
+def _columnNumber(letters: str):
+    """Returns the number of a column from its letters, A being 1"""
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - ord("A") + 1
+    return number
+
+def _columnLetters(number: int):
+    """Returns the letters of a column from its number, A being 1"""
+    letters = ""
+    while number > 0:
+        number, remainder = divmod(number - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
+
+class sheetWrites:
+    """Collects the writes a sync makes to one spreadsheet, and sends them
+    all with flush() as a single values.batchUpdate followed by a single
+    values.batchClear, rather than a clear and an update for every range.
+
+    A range which is cleared and written again is queued with replace().
+    Its new rows are written over the old ones, padded with empty cells to
+    the width of the range, and only the old rows below them are cleared
+    afterwards, so the sheet is never left empty between the two requests.
+    Plain clears are sent after the updates, so they shouldn't overlap them
+    """
+    def __init__(self, google: asyncGoogle, sheetService, spreadsheetId: str):
+        self._google = google
+        self._sheetService = sheetService
+        self._spreadsheetId = spreadsheetId
+        self._updates = [] # {"range": ..., "values": ...} for each range written
+        self._clears = [] # the ranges cleared
+
+    def __len__(self):
+        """The number of writes waiting to be sent"""
+        return len(self._updates) + len(self._clears)
+
+    def clear(self, range_: str):
+        """Queues the clearing of a range"""
+        self._clears.append(range_)
+
+    def update(self, range_: str, values: list):
+        """Queues writing the rows in values to a range"""
+        if values:
+            self._updates.append({"range": range_, "values": values})
+
+    def updateAt(self, sheet: str, row: int, column: int, values: list):
+        """Queues writing the rows in values to a sheet, with the first
+        value at the given row and column, both counted from 1
+        """
+        if values:
+            first, last = _columnLetters(column), _columnLetters(column + max(len(cells) for cells in values) - 1)
+            self.update(f"{sheet}!{first}{row}:{last}{row + len(values) - 1}", values)
+
+    def replace(self, range_: str, values: list):
+        """Queues replacing everything in a range with the rows in values,
+        starting at its first row. The range must start with a row number,
+        such as "Members!A3:O". Raises ValueError if it doesn't
+        """
+        match = _A1.match(range_)
+        if match is None:
+            raise ValueError(f"can't replace the contents of range {range_}")
+        sheet, startCol, startRow, endCol, endRow = match.group("sheet", "startCol", "startRow", "endCol", "endRow")
+        endCol = endCol or startCol
+        startRow = int(startRow)
+        width = _columnNumber(endCol) - _columnNumber(startCol) + 1
+        
+        if values:
+            # Empty cells are written over whatever the old rows had past the end of
+            # the new ones. Rows wider than the range are written past its end
+            width = max(width, max(len(row) for row in values))
+            rows = [list(row) + [""] * (width - len(row)) for row in values]
+            lastCol = _columnLetters(_columnNumber(startCol) + width - 1)
+            self._updates.append({"range": f"{sheet}!{startCol}{startRow}:{lastCol}{startRow + len(rows) - 1}",
+                                  "values": rows})
+            endCol = lastCol
+        # Then the old rows left below the new ones are cleared
+        tail = startRow + len(values)
+        if not endRow or tail <= int(endRow):
+            self._clears.append(f"{sheet}!{startCol}{tail}:{endCol}{endRow}")
+
+    async def flush(self):
+        """Sends the queued writes, at most one batchUpdate and one batchClear,
+        and empties the queue. Returns a description of each range written or
+        cleared. If a request fails its exception is raised, and the writes
+        which weren't sent stay queued
+        """
+        values = self._sheetService.spreadsheets().values()
+        sent = []
+        if self._updates:
+            await self._google.execute(values.batchUpdate(spreadsheetId=self._spreadsheetId,
+                body={"valueInputOption": "RAW", "data": self._updates}))
+            sent.extend(f"wrote {len(update['values'])} rows to {update['range']}" for update in self._updates)
+            self._updates = []
+        if self._clears:
+            await self._google.execute(values.batchClear(spreadsheetId=self._spreadsheetId,
+                body={"ranges": self._clears}))
+            sent.extend(f"cleared {range_}" for range_ in self._clears)
+            self._clears = []
+        return sent
@@ -14,7 +14,8 @@ from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaIoBaseDownload
+# Runs the requests without holding up the bot
+from Google_async import asyncGoogle, sheetWrites
 
 # Basic Discord tools
 import discord
@@ -25,6 +26,82 @@ import dateparser
 # Used to handle the update cycle loop
 import asyncio
 import logging
+from Bot_logging import payload
+# Used to match submitted discord names to members
+from DB_migrations import memberNameKey
+
+# The ranges of the quests spreadsheet which hold quests, along with the
+# kind of sheet each one is and the rank of its quests (-1 if the quests
+# on the sheet say their own rank)
+QUEST_RANGES = (("Repeatable!A2:G", "repeatable", -1),
+                ("F Rank!A2:G", "ranked", 0), ("E Rank!A2:G", "ranked", 1), ("D Rank!A2:G", "ranked", 2),
+                ("C Rank!A2:G", "ranked", 3), ("B Rank!A2:G", "ranked", 4), ("A Rank!A2:G", "ranked", 5),
+                ("S Rank!A2:G", "ranked", 6), ("S+ Rank!A2:G", "ranked", 7),
+                ("Event Specific!A2:F", "special", -1))
+RANKS = {"F":0, "E":1, "D":2, "C":3, "B":4, "A":5, "S":6, "S+":7}
+
+def questFromRow(row: list, sheet: str, rank: int):
+    """Turns a row of one of the QUEST_RANGES into a quest tuple:
+    (number, name, description, rank, exp reward, gold reward, type).
+    Returns None if the row is too short to be a quest
+    """
+    if len(row) < 6:
+        return None
+    desc = row[2] + " - " + row[5]
+    notes = row[6] if len(row) > 6 else "" # requirements and tags of the quest
+    if sheet == "ranked":
+        questType = "heroic" if "Heroic" in notes else "ranked"
+    else:
+        if "Rank " in notes:
+            rank = RANKS[notes[notes.find("Rank ") + 5]] # Convert the letter after Rank to the given number
+        questType = sheet
+        if sheet == "special":
+            if "Heroic" in notes:
+                questType = questType + " - heroic"
+            if "Repeatable" in notes:
+                questType = questType + " - repeatable"
+    return (row[0], row[1], desc, rank, row[3], row[4], questType)
+
+# The Members sheet, which holds a row for each adventurer from its
+# first row down, with one column for each column of adventurers
+MEMBERS_SHEET = "Members"
+MEMBERS_FIRST_ROW = 3
+MEMBERS_COLUMNS = 15
+MEMBERS_RANGE = "Members!A3:O"
+
+def memberSheetRow(member):
+    """Turns a row of adventurers into its row on the Members sheet"""
+    row = ["" if value is None else value for value in member]
+    row[0] = str(row[0])
+    return row
+
+def memberSheetOrder(row: list):
+    """The order of the rows on the Members sheet: by last name, then ID"""
+    return (str(row[2]), int(row[0]))
+
+def memberSheetWrites(old: list, new: list, writes: sheetWrites):
+    """Queues the writes which turn the rows old on the Members sheet into
+    the rows new. Only the runs of cells which changed in each row are
+    written, and the rows left past the end of new are cleared. Returns
+    the number of cells written
+    """
+    cells = 0
+    for index, row in enumerate(new):
+        before = old[index] if index < len(old) else []
+        column = 0
+        while column < len(row):
+            if column < len(before) and before[column] == row[column]:
+                column += 1
+                continue
+            end = column + 1
+            while end < len(row) and not (end < len(before) and before[end] == row[end]):
+                end += 1
+            writes.updateAt(MEMBERS_SHEET, MEMBERS_FIRST_ROW + index, column + 1, [row[column:end]])
+            cells += end - column
+            column = end
+    if len(old) > len(new):
+        writes.clear(f"{MEMBERS_SHEET}!A{MEMBERS_FIRST_ROW + len(new)}:O{MEMBERS_FIRST_ROW + len(old) - 1}")
+    return cells
 
 class google_interact(commands.Cog):
     """Handles any bot action which involves
@@ -38,6 +115,11 @@ class google_interact(commands.Cog):
         """
         self._bot = bot
         self._logger = logging.getLogger('bot activity')
+        # The rows last written to the Members sheet, which the next
+        # update is compared against. None until they are written in full
+        self._membersSheet = None
+        self._membersLock = asyncio.Lock()
+        self._leftMembers = [] # members no longer in the server, see leftMembers
         self.setupAPI()
         
         self.updateTimer.start()
@@ -87,9 +169,18 @@ class google_interact(commands.Cog):
         # and store the IDs for the quest spreadsheets
         self._sheetService = build("sheets", "v4", credentials=creds)
         self._driveService = build("drive", "v3", credentials=creds)
+        # The services only build the requests; they are made on the adapter's
+        # threads, so a sync never stops the bot from answering discord
+        self._google = asyncGoogle(creds)
         self._spreadsheetID = ("1cst4m3t9BXADFpFbqZYmK7MPCaFrZ3Pq0Qz_sHxA0kw",
                                "1AtJ4sc7DvVHpuU0YWaWUVyPe0vB2gOKVPlOfraT8_Sc",
                                "1Es7IgyfmyJDxZ53aBZ_Sjqlw2-r3bv03rUhjnT3dT0M")
+    
+    def close(self):
+        """Stops the Google request threads once the requests already
+        started have finished. Used once the bot has shut down
+        """
+        self._google.close()
         
     async def updateSelf(self):
         """Updates the database using info from the
@@ -100,15 +191,16 @@ class google_interact(commands.Cog):
         range_ = "Pending Quests submits!A3:L"
         
         try:
-            result = self._sheetService.spreadsheets().values().get(
-                        spreadsheetId=self._spreadsheetID[0], range=range_).execute()
+            result = await self._google.execute(self._sheetService.spreadsheets().values().get(
+                        spreadsheetId=self._spreadsheetID[0], range=range_))
         except Exception as e:
             self._logger.error("Google_interactions:updateSelf:Get Error: %s in master %s", str(e), range_)
             return
                 
         rows = result.get("values", [])
-        self._logger.info("Google_interactions:updateSelf: gathered %s items from master %s\n%s", str(len(rows)), range_, str(rows))
+        self._logger.info("Google_interactions:updateSelf: gathered %s items from master %s\n%s", str(len(rows)), range_, payload(rows))
         unreviewed = [] # Used to track items which need to be returned
+        approved = [] # Approved items, which are all added to the members' logs at once
         
         for row in rows: # for each item
             if len(row) == 10: # If the row does not have an item in the "approved" column
@@ -116,99 +208,104 @@ class google_interact(commands.Cog):
             elif row[10].upper() == "SUBMISSION ERROR": # If it was previously returned because of an error
                 unreviewed.append(row) # Return it to the spreadsheet
             elif row[10].upper() == "YES": # If it was approved
-                complete = await self._db.questSubmit(int(row[0]), int(row[3]), row[9]) # Try to add it to the user's log
-                if not complete: # If it did not add,
-                    # return it to the spreadsheet
-                    row[10] = "SUBMISSION ERROR"
-                    unreviewed.append(row)
+                approved.append(row)
             # If it was rejected, it is simply ignored
+        
+        # Try to add the approved items to the users' logs
+        failed = await self._db.questSubmitBatch(approved)
+        for row in failed: # If any did not add,
+            # return them to the spreadsheet
+            row[10] = "SUBMISSION ERROR"
+            unreviewed.append(row)
 
+        # The unreviewed items replace the old submissions. Every write to
+        # the master sheet is sent together once the members are updated
+        master = sheetWrites(self._google, self._sheetService, self._spreadsheetID[0])
+        master.replace(range_, unreviewed)
+        self._logger.info("Google_interactions:updateSelf: returning %s items to %s\n%s", str(len(unreviewed)), range_, payload(unreviewed))
         try:
-            # Clear the old submissions
-            errorType = "Clear"
-            self._sheetService.spreadsheets().values().clear(
-                spreadsheetId=self._spreadsheetID[0], range=range_).execute()
-            self._logger.info("Google_interactions:updateSelf: cleared all items from master %s", range_)
-            if unreviewed != []: # if there are items to be returned
-                # Send the items back to the spreadsheet
-                body = {"values":unreviewed}
-                valueInput="RAW"
-                errorType = "Update"
-                self._sheetService.spreadsheets().values().update(
-                    spreadsheetId=self._spreadsheetID[0], range=range_,
-                    valueInputOption=valueInput, body=body).execute()
-                self._logger.info("Google_interactions:updateSelf: added %s items to %s\n%s", str(len(unreviewed)), range_, str(unreviewed))
-        except Exception as e:
-            self._logger.error("Google_interactions:updateSelf:%s Error: %s in master %s", errorType, str(e), range_)
-            return
-            
+            await self._updateMembers(master)
+        finally:
+            await self._sendWrites(master, "updateSelf", "master")
+    
+    async def _updateMembers(self, master: sheetWrites):
+        """Updates the database with the member edits put into the master
+        spreadsheet. The edits are only reset on master, by queueing the
+        writes on the given batch, once all of them were made
+        """
         # updating the member database
         range_ = "Members!A:P"
         
         # Grab the items from the spreadsheet
         try:
-            result = self._sheetService.spreadsheets().values().get(
-                    spreadsheetId=self._spreadsheetID[0], range=range_).execute()
+            result = await self._google.execute(self._sheetService.spreadsheets().values().get(
+                    spreadsheetId=self._spreadsheetID[0], range=range_))
         except Exception as e:
             self._logger.error("Google_interactions:updateSelf:Get Error: %s in master %s", str(e), range_)
             return
                 
         rows = result.get("values", [])
-        self._logger.info("Google_interactions:updateSelf: gathered %s items from master %s\n%s", str(len(rows)), range_, str(rows))
+        self._logger.info("Google_interactions:updateSelf: gathered %s items from master %s\n%s", str(len(rows)), range_, payload(rows))
         
         if rows[0][1].upper() == "YES": # If there were edits put into the sheet
-            # Reset the edited field to "NO"
-            try:
-                self._sheetService.spreadsheets().values().update(
-                    spreadsheetId=self._spreadsheetID[0], range="Members!B1:B1",
-                    valueInputOption="RAW", body={"values" : [["NO"]]}).execute()
-            except Exception as e:
-                self._logger.error("Google_interactions:updateSelf:Update Error: %s in master Members!B1:B1", str(e))
-                return
-            else:
-                self._logger.info("Google_interactions:updateSelf: set master Members!B1:B1 to 'NO'")
-                
             for row in rows[2:]: # For each member
-                # Get the member's info from discord
                 memberId = int(row[0])
-                member = self._guildRef.get_member(memberId)
                 if len(row) == 16: # If there are items in the edits column
                     editField = row[15] # Grab the edits
                     if editField.lower() == "remove": # If they are being removed, send to delete method
                         await self._db.deleteMember(memberId)
                     else:
-                        # Split the edits by commas, add a change to update the member's discord name,
-                        # then send the request to the database
+                        # Split the edits by commas, then send the request to the database
                         editField = editField.split(",")
-                        editField.append("discordname:'" + member.name + "#" + member.discriminator)
-                        await self._db.editMemberItems(memberId, editField)
-                        # Check to ensure the level of the member did not become outdated
-                        await self._db.checkMemberLevel(memberId)
+                        # The edits and the level check are committed together
+                        async with self._db.unitOfWork():
+                            await self._db.editMemberItems(memberId, editField)
+                            # Check to ensure the level of the member did not become outdated
+                            await self._db.checkMemberLevel(memberId)
                 else: # If no edits were made to the item
-                    # Update the member's discord name, then
                     # Check the member's level and rank
-                    editField = ["discordname:'" + member.name + "#" + member.discriminator,]
-                    await self._db.editMemberItems(memberId, editField)
                     await self._db.checkMemberLevel(memberId)
             
-            # Clear the old edits
-            range_ = "Members!P3:P"
-            try:
-                self._sheetService.spreadsheets().values().clear(
-                    spreadsheetId=self._spreadsheetID[0], range=range_).execute()
-            except Exception as e:
-                self._logger.error("Google_interactions:updateSelf:Clear Error: %s in master %s", str(e), range_)
-                return
-            else:
-                self._logger.info("Google_interactions:updateSelf: cleared all items from master %s", range_)
-
-        else: # If no edits were made,
-            # Update each member's discord name in the database
-            for row in rows[2:]:
-                memberId = int(row[0])
-                member = self._guildRef.get_member(memberId)
-                editField = ["discordname:'" + member.name + "#" + member.discriminator,]
-                await self._db.editMemberItems(memberId, editField)
+            # Once every edit is made, reset the edited field
+            # to "NO" and clear the old edits
+            master.update("Members!B1:B1", [["NO"]])
+            master.clear("Members!P3:P")
+        
+        # Update each member's discord name in the database. This comes after the
+        # edits, so the name on discord replaces any name put into the sheet
+        await self._refreshDiscordNames()
+    
+    async def _refreshDiscordNames(self):
+        """Brings the discord name stored for every member up to date with the
+        server. The names are compared in memory and only the ones which changed
+        are written, all at once. Members who are no longer in the server are
+        reported rather than changed, and kept for leftMembers
+        """
+        names = await self._db.fetchDiscordNames()
+        if names == "error":
+            return
+        changed = {}
+        left = []
+        for memberId, storedName in names.items():
+            member = self._guildRef.get_member(int(memberId))
+            if member is None:
+                left.append(memberId)
+                continue
+            name = member.name + "#" + member.discriminator
+            if name != storedName:
+                changed[memberId] = name
+        
+        self._leftMembers = left
+        if left != []:
+            self._logger.warning("Google_interactions:updateSelf: %s member(s) are no longer in the server\n%s", str(len(left)), payload(left))
+        if await self._db.updateDiscordNames(changed):
+            self._logger.info("Google_interactions:updateSelf: updated %s of %s discord names", str(len(changed)), str(len(names)))
+    
+    def leftMembers(self):
+        """Returns the IDs of the members who were no longer in
+        the server when the discord names were last updated
+        """
+        return list(self._leftMembers)
                 
     async def updateQuests(self):
         """Updates the assorted items which are related to
@@ -216,89 +313,15 @@ class google_interact(commands.Cog):
         and taking quest submissions to put into the master sheet
         """
         # collect quests and put into database
-        ranks = {"F":0, "E":1, "D":2, "C":3, "B":4, "A":5, "S":6, "S+":7}
-        quests = []
-        # Repeatable Quests
-        range_ = "Repeatable!A2:G"
-        questType = "repeatable"
-        try:
-            result = self._sheetService.spreadsheets().values().get(
-                spreadsheetId=self._spreadsheetID[1], range=range_).execute()
-        except Exception as e:
-            self._logger.error("Google_interactions:updateQuests:Get Error: %s in quests %s", str(e), range_)
+        quests = await self._readQuests()
+        if quests is None:
             return
         
-        rows = result.get("values", [])
-        self._logger.info("Google_interactions:updateQuests: Gathered %s items from quests %s\n%s", str(len(rows)), range_, str(rows))
-        for row in rows:
-            if len(row) >= 6:
-                desc = row[2] + " - " + row[5]
-                rank = -1
-                if len(row) > 6:
-                    if "Rank " in row[6]:
-                        rank = row[6][row[6].find("Rank ") + 5] # Find the letter after Rank
-                        rank = ranks[rank] # Convert the letter to the given number
-                
-                quests.append((row[0], row[1], desc, rank, row[3], row[4], questType))
-        
-        # Ranked Quests
-        ranges = ("F Rank!A2:G", "E Rank!A2:G", "D Rank!A2:G",
-                  "C Rank!A2:G", "B Rank!A2:G", "A Rank!A2:G",
-                  "S Rank!A2:G", "S+ Rank!A2:G")
-        
-        for i in range(len(ranges)):
-            range_ = ranges[i]
-            rank = i
-            try:
-                result = self._sheetService.spreadsheets().values().get(
-                    spreadsheetId=self._spreadsheetID[1], range=range_).execute()
-            except Exception as e:
-                self._logger.error("Google_interactions:updateQuests:Get Error: %s in quests %s", str(e), range_)
-                return
-                
-            rows = result.get("values", [])
-            self._logger.info("Google_interactions:updateQuests: Gathered %s items from quests %s\n%s", str(len(rows)), range_, str(rows))
-            for row in rows:
-                if len(row) >= 6:
-                    desc = row[2] + " - " + row[5]
-                    questType = "ranked"
-                    if len(row) > 6:
-                        if "Heroic" in row[6]:
-                            questType = "heroic"
-                
-                    quests.append((row[0], row[1], desc, rank, row[3], row[4], questType))
-                
-        # Special Quests
-        range_ = "Event Specific!A2:F"
-        try:
-            result = self._sheetService.spreadsheets().values().get(
-                spreadsheetId=self._spreadsheetID[1], range=range_).execute()
-        except Exception as e:
-            self._logger.error("Google_interactions:updateQuests:Get Error: %s in quests %s", str(e), range_)
-            return
-        
-        rows = result.get("values", [])
-        self._logger.info("Google_interactions:updateQuests: Gathered %s items from quests %s\n%s", str(len(rows)), range_, str(rows))
-        for row in rows:
-            if len(row) >= 6:
-                desc = row[2] + " - " + row[5]
-                rank = -1
-                questType = "special"
-                if len(row) > 6:
-                    if "Rank " in row[6]:
-                        rank = row[6][row[6].find("Rank ") + 5] # Find the letter after Rank
-                        rank = ranks[rank] # Convert the letter to the given number
-                    if "Heroic" in row[6]:
-                        questType = questType + " - heroic"
-                    if "Repeatable" in row[6]:
-                        questType = questType + " - repeatable"
-                
-                quests.append((row[0], row[1], desc, rank, row[3], row[4], questType))
-        
         # Send all the quests to the database
-        complete = await self._db.loadQuests(quests)
-        if not complete:
-            self._logger.critical("Google_interactions:updateQuests:Error: Could not upload quests to database\n%s", str(quests))
+        # Only the quests which changed are written
+        changes = await self._db.loadQuests(quests)
+        if changes is False:
+            self._logger.critical("Google_interactions:updateQuests:Error: Could not upload quests to database\n%s", payload(quests))
         
         # collect the quest images
         # driveIDs are the ids for each folder that has posters,
@@ -320,11 +343,11 @@ class google_interact(commands.Cog):
             page_token=None
             while True:
                 try:
-                    response = self._driveService.files().list(q=query,
+                    response = await self._google.execute(self._driveService.files().list(q=query,
                                                            spaces='drive',
                                                            fields='nextPageToken, '
                                                            'files(id, name)',
-                                                           pageToken=page_token).execute()
+                                                           pageToken=page_token))
                 except Exception as e:
                     print(e)
                     #logging
@@ -335,22 +358,16 @@ class google_interact(commands.Cog):
                 if page_token is None:
                     break
                 
-            self._logger.info("Google_interactions:updateQuests: found %s total items in drive %s\n%s", str(len(files)), rank, str(files))
+            self._logger.info("Google_interactions:updateQuests: found %s total items in drive %s\n%s", str(len(files)), rank, payload(files))
             for file in files:
                 fileName = file.get("name")
                 fileID = file.get("id")
                 if not os.path.exists(f"./questPics/{rank}/{fileName}"):
                     self._logger.info("Google_interactions:updateQuests: new file found; downloading image %s - ID %s", fileName, fileID)
                     try:
+                        # The chunks are downloaded on the adapter's threads
                         request = self._driveService.files().get_media(fileId=fileID)
-                    
-                        with open(f"./questPics/{rank}/{fileName}", "wb") as file:
-                            downloader = MediaIoBaseDownload(file, request)
-                            done = False
-                            while not done:
-                                status, done = downloader.next_chunk()
-                                self._logger.info("Google_interactions:updateQuests: Download %s", str(int(status.progress() * 100)))
-                            
+                        await self._google.download(request, f"./questPics/{rank}/{fileName}", timeout=120.0)
                     except Exception as e:
                         self._logger.error("Google_interactions:updateQuests:Downloader Error: %s for file %s in drive %s", str(e), fileName, rank)
                     else:
@@ -359,53 +376,93 @@ class google_interact(commands.Cog):
         # updating the announcements
         range_ = "Quests to announce!A2:D"
         try:
-            result = self._sheetService.spreadsheets().values().get(
-                    spreadsheetId=self._spreadsheetID[0], range=range_).execute()
+            result = await self._google.execute(self._sheetService.spreadsheets().values().get(
+                    spreadsheetId=self._spreadsheetID[0], range=range_))
         except Exception as e:
             self._logger.error("Google_interactions:updateQuests:Get Error: %s in master %s", str(e), range_)
             return
         
         rows = result.get("values", [])    
-        self._logger.info("Google_interactions:updateQuests: gathered %s items from master %s\n%s", str(len(rows)), range_, str(rows))
+        self._logger.info("Google_interactions:updateQuests: gathered %s items from master %s\n%s", str(len(rows)), range_, payload(rows))
         if rows != []:
             await self._announce.addAnnouncements(rows)
             
-        # clear old announcements
+        # The old announcements are cleared along with the
+        # other writes to master once the submissions are sorted
+        master = sheetWrites(self._google, self._sheetService, self._spreadsheetID[0])
+        submissionWrites = sheetWrites(self._google, self._sheetService, self._spreadsheetID[2])
+        master.clear(range_)
         try:
-            self._sheetService.spreadsheets().values().clear(
-                    spreadsheetId=self._spreadsheetID[0], range=range_).execute()
+            await self._sortSubmissions(master, submissionWrites)
+        finally:
+            await self._sendWrites(master, "updateQuests", "master")
+    
+    async def _readQuests(self):
+        """Reads every quest sheet in the QUEST_RANGES with a single request
+        and returns the quests on them, or None if they could not be read
+        """
+        ranges = [range_ for range_, sheet, rank in QUEST_RANGES]
+        try:
+            result = await self._google.execute(self._sheetService.spreadsheets().values().batchGet(
+                spreadsheetId=self._spreadsheetID[1], ranges=ranges))
         except Exception as e:
-            self._logger.error("Google_interactions:updateQuests:Clear Error: %s in master %s", str(e), range_)
-            return
-        else:
-            self._logger.info("Google_interactions:updateQuests: cleared all items from master %s", range_)
-        
+            self._logger.error("Google_interactions:updateQuests:Get Error: %s in quests %s", str(e), str(ranges))
+            return None
+        
+        valueRanges = result.get("valueRanges", [])
+        if len(valueRanges) != len(QUEST_RANGES):
+            # Loading a partial list would delete the quests of the missing sheets
+            self._logger.error("Google_interactions:updateQuests:Get Error: got %s of %s ranges from quests", str(len(valueRanges)), str(len(QUEST_RANGES)))
+            return None
+        quests = []
+        # The ranges are returned in the order they were asked for
+        for (range_, sheet, rank), valueRange in zip(QUEST_RANGES, valueRanges):
+            rows = valueRange.get("values", [])
+            self._logger.info("Google_interactions:updateQuests: Gathered %s items from quests %s\n%s", str(len(rows)), range_, payload(rows))
+            for row in rows:
+                quest = questFromRow(row, sheet, rank)
+                if quest is not None:
+                    quests.append(quest)
+        return quests
+    
+    async def _sortSubmissions(self, master: sheetWrites, submissionWrites: sheetWrites):
+        """Moves the quest submissions into the pending quest submissions
+        sheet on master and returns the ones which could not be parsed to
+        the submissions sheet. The submissions are only replaced once the
+        new quests were added to master
+        """
         # collect submissions and put into the approval spreadsheet
         range_ = "Form Responses 1!A2:R"
         questlist = [] # quests that can be added
         failedQuests = [] # quests with submission errors
         try:
-            file = self._sheetService.spreadsheets().values().get(
-                spreadsheetId=self._spreadsheetID[2], range=range_).execute()
+            file = await self._google.execute(self._sheetService.spreadsheets().values().get(
+                spreadsheetId=self._spreadsheetID[2], range=range_))
             
             submissions = file.get("values", [])
-            self._logger.info("Google_interactions:updateQuests: gathered %s items from submissions %s\n%s", len(submissions), range_, str(submissions))
+            self._logger.info("Google_interactions:updateQuests: gathered %s items from submissions %s\n%s", len(submissions), range_, payload(submissions))
         except Exception as e:
             self._logger.error("Google_interactions:updateQuests:Get Error: %s in submissions %s", str(e), range_)
             return
         
+        # Every member's name is gathered once, and each submission is matched from it
+        memberNames = await self._db.fetchMemberNames()
+        if memberNames == "error":
+            self._logger.error("Google_interactions:updateQuests:Get Error: could not gather member names for submissions")
+            return
+        
         for submit in submissions:
             if len(submit) < 18:
                 continue
             quest = []
             # Search for the member based on their discord name
             # If not found return the submission and quit
-            memInfo = await self._db.fetchMemberName(submit[17])
-            if memInfo == "error" or memInfo == "none found":
+            memberId = memberNames.get(memberNameKey(submit[17]))
+            if memberId is None:
                 self._logger.warning("Google_interactions:updateQuests:Quit Warning: Member %s could not be found for quest submission", submit[17])
                 failedQuests.append(submit)
                 continue
-            quest.append(str(memInfo[0])) # Member ID
+            quest.append(str(memberId)) # Member ID
             quest.append(submit[1]) # Member Name
             quest.append(submit[2].lower()) # Quest Type
             
@@ -463,194 +520,145 @@ class google_interact(commands.Cog):
             questlist.append(quest) # add to the return list
             
         if questlist != []: # if at least one quest was successfully parsed
-            # add them to the pending quest submissions sheet in the master spreadsheet
+            # add them to the pending quest submissions sheet in the master spreadsheet.
+            # This is an append to the items being reviewed, so it can't be batched
             range_="Pending Quests submits!A3:J"
             values = {"values":questlist}
             
             try:
-                result = self._sheetService.spreadsheets().values().append(
+                result = await self._google.execute(self._sheetService.spreadsheets().values().append(
                     spreadsheetId=self._spreadsheetID[0], range=range_,
-                    valueInputOption="RAW", body=values).execute()
+                    valueInputOption="RAW", body=values))
             except Exception as e:
                 self._logger.error("Google_interactions:updateQuests:Append Error: %s in master %s", str(e), range_)
                 return
             else:
-                self._logger.info("Google_interactions:updateQuests: added %s items to master %s\n%s", str(len(questlist)), range_, str(questlist))
-        
-        # Clear the added submissions and return the failed parsed quests
-        range_ = "Form Responses 1!A2:R"
-        try:
-            self._sheetService.spreadsheets().values().clear(
-                spreadsheetId=self._spreadsheetID[2], range=range_).execute()
-        except Exception as e:
-            self._logger.error("Google_interactions:updateQuests:Clear Error: %s in submissions %s", str(e), range_)
-            return
-        else:
-            self._logger.info("Google_interactions:updateQuests: cleared all items in submissions %s", range_)
-            
-        if failedQuests != []: # If at least one failed
-            # Record the amount of failed submissions
-            # to add to the pending quest submissions sheet
-            failed = len(failedQuests)
-            values = {"values":failedQuests}
-            try:
-                sheet = "master" # for logging purposes
-                self._sheetService.spreadsheets().values().update(
-                    spreadsheetId=self._spreadsheetID[2], range=range_,
-                    valueInputOption="RAW", body=values).execute()
-                self._logger.info("Google_interactions:updateQuests: added %s items to submissions %s\n%s", str(len(failedQuests)), range_, str(failedQuests))
-                    
-                range_ = "Pending Quests submits!M1:M1" # for logging purposes
-                sheet = "submissions"
-                self._sheetService.spreadsheets().values().update(
-                    spreadsheetId=self._spreadsheetID[0], range=range_,
-                    valueInputOption="RAW", body={"values":[[str(failed)]]}).execute()
-                self._logger.info("Google_interactions:updateQuests: set submissions %s to value %s", range_, str(failed))
-            except Exception as e:
-                self._logger.error("Google_interactions:updateQuests:Update Error: %s in %s %s", str(e), sheet, range_)
-                return
-        
-        else: # if no failures, update the value to be 0
-            try:
-                self._sheetService.spreadsheets().values().update(
-                    spreadsheetId=self._spreadsheetID[0], range="Pending Quests submits!M1:M1",
-                    valueInputOption="RAW", body={"values":[["0"]]}).execute()
-            except Exception as e:
-                self._logger.error("Google_interactions:updateQuests:Update Error: %s in submissions Pending Quests submits!M1:M1", str(e))
-                return
-            else:
-                self._logger.info("Google_interactions:updateQuests: set submissions Pending Quests submits!M1:M1 to value 0")
+                self._logger.info("Google_interactions:updateQuests: added %s items to master %s\n%s", str(len(questlist)), range_, payload(questlist))
+        
+        # Replace the added submissions with the failed parsed quests,
+        # and record the amount of failed submissions on master
+        submissionWrites.replace("Form Responses 1!A2:R", failedQuests)
+        self._logger.info("Google_interactions:updateQuests: returning %s items to submissions Form Responses 1!A2:R\n%s", str(len(failedQuests)), payload(failedQuests))
+        if await self._sendWrites(submissionWrites, "updateQuests", "submissions"):
+            master.update("Pending Quests submits!M1:M1", [[str(len(failedQuests))]])
     
     async def updateSpreadsheet(self):
         """Update the master spreadsheet with information from
         the database, which is primarily targeted at the member
         and current pending announcements spreadsheets
         """
-        # Update members spreadsheet
-        range_ = "Members!A3:O"
-        valueInput = "RAW"
-        
-        # Get all the items in the adventurers table from the database
-        values = await self._db.getFromTableFilter("adventurers", order="lastname ASC")
-        if values == "error":
-            return
-        else:
-            for i in range(len(values)):
-                temp = list(values[i])
-                temp[0] = str(temp[0])
-                values[i] =  temp
-        
-        body = {
-            "values" : values
-            }
-        # Remove the old information and send the new data
-        try:
-            errorType = "Clear"
-            self._sheetService.spreadsheets().values().clear(
-                spreadsheetId=self._spreadsheetID[0], range=range_).execute()
-            self._logger.info("Google_interactions:updateSpreadsheet: cleared all items from master %s", range_)
+        async with self._membersLock:
+            master = sheetWrites(self._google, self._sheetService, self._spreadsheetID[0])
+            # Update members spreadsheet
+            members = await self._queueMembers(master)
+            if members is None:
+                return
+            rows, lastChange = members
             
-            errorType = "Update"
-            self._sheetService.spreadsheets().values().update(
-                spreadsheetId=self._spreadsheetID[0], range=range_,
-                valueInputOption=valueInput, body=body).execute()
-            self._logger.info("Google_interactions:updateSpreadsheet: added %s items to master %s\n%s", str(len(values)), range_, str(values))
-        except Exception as e:
-            self._logger.error("Google_interactions:updateSpreadsheet:%s Error: %s in master %s", errorType, str(e), range_)
-            return
+            # Update pending announcements
+            values = await self._announce.get_all() # get_all returns a 2D nested list
+            # Index 0 is weekly quests
+            range_ = "Announcement List!A3:B"
+            master.replace(range_, values[0])
+            self._logger.info("Google_interactions:updateSpreadsheet: writing %s items to master %s\n%s", str(len(values[0])), range_, payload(values[0]))
             
-        # Update pending announcements
-        values = await self._announce.get_all() # get_all returns a 2D nested list
-        # Index 0 is weekly quests
-        range_ = "Announcement List!A3:B"
-        body = {
-            "values" : values[0]
-            }
-        
-        try:
-            errorType = "Clear"
-            self._sheetService.spreadsheets().values().clear(
-                    spreadsheetId=self._spreadsheetID[0], range=range_).execute()
-            self._logger.info("Google_interactions:updateSpreadsheet: cleared all items from master %s", range_)
-                    
-            errorType = "Append"
-            self._sheetService.spreadsheets().values().append(
-                            spreadsheetId=self._spreadsheetID[0], range=range_,
-                            valueInputOption=valueInput, body=body).execute()
-            self._logger.info("Google_interactions:updateSpreadsheet: added %s items to master %s\n%s", str(len(values[0])), range_, str(values[0]))
-        except Exception as e:
-            self._logger.error("Google_interactions:updateSpreadsheet:%s Error: %s in master %s", errorType, str(e), range_)
-            return
-        
-        # Index 1 is event quests
-        range_ = "Announcement List!D3:F"
-        body = {
-            "values" : values[1]
-            }
+            # Index 1 is event quests
+            range_ = "Announcement List!D3:F"
+            master.replace(range_, values[1])
+            self._logger.info("Google_interactions:updateSpreadsheet: writing %s items to master %s\n%s", str(len(values[1])), range_, payload(values[1]))
+            
+            if await self._sendWrites(master, "updateSpreadsheet", "master"):
+                self._membersSheet = rows
+                await self._db.clearMemberChanges(lastChange)
+            else:
+                # The sheet may hold some of the writes, so it is written in full next time
+                self._membersSheet = None
+    
+    async def _queueMembers(self, master: sheetWrites):
+        """Queues the writes which bring the Members sheet up to date with the
+        database, and returns the rows it will hold along with the last member
+        change they include, or None if the members could not be gathered.
+        
+        Only the members changed since the last update are read, and only the
+        cells which changed are written. Every member is written again if the
+        sheet wasn't written since the bot started, the database asks for it,
+        or the members on the sheet are no longer the rows last written there
+        """
+        changes = await self._db.fetchMemberChanges()
+        if changes == "error":
+            return None
+        lastChange, changed = changes
+        
+        if changed is not None and self._membersSheet is not None:
+            # Check the sheet still holds the members it was last given, in the same rows
+            range_ = f"{MEMBERS_SHEET}!A{MEMBERS_FIRST_ROW}:A"
+            try:
+                result = await self._google.execute(self._sheetService.spreadsheets().values().get(
+                    spreadsheetId=self._spreadsheetID[0], range=range_))
+            except Exception as e:
+                self._logger.error("Google_interactions:updateSpreadsheet:Get Error: %s in master %s", str(e), range_)
+                return None
+            ids = [row[0] if row else "" for row in result.get("values", [])]
+            if ids == [row[0] for row in self._membersSheet]:
+                members = {int(row[0]): row for row in self._membersSheet}
+                for memberId, member in changed.items():
+                    if member is None:
+                        members.pop(int(memberId), None)
+                    else:
+                        members[int(memberId)] = memberSheetRow(member)
+                rows = sorted(members.values(), key=memberSheetOrder)
+                if all(len(row) == MEMBERS_COLUMNS for row in rows):
+                    cells = memberSheetWrites(self._membersSheet, rows, master)
+                    self._logger.info("Google_interactions:updateSpreadsheet: writing %s changed cells for %s changed members to master %s",
+                                      str(cells), str(len(changed)), MEMBERS_RANGE)
+                    return rows, lastChange
+            self._logger.warning("Google_interactions:updateSpreadsheet: master %s no longer matches the rows last written to it, writing every member", MEMBERS_RANGE)
         
-        try:
-            errorType = "Clear"
-            self._sheetService.spreadsheets().values().clear(
-                    spreadsheetId=self._spreadsheetID[0], range=range_).execute()
-            self._logger.info("Google_interactions:updateSpreadsheet: cleared all items from master %s", range_)
-                    
-            errorType = "Append"
-            self._sheetService.spreadsheets().values().append(
-                            spreadsheetId=self._spreadsheetID[0], range=range_,
-                            valueInputOption=valueInput, body=body).execute()
-            self._logger.info("Google_interactions:updateSpreadsheet: added %s items to master %s\n%s", str(len(values[0])), range_, str(values[0]))
-        except Exception as e:
-            self._logger.error("Google_interactions:updateSpreadsheet:%s Error: %s in master %s", errorType, str(e), range_)
-            return
+        # Get all the items in the adventurers table from the database
+        values = await self._db.getFromTableFilter("adventurers")
+        if values == "error":
+            return None
+        rows = sorted((memberSheetRow(member) for member in values), key=memberSheetOrder)
+        # The new information replaces the old
+        master.replace(MEMBERS_RANGE, rows)
+        self._logger.info("Google_interactions:updateSpreadsheet: writing %s items to master %s\n%s", str(len(rows)), MEMBERS_RANGE, payload(rows))
+        return rows, lastChange
         
     async def uploadSpreadsheet(self, memberId):
         """Uploads a member's quest log to the
         Member Quest Log sheet in the master spreadsheet.
         """
         range_ = "Member Quest Log!A2:C2"
-        valueInput = "RAW"
         member = await self._db.fetchMember(memberId)
         if member == "none found" or member == "error":
             self._logger.warning("Google_interactions:uploadSpreadsheet:Quit Warning: member %s could not be found in database", str(memberId))
             return
         
         values = [[str(memberId), member[1], datetime.datetime.today().strftime("%d/%m/%Y")]]
-        body = {
-            "values" : values
-            }
+        master = sheetWrites(self._google, self._sheetService, self._spreadsheetID[0])
+        master.update(range_, values)
         
-        try:
-            self._sheetService.spreadsheets().values().update(
-                spreadsheetId=self._spreadsheetID[0], range=range_,
-                valueInputOption=valueInput, body=body).execute()
-        except Exception as e:
-            self._logger.error("Google_interactions:uploadSpreadsheet:Update Error: %s in master %s", str(e), range_)
+        range_ = "Member Quest Log!A4:G"
+        values = await self._db.getFromTableFilter("questLog", order="number ASC", memberId=memberId)
+        if values == "error":
             return False
-        else:
-            self._logger.info("Google_interactions:uploadSpreadsheet: updated master %s with items %s", range_, str(values))
+        master.replace(range_, values)
+        self._logger.info("Google_interactions:uploadSpreadsheet: writing %s items to master %s\n%s", str(len(values)), range_, payload(values))
         
-        range_ = "Member Quest Log!A4:G"
-        dbname = str(memberId) + "questLog"
-        values = await self._db.getFromTableFilter(dbname, order="number ASC")
-        body = {
-            "values" : values
-            }
+        return await self._sendWrites(master, "uploadSpreadsheet", "master")
         
+    async def _sendWrites(self, writes: sheetWrites, method: str, sheet: str):
+        """Sends the writes a sync batched for a spreadsheet and logs them.
+        Returns False if they could not be sent
+        """
+        if len(writes) == 0:
+            return True
         try:
-            errorType = "Clear"
-            self._sheetService.spreadsheets().values().clear(
-                spreadsheetId=self._spreadsheetID[0], range=range_).execute()
-            self._logger.info("Google_interactions:uploadSpreadsheet: cleared all items from master %s", range_)
-            
-            errorType = "Append"
-            self._sheetService.spreadsheets().values().append(
-                spreadsheetId=self._spreadsheetID[0], range=range_,
-                valueInputOption=valueInput, body=body).execute()
-            self._logger.info("Google_interactions:uploadSpreadsheet: added %s items to master %s\n%s", str(len(values)), range_, str(values))
+            sent = await writes.flush()
         except Exception as e:
-            self._logger.error("Google_interactions:uploadSpreadsheet:%s Error: %s in master %s", errorType, str(e), range_)
+            self._logger.error("Google_interactions:%s:Batch Error: %s in %s", method, str(e), sheet)
             return False
-            
+        self._logger.info("Google_interactions:%s: sent the writes to %s\n%s", method, sheet, "\n".join(sent))
         return True
         
     async def runUpdate(self):
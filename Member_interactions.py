@@ -56,15 +56,6 @@ class memb_interact (commands.Cog) :
                 item = item.split(" - ")
                 if item != ['']:
                     self._rolesref[item[0]] = self._guildRef.get_role(int(item[1]))
-        # level exp requirements reference
-        self._levelref = {}
-        with open("./references/levels.txt", "r") as file:
-            file.readline()
-            levelList = file.read().split("\n")
-            for item in levelList:
-                item = item.split(" - ")
-                if item != ['']:
-                    self._levelref[int(item[0])] = int(item[2])
         # rank translation reference
         self._ranks = {"F":0, "E":1, "D":2, "C":3, "B":4, "A":5, "S":6, "S+":7}
         
@@ -145,7 +136,8 @@ class memb_interact (commands.Cog) :
         editField = ["firstname:'" + first_name, "lastname:'" + last_name]
         # send the request to the DB_interactions cog. The cog returns
         # a boolean stating whether the change was successful
-        complete = await self._db.editMemberItems(member.id, editField)
+        complete = await self._db.editMemberItems(member.id, editField, deferred=True,
+                                                  onFail=lambda: self.sendErrorMessage(ctx, "rename", "notSaved"))
         if complete:
             await member.send(f"Your new name has been set successfully, {first_name}!")
         else:
@@ -164,7 +156,8 @@ class memb_interact (commands.Cog) :
         editField = ["alignment:'" + alignment]
         # send the request to the DB_interactions cog. The cog returns
         # a boolean stating whether the change was successful
-        complete = await self._db.editMemberItems(member.id, editField)
+        complete = await self._db.editMemberItems(member.id, editField, deferred=True,
+                                                  onFail=lambda: self.sendErrorMessage(ctx, "realign", "notSaved"))
         if complete:
             await member.send(f"Your alignment has been successfully changed to {alignment}!")
         else:
@@ -192,7 +185,12 @@ class memb_interact (commands.Cog) :
             title = f"{memberInfo[1]} {memberInfo[2]}"
             if memberInfo[4] != '-':
                 title = title + f", {memberInfo[4]}"
-            nextExp = self._levelref[memberInfo[7] + 1] - memberInfo[6]
+            # exp needed to reach the next level, shared with the DB_interactions cog
+            nextExp = self._db.getProgression().expForLevel(memberInfo[7] + 1)
+            if nextExp is None: # The member is at the max level
+                nextExp = 0
+            else:
+                nextExp = nextExp - memberInfo[6]
             page = discord.Embed(title=title,
                                  description=f"Level {memberInfo[7]} {memberInfo[10]}, Rank {memberInfo[9]}\n{memberInfo[5]}",
                                  colour=discord.Colour.dark_red())
@@ -249,7 +247,8 @@ class memb_interact (commands.Cog) :
                     else:
                         await message.edit("Accepting the new quest...", components=[])
             # send the request to the database and return results to user
-            complete = await self._db.editMemberItems(member.id, ["currentRankedQuest:" + number])
+            complete = await self._db.editMemberItems(member.id, ["currentRankedQuest:" + number], deferred=True,
+                                                      onFail=lambda: self.sendErrorMessage(ctx, "takeQuest", "notSaved"))
             if not complete:
                 await self.sendErrorMessage(ctx, "takeQuest")
             else:
@@ -297,7 +296,8 @@ class memb_interact (commands.Cog) :
                         return
                     else:
                         await message.edit("Accepting the new quest...", components=[])
-            complete = await self._db.editMemberItems(member.id, ["currentHeroicQuest:" + number])
+            complete = await self._db.editMemberItems(member.id, ["currentHeroicQuest:" + number], deferred=True,
+                                                      onFail=lambda: self.sendErrorMessage(ctx, "takeHeroicQuest", "notSaved"))
             if not complete:
                 await self.sendErrorMessage(ctx, "takeHeroicQuest")
             else:
@@ -348,78 +348,30 @@ class memb_interact (commands.Cog) :
         If the args parameter is left blank, then a list of all current quests is returned.
         If not, the returned list is filtered based on what was provided in args
         """
-        # Items to be used when searching the database
-        fields = ("name", "description", "rank", "expReward", "goldReward", "type")
-        fieldTypes = {"name":"string", "description":"string", "rank":"numeric", "expReward":"numeric", "goldReward":"numeric", "type":"string"}
-        shorthands = {
-                        "fields":{"n":"name", "d":"description", "desc":"description", "r":"rank", "e":"expReward",
-                                  "exp":"expReward", "experience":"expReward", "g":"goldReward", "gold":"goldReward", "t":"type"},
-                        "type":{"1":"repeatable", "re":"repeatable", "repeat":"repeatable",
-                                "2":"ranked", "ra":"ranked",
-                                "3":"special", "s":"special", "spec":"special",
-                                "4":"heroic", "h":"heroic", "hero":"heroic"},
-                        "rank":{"none":-1, "-":-1, "f":0, "e":1, "d":2, "c":3, "b":4, "a":5, "s":6, "s+":7,
-                                "F":0, "E":1, "D":2, "C":3, "B":4, "A":5, "S":6, "S+":7}
-                      }
-        operators = (":", "!=", ">=", "<=", "<", ">", "=")
+        # The fields that can be searched are listed in Filter_compiler
         order = "number ASC"
-        # Send the fetch request to the database
-        quests = await self._db.getFromTableFilter("quests", args, fields, fieldTypes, shorthands, operators, order)
-        if quests == "error": # If an error occured, resort to an empty list for the quests
-            quests = []
-        # Create the embed list
-        questcount = len(quests)
         ranks = ("F", "E", "D", "C", "B", "A", "S", "S+") # Used to format quests
-        page = discord.Embed(title="Quest List", description=f"requested by {ctx.message.author.mention}", colour=discord.Colour.dark_red(), type="article")
-        # If there are no quests, create and send a special embed
-        if questcount == 0:
-            page.add_field(name="\u200B", value="This list is empty")
-            page.set_footer(text="0 of 0")
-            await ctx.send(embed=page)
-        # If there are not enough quests to run an interactive list,
-        # simply create and send a single embed with the quests
-        elif questcount <= 5:
+        
+        def render(quests, start, questcount):
+            """Creates the embed for a page of the list"""
+            page = discord.Embed(title="Quest List", description=f"requested by {ctx.message.author.mention}", colour=discord.Colour.dark_red(), type="article")
+            if questcount == 0:
+                page.add_field(name="\u200B", value="This list is empty")
+                page.set_footer(text="0 of 0")
+                return page
             for quest in quests:
-                firstline = f"*{quest[6]}*"
-                if quest[3] >= 0:
-                    firstline = firstline + f" - Rank **{ranks[quest[3]]}**"
-                page.add_field(name=f"`{quest[0]}` - {quest[1]}",
-                           value= firstline + f"""\n`{quest[2]}`
-                           awards {quest[4]} exp and {quest[5]} gold""", inline=False)
-            page.set_footer(text=f"1 - {questcount} of {questcount}")
-            await ctx.send(embed=page)
-        else:
-            pages = [] # different pages in the list
-            pagestart = 0 # used to track where in the list the program is
-            while pagestart < (questcount // 5) * 5: # while the bot is under the closest multiple of 5 under the number of quests:
-                # take the next 5 quests and add them to the embed
-                for i in range(pagestart, pagestart + 5):
-                    quest = quests[i]
-                    firstline = f"*{quest[6]}*"
-                    if quest[3] >= 0:
-                        firstline = firstline + f" - Rank **{ranks[quest[3]]}**"
-                    page.add_field(name=f"`{quest[0]}` - {quest[1]}",
-                                   value=firstline + f"\n`{quest[2]}`\nawards {quest[4]} exp and {quest[5]} gold",
-                                   inline=False)
-                page.set_footer(text=f"{pagestart + 1} - {pagestart + 5} of {questcount}")
-                # add the embed to the page list and create a new embed
-                pages.append(page.copy())
-                page = discord.Embed(title="Quest List", description=f"requested by {ctx.message.author.mention}", colour=discord.Colour.dark_red(), type="article")
-                # Increase the next starting point
-                pagestart += 5
-                
-            for i in range(pagestart, questcount): # add the remaining items in the list to an embed
-                quest = quests[i]
                 firstline = f"*{quest[6]}*"
                 if quest[3] >= 0:
                     firstline = firstline + f" - Rank **{ranks[quest[3]]}**"
                 page.add_field(name=f"`{quest[0]}` - {quest[1]}",
                                value=firstline + f"\n`{quest[2]}`\nawards {quest[4]} exp and {quest[5]} gold",
                                inline=False)
-            page.set_footer(text=f"{pagestart + 1} - {questcount} of {questcount}")
-            pages.append(page.copy())
-            
-            await self.runList(ctx, pages) # Send the list to be run by the bot
+            page.set_footer(text=f"{start + 1} - {start + len(quests)} of {questcount}")
+            return page
+        
+        # Only the number of quests is found up front. Each page
+        # is fetched from the database when the user turns to it
+        await self.runFilteredList(ctx, render, "quests", args, order)
             
     @commands.command()
     @in_command_channel()
@@ -430,21 +382,7 @@ class memb_interact (commands.Cog) :
         Works fundamentally the same as the questList command, but has different
         fields for the search filters, and a different format for the embed list.
         """
-        # Items used to search the database
-        fields = ("number", "name", "rank", "expReward", "goldReward", "type", "timesCompleted", "dateCompleted")
-        fieldTypes = {"number":"numeric","name":"string", "rank":"numeric", "expReward":"numeric", "goldReward":"numberic",
-                      "type":"string", "repeatable":"bool", "timesCompleted":"numeric", "dateCompleted":"date"}
-        shorthands = {
-                        "fields":{"num":"number", "n":"name", "r":"rank", "e":"expReward", "exp":"expReward", "g":"goldReward", "gold":"goldReward", "t":"type",
-                                  "tc":"timesCompleted", "timescompleted":"timesCompleted", "dc":"dateCompleted", "datecompleted":"dateCompleted"},
-                        "type":{"1":"repeatable", "re":"repeatable", "repeat":"repeatable",
-                                "2":"ranked", "ra":"ranked",
-                                "3":"special", "s":"special", "spec":"special",
-                                "4":"heroic", "h":"heroic", "hero":"heroic"},
-                        "rank":{"none":-1, "-":-1, "f":0, "e":1, "d":2, "c":3, "b":4, "a":5, "a+":6, "s":7,
-                                "F":0, "E":1, "D":2, "C":3, "B":4, "A":5, "A+":6, "S":7}
-                      }
-        operators = (":", "!=", ">=", "<=", "<", ">", "=")
+        # The fields that can be searched are listed in Filter_compiler
         order = "number ASC"
         # Used to determine if the request is for the user's log
         # or another member's log
@@ -454,20 +392,13 @@ class memb_interact (commands.Cog) :
             member = ctx.message.mentions[0]
             args = args.replace(member.mention, "").strip()
             
-        # The questlog for the requested member
-        tableName = str(member.id) + "questLog"
-        quests = await self._db.getFromTableFilter(tableName, args, fields, fieldTypes, shorthands, operators, order)
-        if quests == "error":
-            quests = []
-        
-        # From this point on, the code works logically the same as questList
-        questcount = len(quests)
-        page = discord.Embed(title="Quest List", description=f"quests completed by {member.mention}", colour=discord.Colour.dark_red(), type="article")
-        if questcount == 0:
-            page.add_field(name="\u200B", value="This list is empty")
-            page.set_footer(text="0 of 0")
-            await ctx.send(embed=page)
-        elif questcount <= 5:
+        def render(quests, start, questcount):
+            """Creates the embed for a page of the list"""
+            page = discord.Embed(title="Quest List", description=f"quests completed by {member.mention}", colour=discord.Colour.dark_red(), type="article")
+            if questcount == 0:
+                page.add_field(name="\u200B", value="This list is empty")
+                page.set_footer(text="0 of 0")
+                return page
             for quest in quests:
                 if quest[3] == 1:
                     compRow = f"{quest[6]} times"
@@ -476,49 +407,65 @@ class memb_interact (commands.Cog) :
                 page.add_field(name=f"`{quest[0]}` - {quest[1]}",
                                value=f"*{quest[5]}* - awarded {quest[3]} exp and {quest[4]} gold\ncompleted {compRow}",
                                inline=False)
-            page.set_footer(text=f"1 - {questcount} of {questcount}")
-            await ctx.send(embed=page)
-        else:
-            pages = []
-            pagestart = 0
-            
-            while pagestart < (questcount // 5) * 5:
-                for i in range(pagestart, pagestart + 5):
-                    quest = quests[i]
-                    if quest[3] == 1:
-                        compRow = f"{quest[6]} times"
-                    else:
-                        compRow = f"on {quest[7]}"
-                    page.add_field(name=f"`{quest[0]}` - {quest[1]}",
-                                   value=f"*{quest[5]}* - awarded {quest[3]} exp and {quest[4]} gold\ncompleted {compRow}",
-                                   inline=False)
-                page.set_footer(text=f"{pagestart + 1} - {pagestart + 5} of {questcount}")
-                pages.append(page.copy())
-                page = discord.Embed(title="Quest List", description=f"quests completed by {member.mention}", colour=discord.Colour.dark_red(), type="article")
-                pagestart += 5
-                
-            for i in range(pagestart, questcount):
-                quest = quests[i]
-                if quest[3] == 1:
-                    compRow = f"{quest[6]} times"
-                else:
-                    compRow = f"on {quest[7]}"
-                page.add_field(name=f"`{quest[0]}` - {quest[1]}",
-                               value=f"*{quest[5]}* - awarded {quest[3]} exp and {quest[4]} gold\ncompleted {compRow}",
-                               inline=False)
-                page.set_footer(text=f"{pagestart + 1} - {questcount} of {questcount}")
-                pages.append(page.copy())
-            
-            await self.runList(ctx, pages)
+            page.set_footer(text=f"{start + 1} - {start + len(quests)} of {questcount}")
+            return page
+        
+        # The questlog for the requested member, fetched a page at a time
+        await self.runFilteredList(ctx, render, "questLog", args, order, memberId=member.id)
+    
+    async def runFilteredList(self, ctx, render, table, args, order, memberId=None):
+        """Runs a list of the rows of a table which match a search filter,
+        such as the questList and questLog commands.
+        
+        Only the number of matching rows is found up front; each page of 5
+        is selected from the database when the user turns to it, using the
+        cursor of the page beside it. render(rows, start, total) creates the
+        embed for a page, where start is the position of its first row
+        """
+        count = await self._db.countFromTableFilter(table, args, memberId)
+        if count == "error": # If an error occured, resort to an empty list
+            count = 0
+        pagecount = max(1, (count + 4) // 5)
+        # The page the user is on, its embed, and the cursors of its first and last rows
+        current = {"page": None, "embed": None, "first": None, "last": None}
         
-    async def runList(self, ctx, pages):
+        async def getPage(pageNum):
+            """Fetches and creates the given page of the list. The user can only
+            move one page at a time or to either end, so the page is always
+            found from the current page's cursors or from an end of the list
+            """
+            if pageNum == current["page"]:
+                return current["embed"]
+            elif current["page"] is not None and pageNum == current["page"] + 1:
+                page = await self._db.pageFromTableFilter(table, args, order, memberId, current["last"], False, 5)
+            elif current["page"] is not None and pageNum == current["page"] - 1:
+                page = await self._db.pageFromTableFilter(table, args, order, memberId, current["first"], True, 5)
+            elif pageNum == pagecount - 1 and pageNum != 0:
+                # The last page holds whatever is left over after the full pages
+                page = await self._db.pageFromTableFilter(table, args, order, memberId, None, True, count - pageNum * 5)
+            else:
+                page = await self._db.pageFromTableFilter(table, args, order, memberId, None, False, 5)
+            rows = []
+            if page != "error":
+                rows, current["first"], current["last"] = page
+            current["page"] = pageNum
+            current["embed"] = render(rows, pageNum * 5, count)
+            return current["embed"]
+        
+        if pagecount == 1: # If there are not enough rows to need an interactive list, send a single embed
+            await ctx.send(embed=await getPage(0))
+        else:
+            await self.runList(ctx, pagecount, getPage) # Send the list to be run by the bot
+    
+    async def runList(self, ctx, pagecount, getPage):
         """Used to run a list which a user can interact with to switch through pages
         
-        The method takes in a list of embeds (pages) and displays them for the user with
-        buttons attached to allow the user to switch between pages. This method is currently
-        only used in conjuction with the questList and questLog commands.
+        The method takes in the number of pages and a coroutine, getPage(pageNum), which
+        returns the embed for a page. The pages are displayed for the user with buttons
+        attached to allow the user to switch between pages, and each page is only created
+        once the user turns to it. This method is currently only used in conjuction with
+        the questList and questLog commands, through runFilteredList.
         """
-        pagecount = len(pages) # Total number of pages
         pageNum = 0 # current page the user is viewing
         comp = [[ # buttons used for the user to interact with
                     # Since the code starts on the first page, the back and beginning buttons start disabled
@@ -528,10 +475,10 @@ class memb_interact (commands.Cog) :
                     Button(style=ButtonStyle.gray, emoji=discord.PartialEmoji(id=None, name="⏩"), custom_id="end", disabled=False)
                 ]]
         # send the first page to the user and wait for a response
-        message = await ctx.send(embed=pages[pageNum], components=comp)
+        message = await ctx.send(embed=await getPage(pageNum), components=comp)
         check = lambda inter: (inter.user.id == ctx.message.author.id
                                 and inter.message.id == message.id) # Used to ensure the response is from the right message and user
-        self._logger.info("Member_interactions:runList: running a list with %s items", len(pages))
+        self._logger.info("Member_interactions:runList: running a list with %s pages", pagecount)
         while True: # continuously loop until quit
             try:
                 result = await self._bot.wait_for("button_click", check=check, timeout=60.0)
@@ -572,7 +519,7 @@ class memb_interact (commands.Cog) :
                     
                 # Respond to the interaction and return the new page
                 await result.respond(type=6)
-                await message.edit(embed=pages[pageNum], components=comp)
+                await message.edit(embed=await getPage(pageNum), components=comp)
     
     @commands.command()
     @in_command_channel()
@@ -630,13 +577,16 @@ class memb_interact (commands.Cog) :
                 "questList": {"ex":"QB questList `filters [optional]`", "desc":"Look up a list of quests."
                             +" If no filter is provided, it will return a list of all quests currently available\n"
                             + "```diff\n-FILTERS\nname {shorthands: n}\ndescription {shorthands: d, desc}\nrank {shorthands: r}\n"
-                            + "experience {shorthands: e, exp}\ngold {shorthands: g}\ntype {shorthands: t}\n\n-SORTING\n"
+                            + "experience {shorthands: e, exp}\ngold {shorthands: g}\ntype {shorthands: t}\n\n"
+                            + "-SEARCHING\nname and description match any part of the text (n:agon finds Dragon). "
+                            + "Unless you choose a sort, searches of 3 or more letters list the best matches first\n\n-SORTING\n"
                             + "sort by [field] [descending]\norder=[field] [desc]\no=[field] [d]\n\n-OPERATIONS\n=, !=, >, <, >=, <=```"},
                 "questLog": {"ex":"QB questLog `user [optional]` `filters [optional]`", "desc":"Retrieves the list of quests completed by a user. "
                             + "If a user isn't provided, then the quest log of the member who used the command is retrieved.\n"
                             + "```diff\n-FILTERS\nnumber {shorthands: num}\nname {shorthands: n}\nrank {shorthands: r}\nexp {shorthangs: e}\ngold {shorthands: g}\n"
-                            + "type {shorthands: t}\ntimescompleted {shorthands: tc}\ndatecompleted {shorthands: dc}\n\n-SORTING\nsort by [field] [descending]"
-                            + "order=[field] [desc]\no=[field] [d]\n\n-OPERATIONS'n=, !=, >, <, >=, <=```"},
+                            + "type {shorthands: t}\ntimescompleted {shorthands: tc}\ndatecompleted {shorthands: dc}\nseason {shorthands: se} (2022, spring2022, fall2022)\n\n"
+                            + "-SORTING\nsort by [field] [descending]"
+                            + "order=[field] [desc]\no=[field] [d]\n\n-OPERATIONS'n=, !=, >, <, >=, <=\n\n-ARCHIVE\nall (include quests from past seasons)```"},
                 "reportQuest": {"ex":"QB reportQuest", "desc":"Gives you the form to report a completed quest to the quest masters"},
                 "takeQuest": {"ex":"QB takeQuest `quest number`", "desc":"registers the given quest as your active ranked quest. You need to register "
                               + "a ranked quest before attempting it. If you already have an active quest, you will be asked to confirm if you want to switch to the new quest"},
@@ -689,6 +639,9 @@ class memb_interact (commands.Cog) :
         elif errorType == "none found" :
             self._logger.warning("Member_interactions:%s:Quit Warning: User %s not part of the quest system", command, ctx.message.author.name)
             await ctx.send(f"It looks like you haven't registered to the quest system yet! Use the `addMe` command in {self._messageChannel.mention} to be added to the guild")
+        elif errorType == "notSaved" : # A deferred edit failed after the member was told it worked
+            self._logger.warning("Member_interactions:%s:Quit Warning: edit requested by %s could not be saved", command, ctx.message.author.name)
+            await ctx.send(f"Sorry, I couldn't save your last `{command}` request after all. Please try it again later")
         else :
             self._logger.warning("Member_interactions:%s:Quit Warning: unknown error forced command to quit", command)
             await ctx.send("Sorry, something unknown went wrong. Please give the code monkeys some time to fix it and try again later")
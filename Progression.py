@@ -0,0 +1,79 @@
+#===============================================================================
+# This file creates the table used to turn a member's experience into their
+# level and rank.
+#
+# The level and rank requirements are read from the references folder once,
+# then compiled into sorted lists so that finding a member's level is a
+# binary search and finding their rank is a single list lookup.
+#===============================================================================
+
+from bisect import bisect_right
+
+class progressionTable:
+    """The compiled level and rank requirements of the quest system"""
+    def __init__(self, levelExp: dict, rankLevels: dict):
+        """Compiles the requirements into lookup lists.
+
+        levelExp pairs each level with the total experience needed to reach
+        it. A negative requirement marks the level past the max level.
+        rankLevels pairs each rank with its lowest and highest level
+        """
+        # Total experience needed for levels 1, 2, 3, ... up to the max level
+        levels = sorted((level, exp) for level, exp in levelExp.items() if exp >= 0)
+        self._firstLevel = levels[0][0]
+        self._levelExp = [exp for level, exp in levels]
+        self._maxLevel = levels[-1][0]
+        # The rank of each level, found by indexing with the level itself.
+        # Levels which are not covered by a rank are left as None
+        self._levelRank = [None] * (self._maxLevel + 1)
+        for rank, (low, high) in rankLevels.items():
+            for level in range(max(int(low), 0), min(int(high), self._maxLevel) + 1):
+                self._levelRank[level] = rank
+
+    @classmethod
+    def fromFiles(cls, levelPath="./references/levels.txt", rankPath="./references/ranks.txt"):
+        """Reads the requirements from the reference files.
+        Each line of the levels file is "level - exp - total exp", and
+        each line of the ranks file is "rank - min level/max level"
+        """
+        levelExp = {}
+        with open(levelPath, "r") as file:
+            file.readline()
+            for item in file.read().split("\n"):
+                item = item.split(" - ")
+                if item != ['']:
+                    levelExp[int(item[0])] = int(item[2])
+        rankLevels = {}
+        with open(rankPath, "r") as file:
+            file.readline()
+            for item in file.read().split("\n"):
+                item = item.split(" - ")
+                if item != ['']:
+                    rankLevels[item[0]] = item[1].split("/")
+        return cls(levelExp, rankLevels)
+
+    @property
+    def maxLevel(self):
+        """The highest level a member can reach"""
+        return self._maxLevel
+
+    def levelFor(self, exp: int):
+        """Returns the level a member with the given experience should be.
+        This is the highest level whose requirement the experience meets
+        """
+        return self._firstLevel - 1 + bisect_right(self._levelExp, exp)
+
+    def rankFor(self, level: int):
+        """Returns the rank of the given level, or None if no rank covers it"""
+        if 0 <= level <= self._maxLevel:
+            return self._levelRank[level]
+        return None
+
+    def expForLevel(self, level: int):
+        """Returns the total experience needed to reach the given level,
+        or None if the level is past the max level
+        """
+        index = level - self._firstLevel
+        if 0 <= index < len(self._levelExp):
+            return self._levelExp[index]
+        return None
@@ -0,0 +1,70 @@
+#===============================================================================
+# This file creates the in-memory copy of the quests table.
+#
+# The quest table only changes when the quest list is loaded from the
+# quest spreadsheet, so rather than querying the database for every quest
+# lookup, the bot keeps a read-only catalog of every quest. A new catalog
+# is built each time the quests are loaded and swapped in all at once, so
+# a lookup never sees a half-loaded list.
+#===============================================================================
+
+from types import MappingProxyType
+
+class questCatalog:
+    """A read-only, versioned copy of every quest in the quests table,
+    indexed by quest number, rank and type. Quests are stored as the
+    same tuples the database returns:
+    (number, name, description, rank, exp reward, gold reward, type)
+    """
+    def __init__(self, quests=(), version: int=0):
+        """Builds the catalog from a list of quest tuples.
+        The version is used to tell catalogs apart, and goes up
+        by one every time the quests are reloaded
+        """
+        self._version = version
+        byNumber = {}
+        byRank = {}
+        byType = {}
+        for quest in quests:
+            quest = tuple(quest)
+            byNumber[quest[0]] = quest
+            byRank.setdefault(quest[3], []).append(quest)
+            byType.setdefault(quest[6], []).append(quest)
+        # Nothing outside the catalog can change its contents
+        self._byNumber = MappingProxyType(byNumber)
+        self._byRank = MappingProxyType({rank: tuple(items) for rank, items in byRank.items()})
+        self._byType = MappingProxyType({questType: tuple(items) for questType, items in byType.items()})
+
+    @property
+    def version(self):
+        """The version of the catalog"""
+        return self._version
+
+    def __len__(self):
+        return len(self._byNumber)
+
+    def get(self, questNum):
+        """Returns the quest with the given number, or None if
+        it does not exist. The number can be given as a string,
+        since quest numbers typed by users are not converted first
+        """
+        try:
+            return self._byNumber.get(int(questNum))
+        except (TypeError, ValueError):
+            return self._byNumber.get(questNum)
+
+    def exists(self, questNum):
+        """Returns whether a quest with the given number exists"""
+        return self.get(questNum) is not None
+
+    def withRank(self, rank: int):
+        """Returns every quest of the given rank number (-1 for unranked quests)"""
+        return self._byRank.get(rank, ())
+
+    def ofType(self, questType: str):
+        """Returns every quest of the given type, such as "ranked" or "heroic\""""
+        return self._byType.get(questType, ())
+
+    def all(self):
+        """Returns every quest in the catalog"""
+        return tuple(self._byNumber.values())
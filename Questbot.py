@@ -21,52 +21,42 @@ from discord.ext import commands
 from discord_components import ComponentsBot, Select, SelectOption
 #used for the admin methods
 import asyncio
+import io
 # Python's built in logger library. Most of the libraries used
 # for this project are already compatible with this
 import logging
+from Bot_logging import queueLogger, fileHandler
 # Importing the cogs
 from DB_interactions import db_interact
 from Member_interactions import memb_interact
 from Google_interactions import google_interact
 from announcements import announceSystem
+# The database connection manager shared by the cogs
+from DB_connection import db_connection
 
-# Set up the loggers for the cogs
+# Set up the loggers for the cogs.
+# Every logger hands its messages to a background thread
+# through a queue, so writing the logs never holds up the bot
+logListeners = []
 # Basic logger
-handler = logging.FileHandler(filename='./logs/errors.log', encoding='utf-8', mode='w')
-logging.basicConfig(handlers=[handler])
+logListeners.append(queueLogger('', fileHandler('./logs/errors.log', '%(levelname)s:%(name)s:%(message)s'), level=logging.WARNING))
 
 # Discord Logger
-logger = logging.getLogger('discord')
-logger.setLevel(logging.INFO)
-handler = logging.FileHandler(filename='./logs/discord.log', encoding='utf-8', mode='w')
-formatter = logging.Formatter('%(asctime)s:%(name)s:%(levelname)s :%(message)s')
-handler.setFormatter(formatter)
-logger.addHandler(handler)
+logListeners.append(queueLogger('discord', fileHandler('./logs/discord.log', '%(asctime)s:%(name)s:%(levelname)s :%(message)s')))
 
 # Database Logger
-logger = logging.getLogger('sqlite3')
-logger.setLevel(logging.INFO)
-handler = logging.FileHandler(filename='./logs/database.log', encoding='utf-8', mode='w')
-formatter = logging.Formatter('%(asctime)s:%(name)s:%(levelname)s: %(message)s')
-handler.setFormatter(formatter)
-logger.addHandler(handler)
+logListeners.append(queueLogger('sqlite3', fileHandler('./logs/database.log', '%(asctime)s:%(name)s:%(levelname)s: %(message)s')))
 
 # Google API Logger
-logger = logging.getLogger('googleapiclient')
-logger.setLevel(logging.INFO)
-handler = logging.FileHandler(filename='./logs/google.log', encoding='utf-8', mode='w')
-formatter = logging.Formatter('%(asctime)s:%(name)s:%(levelname)s: %(message)s')
-handler.setFormatter(formatter)
-logger.addHandler(handler)
+logListeners.append(queueLogger('googleapiclient', fileHandler('./logs/google.log', '%(asctime)s:%(name)s:%(levelname)s: %(message)s')))
 
 # Bot activity Logger
-logger = logging.getLogger('bot activity')
-logger.propagate = False
-logger.setLevel(logging.INFO)
-handler = logging.FileHandler(filename='./logs/botactions.log', encoding='utf-8', mode='w')
-formatter = logging.Formatter('%(asctime)s:%(name)s:%(levelname)s:%(message)s')
-handler.setFormatter(formatter)
-logger.addHandler(handler)
+# Large row lists are only written in full at DEBUG (see Bot_logging.payload),
+# and the log is rolled over at 5MB so it can still be sent with the logs command
+logListeners.append(queueLogger('bot activity', fileHandler('./logs/botactions.log', '%(asctime)s:%(name)s:%(levelname)s:%(message)s',
+                                                            maxBytes=5000000, backupCount=3), propagate=False))
+for listener in logListeners:
+    listener.start()
 
 class admin (commands.Cog):
     """This Cog is used to hold all admin commands for the bot
@@ -215,7 +205,134 @@ class admin (commands.Cog):
             parameters = ()
             
         result = await self._db._runCommand(command, parameters)
+        # Discord messages are limited to 2000 characters
+        if len(result) > 1900:
+            result = result[:1900] + "... (cut off, use queryDatabase to see large results)"
         await ctx.send(result)
+    
+    @commands.command(aliases=["queryDB", 'query'])
+    @has_admin()
+    async def queryDatabase(self, ctx, *, command):
+        """Runs a query on a read-only connection to the database.
+        Small results are sent to the invoking channel, and larger ones
+        are attached as a gzipped CSV file. Queries are stopped after
+        5 seconds, and at most 50000 rows are read
+        """
+        if " -PARAMS " in command:
+            items = command.split(" -PARAMS ")
+            command = items[0]
+            parameters = items[1].split(", ")
+        else:
+            parameters = ()
+        
+        result = await self._db._runQuery(command, parameters)
+        if type(result) == str: # an error message
+            await ctx.send(result)
+            return
+        
+        if result["attachment"] is None:
+            lines = [" | ".join(result["columns"])] + [" | ".join(str(item) for item in row) for row in result["rows"]]
+            text = "\n".join(lines)
+            if len(text) > 1900:
+                text = text[:1900] + "..."
+            await ctx.send(f"{result['count']} row(s)\n```\n{text}\n```")
+        else:
+            summary = f"{result['count']} row(s), attached as a CSV file"
+            if result["truncated"]:
+                summary = summary + f". The result was cut off at {result['count']} rows"
+            await ctx.send(summary, file=discord.File(io.BytesIO(result["attachment"]), filename="query.csv.gz"))
+    
+    @commands.command(aliases=["backup"])
+    @has_admin()
+    async def backupDatabase(self, ctx):
+        """Takes a backup of the database right away. Backups are also
+        taken automatically every 12 hours
+        """
+        await ctx.send("Backing up the database...")
+        result = await self._db.backupDatabase()
+        if result.startswith("Error"):
+            await ctx.send(result)
+        else:
+            await ctx.send(f"The database was backed up to {result}")
+    
+    @commands.command()
+    @has_admin()
+    async def archiveLogs(self, ctx, days: int=None):
+        """Moves quest log entries last completed more than the given number
+        of days ago into the archive database. Without a number, the bot's
+        usual cut-off is used. This is also done automatically once a day
+        """
+        result = await self._db.archiveQuestLogs(days)
+        if type(result) == str: # an error message
+            await ctx.send(result)
+        else:
+            await ctx.send(f"Moved {result} quest log entries to the archive")
+    
+    @commands.command(aliases=["restore"])
+    @has_admin()
+    async def restoreBackup(self, ctx, name="latest", confirm=""):
+        """Checks a backup against the database, comparing the row counts of
+        the adventurers, quests and questLog tables. If confirm is "confirm",
+        the database is replaced by the backup and the counts are checked again
+        """
+        result = await self._db.restoreBackup(name, confirm.lower() == "confirm")
+        if type(result) == str: # an error message
+            await ctx.send(result)
+            return
+        
+        lines = [f"{table}: {count} in the backup, {result['liveCounts'][table]} in the database"
+                 for table, count in result["backupCounts"].items()]
+        text = "\n".join(lines)
+        if result["restored"]:
+            status = "verified" if result["verified"] else "__the row counts do not match the backup__"
+            await ctx.send(f"Restored {result['backup']} ({status})\n```\n{text}\n```")
+        else:
+            await ctx.send(f"{result['backup']}: integrity check {result['integrity']}\n```\n{text}\n```\n"
+                           + f"Use `QB restoreBackup {result['backup']} confirm` to restore it")
+                    
+    @commands.command()
+    @has_admin()
+    async def dbStats(self, ctx):
+        """Sends the hit and miss counts of the db_interact
+        cog's adventurer cache. Used to check the cache is working
+        """
+        stats = self._db.cacheStats()
+        total = stats["hits"] + stats["misses"]
+        hitRate = 0 if total == 0 else round(stats["hits"] / total * 100, 1)
+        await ctx.send(f"Adventurer cache: {stats['hits']} hits, {stats['misses']} misses ({hitRate}% hit rate), "
+                       + f"holding {stats['size']} of {stats['maxSize']} members")
+        writes = self._db.writeStats()
+        mode = "off" if writes["interval"] == 0 else f"every {writes['interval']} ms or {writes['ops']} edits"
+        await ctx.send(f"Write-behind ({mode}): {writes['edits']} edits in {writes['flushes']} flushes, {writes['failed']} failed, "
+                       + f"{writes['waiting']} waiting. Commit time {writes['commitTime']} ms average, {writes['maxCommitTime']} ms max; "
+                       + f"flush delay {writes['flushTime']} ms average, {writes['maxFlushTime']} ms max")
+    
+    @commands.command()
+    @has_admin()
+    async def writeBehind(self, ctx, interval: int=0, ops: int=32):
+        """Turns the database's write-behind mode on or off. While it is on,
+        member commands like rename and takeQuest are committed together every
+        interval milliseconds, or once ops of them are waiting
+        """
+        await self._db.setWriteBehind(interval, ops)
+        if interval <= 0:
+            await ctx.send("Write-behind is off; every change is committed on its own")
+        else:
+            await ctx.send(f"Write-behind is on; member changes are committed every {interval} ms or every {max(ops, 1)} changes")
+                    
+    @commands.command()
+    @has_admin()
+    async def logLevel(self, ctx, level="info"):
+        """Sets the level of the bot activity log. At debug, every row
+        list is written to the log in full instead of a short sample
+        """
+        levels = {"debug": logging.DEBUG, "info": logging.INFO, "warning": logging.WARNING, "error": logging.ERROR}
+        if level.lower() not in levels:
+            await ctx.send("That isn't a log level. Use `debug`, `info`, `warning`, or `error`")
+            return
+        self._logger.setLevel(levels[level.lower()])
+        self._logger.warning("admin: bot activity log level set to %s", level.upper())
+        await ctx.send(f"Bot activity log level set to {level.upper()}")
                     
     @commands.command()
     @has_admin()
@@ -275,6 +392,9 @@ class admin (commands.Cog):
         """
         await ctx.send("received")
         await self._updatecog.updateSelf()
+        left = self._updatecog.leftMembers()
+        if left != []:
+            await ctx.send(f"{len(left)} member(s) are no longer in the server: " + ", ".join(str(memberId) for memberId in left))
         await ctx.send("complete")
         
     @commands.command()
@@ -304,8 +424,8 @@ class admin (commands.Cog):
         if command == None:
             page = discord.Embed(title="Admin Commands", description="use |QB adminHelp `command`| for information on a specific command", colour=discord.Colour.dark_red())
             page.add_field(name="Dev tools", value="`sayHi`, `getInfo`, `viewQuestLog`")
-            page.add_field(name="Updates", value="`forceAnnounce`, `forceUpdate`, `forceSelf`, `forceQuests`, `forceSpreadsheet`, `accessDatabase`")
-            page.add_field(name="Debug", value="`startAnnounceTimer`, `startUpdateTimer`, `logs`")
+            page.add_field(name="Updates", value="`forceAnnounce`, `forceUpdate`, `forceSelf`, `forceQuests`, `forceSpreadsheet`, `accessDatabase`, `queryDatabase`, `backupDatabase`, `restoreBackup`, `archiveLogs`")
+            page.add_field(name="Debug", value="`startAnnounceTimer`, `startUpdateTimer`, `logs`, `logLevel`, `dbStats`, `writeBehind`")
         else:
             # this dictionary has every admin command, and stores a dictionary with
             # an example and description for the command. Allows the program to easily access
@@ -321,7 +441,7 @@ class admin (commands.Cog):
                                  +"Only use this when absolutely necessary. See the other force commands for common use"},
                 "forceSelf": {"ex":"QB forceSelf", "desc":"Forces an update of the local database for the bot. Includes changes to the database from the master spreadsheet "
                               + "and processing approved/denied quests. I only recommend using this right before doing important work involving someone's info, when you need "
-                              + "to make sure everything is up to date"},
+                              + "to make sure everything is up to date. Lists any members who are no longer in the server"},
                 "forceQuests": {"ex":"QB forceQuests", "desc":"Forces an update to the quests. Includes accepting announcements, quest submissions, and updating the quest database"},
                 "forceSpreadsheet": {"ex":"QB forceSpreadsheet", "desc":"Forces an update of the master spreadsheet from the database. "
                                      + "Only updates the member spreadsheet with their updated stats, so it is ok to use relatively frequently. "
@@ -337,11 +457,30 @@ class admin (commands.Cog):
                 "startUpdateTimer": {"ex": "QB startUpdateTimer", "desc": "Forces the google API system to set a timer "
                                        + "to start it's next update cycle. There is currently no system in place to stop multiple timers "
                                        + "from existing, so only use this method if you are sure the normal update clock did not start on its own"},
+                "dbStats": {"ex": "QB dbStats", "desc": "Sends the hit and miss counts of the database's member cache, "
+                            + "to check that it is saving the bot from repeating queries, and the commit times of the write-behind queue"},
+                "writeBehind": {"ex": "QB writeBehind `interval in ms` `changes (optional)`", "desc": "Turns on write-behind mode, which commits member "
+                                + "commands like rename and takeQuest together instead of one at a time. Useful when a lot of members use the bot at once, "
+                                + "like during meetings. The changes are committed every interval, or once the given number of changes are waiting (32 by default). "
+                                + "Use `QB writeBehind 0` to turn it off"},
+                "logLevel": {"ex": "QB logLevel `debug/info/warning/error`", "desc": "Sets how much the bot writes to the bot activity log. "
+                             + "At debug, lists of rows are written in full rather than as a short sample. Defaults to info"},
                 "logs": {"ex": "QB logs", "desc": "Sends a list of available activity logs for the bot with a selection list. "
                          + "Selecting a log from the list will make the bot send an attachment with the log to the list"},
                 "accessDatabase": {"ex": "QB accessDatabase `command` -PARAMS `parameters (optional)`",
                                    "desc": "Passes a command into the database. __ONLY USE THIS COMMAND__ IF you know how to use sqlite "
-                                   + "and you are a developer for the bot"}
+                                   + "and you are a developer for the bot"},
+                "queryDatabase": {"ex": "QB queryDatabase `query` -PARAMS `parameters (optional)`",
+                                  "desc": "Runs a query on the database without being able to change it. Small results are sent to the channel, "
+                                  + "larger ones are attached as a gzipped CSV file. Queries are stopped after 5 seconds, and at most 50000 rows are read"},
+                "archiveLogs": {"ex": "QB archiveLogs `days (optional)`", "desc": "Moves quest log entries which were last completed more than the given "
+                                + "number of days ago (365 by default) into the archive. Archived entries only show up in questLog when members search with `all` or `season:`. "
+                                + "The bot does this once a day on its own"},
+                "backupDatabase": {"ex": "QB backupDatabase", "desc": "Backs up the database into the backups folder right away. "
+                                   + "The bot also does this every 12 hours, keeping the last 14 backups"},
+                "restoreBackup": {"ex": "QB restoreBackup `backup name or latest` `confirm (optional)`",
+                                  "desc": "Checks a backup and compares its member, quest and quest log counts with the database. "
+                                  + "Add `confirm` to replace the database with the backup. __Anything changed since the backup is lost__"}
             }
             
             if command in commands:
@@ -392,12 +531,26 @@ intentions.members = True
 
 # Create the bot, load all the cogs into it, then run it with the token loaded before
 quest_bot = ComponentsBot(command_prefix="QB ", intents=intentions, help_command=None)
+# Every cog which uses the database shares the same connections
+# Old quest log entries are moved into the archive database
+questDB = db_connection("QuestDB.db", attach={"archive": "QuestArchive.db"})
 
 #quest_bot.add_cog(stupidStuff(quest_bot)) # dont add this in for any official release
-quest_bot.add_cog(google_interact(quest_bot))
-quest_bot.add_cog(db_interact(quest_bot, "QuestDB.db"))
+googleCog = google_interact(quest_bot)
+quest_bot.add_cog(googleCog)
+questCog = db_interact(quest_bot, questDB)
+quest_bot.add_cog(questCog)
 quest_bot.add_cog(memb_interact(quest_bot))
-quest_bot.add_cog(announceSystem(quest_bot, "QuestDB.db"))
+quest_bot.add_cog(announceSystem(quest_bot, questDB))
 quest_bot.add_cog(admin(quest_bot))
 
 quest_bot.run(Token)
+# run only returns once the bot has shut down. Commit any
+# member changes still waiting in the write-behind queue first
+questCog.flushWritesBlocking()
+questDB.close()
+# Let any Google request still running finish, then stop its threads
+googleCog.close()
+# Write out anything still waiting in the log queues
+for listener in logListeners:
+    listener.stop()
@@ -9,10 +9,9 @@
 # and any messages which involve announcing quests for members
 #===============================================================================
 
-# basic discord and Sqlite libraries
+# basic discord libraries
 import discord
 from discord.ext import commands, tasks
-import sqlite3
 # used to handle the announcement/end dates and the announcement cycle
 import datetime
 import asyncio
@@ -20,6 +19,7 @@ import asyncio
 import os.path
 # used for the logger
 import logging
+from Bot_logging import payload
 
 # announcement database contents:
 # -- eventAnnounce:
@@ -32,31 +32,26 @@ class announceSystem(commands.Cog):
     automatically sending any in the database to the discord server
     and pinging those that are opt in to the announcements
     """
-    def __init__(self, bot, db_path):
+    def __init__(self, bot, dbconn):
         """Initializes the cog.
-        Stores the parent bot and the path to the database.
-        Also tests the database path to ensure it exists
+        Stores the parent bot and the database connection
+        manager, which is shared with the DB_interactions cog
         """
         self._bot = bot
         self._logger = logging.getLogger('bot activity')
-        self._dbpath = db_path
-        try:
-            test = sqlite3.connect(db_path)
-            test.close()
-        except Exception as e:
-            print(e)
-            self._logger.critical("announcements:init:Connection Error: %s", str(e))
+        self._dbconn = dbconn
             
         self.announcementTimer.start()
         
     @commands.Cog.listener()
     async def on_connect(self):
-        """Creates the connection to the database and a cursor
-        for use in the methods once the bot connects to discord's servers.
+        """Gathers a reference to the Google_interactions cog
+        once the bot connects to discord's servers. The database
+        connections are shared and opened once, so reconnecting
+        to discord does not open new ones
         """
-        self._connection = sqlite3.connect(self._dbpath)
-        self._cursor = self._connection.cursor()
         self._google = self._bot.get_cog("google_interact")
+        self._db = self._bot.get_cog("db_interact")
             
     @commands.Cog.listener()
     async def on_ready(self):
@@ -80,47 +75,63 @@ class announceSystem(commands.Cog):
         gathered in the Google_interactions cog, then inserts each item into
         the database
         """
-        for item in announcements:
-            try:
-                if not await self.questExists(int(item[1])):
-                    self._logger.warning("announcements:addAnnouncements:Quit Warning: couldn't add item %s due to nonexistance", item[1])
-                    continue
-                elif len(item) == 4 and item[3].lower() == "remove":
-                    await self.removeAnnouncement(item)
-                    del item
-                    continue
+        # Every announcement is added in one unit of work, so no other
+        # cog can commit or roll back part of the list. Each one has its own
+        # savepoint, so one which fails is skipped without undoing the others
+        async with self._db.unitOfWork() as unit:
+            for item in announcements:
+                try:
+                    if not await self.questExists(int(item[1])):
+                        self._logger.warning("announcements:addAnnouncements:Quit Warning: couldn't add item %s due to nonexistance", item[1])
+                        continue
+                    elif len(item) == 4 and item[3].lower() == "remove":
+                        await self.removeAnnouncement(item)
+                        del item
+                        continue
                 
-                announceTime = datetime.datetime.strptime(item[2], "%m/%d/%Y").date() # convert the date from a string to a datetime object
-                if item[0] == "event": # if this is an event quest, check if there is a defined end date
-                    if len(item) > 3: # if there is, convert it to a datetime
-                        endTime = datetime.datetime.strptime(item[3], "%m/%d/%Y").date()
-                    else: # if not, specify there is none
-                        endTime = "N/A"
-                    self._cursor.execute("INSERT INTO eventAnnounce VALUES (?,?,?)", (int(item[1]), announceTime, endTime))
-                elif item[0] == "weekly": # If it is a weekly quest, simply add it to the database
-                    self._cursor.execute("INSERT INTO weeklyAnnounce VALUES (?, ?)", (int(item[1]), announceTime))
+                    announceTime = datetime.datetime.strptime(item[2], "%m/%d/%Y").date() # convert the date from a string to a datetime object
+                    if item[0] == "event": # if this is an event quest, check if there is a defined end date
+                        if len(item) > 3: # if there is, convert it to a datetime
+                            endTime = datetime.datetime.strptime(item[3], "%m/%d/%Y").date()
+                        else: # if not, specify there is none
+                            endTime = "N/A"
+                        await self._runItem(lambda connection: connection.execute("INSERT INTO eventAnnounce VALUES (?,?,?)", (int(item[1]), announceTime, endTime)))
+                    elif item[0] == "weekly": # If it is a weekly quest, simply add it to the database
+                        await self._runItem(lambda connection: connection.execute("INSERT INTO weeklyAnnounce VALUES (?, ?)", (int(item[1]), announceTime)))
             
-            except Exception as e:
-                self._logger.error("announcements:addAnnouncements:Insertion Error: %s", str(e))
+                except Exception as e:
+                    self._logger.error("announcements:addAnnouncements:Insertion Error: %s", str(e))
             
-        self._logger.info("announcements:addAnnouncements: added %s new announcements\n%s", str(len(announcements)), str(announcements))
-        self._connection.commit()
+        if unit.failed:
+            self._logger.error("announcements:addAnnouncements:Insertion Error: rolled back all %s announcements", str(len(announcements)))
+            return
+        self._logger.info("announcements:addAnnouncements: added %s new announcements\n%s", str(len(announcements)), payload(announcements))
+    
+    async def _runItem(self, func):
+        """Runs func(connection) under a savepoint and commits it, or adds it to
+        the unit of work it is called in. If it fails, only its own changes are
+        undone, and the error is raised here instead of failing the whole unit
+        """
+        def run(connection):
+            connection.execute("SAVEPOINT announcement")
+            try:
+                func(connection)
+            except Exception as e:
+                connection.execute("ROLLBACK TO announcement")
+                return e
+            finally:
+                connection.execute("RELEASE announcement")
+        error = await self._dbconn.transaction(run)
+        if error is not None:
+            raise error
         
     async def questExists(self, questNum):
-        """Searches the quests table in the database to ensure
+        """Searches the quest catalog to ensure
         the given quest exists. Used when loading announcements into the
         database
         """
-        # Find the quest
-        try:
-            quest = self._cursor.execute("SELECT * FROM quests WHERE number=?", (questNum,))
-        except Exception as e:
-            print(e)
-            self._logger.error("announcements:questExists:Selection Error: %s", str(e))
-            return False
-        
-        # Test if the quest has any associated values
-        if quest == []:
+        # Test if the quest is in the catalog
+        if not self._db.getCatalog().exists(questNum):
             self._logger.info("announcements:questExists: Tested quest number %s for existance, returned False", str(questNum))
             return False
         else:
@@ -131,16 +142,15 @@ class announceSystem(commands.Cog):
         """Removes an announcement from the database
         based on their quest number and announcement date.
         
-        Since this method is designed to work with the addAnnouncements method,
-        it does not commit the change at the end, rather it allows addAnnouncements to
-        do so after it makes all the changes requested from the spreadsheet
+        When called by addAnnouncements, the deletion is committed along
+        with the rest of the changes requested from the spreadsheet
         """
         announceDate = datetime.datetime.strptime(announce[2], "%m/%d/%Y").date() # Get the datetime of the announcement date
         try:
             if announce[0] == "event": # Remove from event table
-                self._cursor.execute("DELETE FROM eventAnnounce WHERE number=? AND announceDate=?", (announce[1], announceDate))
+                await self._runItem(lambda connection: connection.execute("DELETE FROM eventAnnounce WHERE number=? AND announceDate=?", (announce[1], announceDate)))
             elif announce[0] == "weekly": # Remove from weekly table
-                self._cursor.execute("DELETE FROM weeklyAnnounce WHERE number=? AND announceDate=?", (announce[1], announceDate))
+                await self._runItem(lambda connection: connection.execute("DELETE FROM weeklyAnnounce WHERE number=? AND announceDate=?", (announce[1], announceDate)))
         
         except Exception as e:
             self._logger.error("announcements:removeAnnouncement:Deletion Error: %s", str(e))
@@ -162,10 +172,11 @@ class announceSystem(commands.Cog):
         nextDate = date + datetime.timedelta(days=7)
         nextDateString = nextDate.strftime("%b. %d") # Used when making the announcement
         ranks = ("F", "E", "D", "C", "B", "A", "S", "S+", "Unranked") # Used for searching for a quest poster
+        catalog = self._db.getCatalog() # Used to look up each announced quest
         
         try:
             # Select every announcement that matches today's date
-            announces = self._cursor.execute("SELECT * FROM weeklyAnnounce WHERE announceDate=?", (date,)).fetchall()
+            announces = await self._dbconn.fetch("SELECT * FROM weeklyAnnounce WHERE announceDate=?", (date,))
         
             if announces != [] : # If announcements are found, mention quest members
                 await self._channelRef.send(f"{self._rolesref['F'].mention} {self._rolesref['E'].mention} {self._rolesref['D'].mention} {self._rolesref['C'].mention}"
@@ -174,7 +185,7 @@ class announceSystem(commands.Cog):
             
             for item in announces: # for each announcment
                 # Find the quest in the database and check if a poster is saved to the server
-                quest = self._cursor.execute("SELECT * FROM quests WHERE number=?", (item[0],)).fetchall()[0]
+                quest = catalog.get(item[0])
                 imagePath = f"./questPics/{ranks[quest[3]]}/quest{quest[0]}.jpg"
                 if os.path.exists(imagePath): # If there is a poster, create an embed to send to the server
                     announcement = discord.Embed(title=f"{quest[0]} - {quest[1]}", description=f"Ends on {nextDateString}",
@@ -198,10 +209,9 @@ class announceSystem(commands.Cog):
         except Exception as e:
             self._logger.error("announcements:weekly_announce:Selection Error: %s", str(e))
         else: # If no error occured, delete every announcement from today or earlier
-            self._logger.info("announcements:weekly_announce: gathered %s items from table weeklyAnnounce\n%s", str(len(announces)), str(announces))
-            self._cursor.execute("DELETE FROM weeklyAnnounce WHERE announceDate<=?;", (date,))
+            self._logger.info("announcements:weekly_announce: gathered %s items from table weeklyAnnounce\n%s", str(len(announces)), payload(announces))
+            await self._dbconn.transaction(lambda connection: connection.execute("DELETE FROM weeklyAnnounce WHERE announceDate<=?;", (date,)))
             self._logger.info("announcements:weekly_announce: deleted items from table weeklyAnnounce with date <= %s", str(date))
-            self._connection.commit()
         
     async def event_announce(self):
         """Checks the eventAnnounce table in the database for special quests
@@ -214,9 +224,10 @@ class announceSystem(commands.Cog):
         nextDay = date + datetime.timedelta(days=1) # Used for quests with no given end date, assuming it is a one day event
         nextDayString = nextDay.strftime("%b. %d")
         ranks = ("F", "E", "D", "C", "B", "A", "S", "S+", "Unranked")
+        catalog = self._db.getCatalog()
         
         try:
-            announces = self._cursor.execute("SELECT * FROM eventAnnounce WHERE announceDate=?", (date,)).fetchall()
+            announces = await self._dbconn.fetch("SELECT * FROM eventAnnounce WHERE announceDate=?", (date,))
         
             if announces != [] :
                 await self._channelRef.send(f"{self._rolesref['F'].mention} {self._rolesref['E'].mention} {self._rolesref['D'].mention} {self._rolesref['C'].mention}"
@@ -224,7 +235,7 @@ class announceSystem(commands.Cog):
                                             + "\n\nThere are some special quests for today, check them out!")
             
             for item in announces:
-                quest = self._cursor.execute("SELECT * FROM quests WHERE number=?", (item[0],)).fetchall()[0]
+                quest = catalog.get(item[0])
                 imagePath = f"./questPics/{ranks[quest[3]]}/quest{quest[0]}.jpg"
                 if os.path.exists(imagePath):
                     if item[2] == "N/A": # If there is no given end date, set the end date to tommorow
@@ -259,10 +270,9 @@ class announceSystem(commands.Cog):
         except Exception as e:
             self._logger.error("announcements:event_announce:Selection Error: %s", str(e))
         else:
-            self._logger.info("announcements:event_announce: gathered %s items from table eventAnnounce\n%s", str(len(announces)), str(announces))
-            self._cursor.execute("DELETE FROM eventAnnounce WHERE announceDate<=?;", (date,))
+            self._logger.info("announcements:event_announce: gathered %s items from table eventAnnounce\n%s", str(len(announces)), payload(announces))
+            await self._dbconn.transaction(lambda connection: connection.execute("DELETE FROM eventAnnounce WHERE announceDate<=?;", (date,)))
             self._logger.info("announcements:event_announce: deleted items from table eventAnnounce with date <= %s", str(date))
-            self._connection.commit()
     
     async def runAnnouncements(self):
         """Runs all announcement methods in the cog, then automatically
@@ -303,14 +313,14 @@ class announceSystem(commands.Cog):
         quests = []
         
         try:
-            weekly = self._cursor.execute("SELECT * FROM weeklyAnnounce").fetchall()
-            event = self._cursor.execute("SELECT * FROM eventAnnounce").fetchall()
+            weekly = await self._dbconn.fetch("SELECT * FROM weeklyAnnounce")
+            event = await self._dbconn.fetch("SELECT * FROM eventAnnounce")
         except Exception as e:
             self._logger.error("announcements:get_all:Selection Error: %s", str(e))
             return("error")
         else:
-            self._logger.info("announcements:get_all: gathered %s items from weeklyAnnounce\n%s", str(len(weekly)), str(weekly))
-            self._logger.info("announcements:get_all: gathered %s items from eventAnnounce\n%s", str(len(event)), str(event))
+            self._logger.info("announcements:get_all: gathered %s items from weeklyAnnounce\n%s", str(len(weekly)), payload(weekly))
+            self._logger.info("announcements:get_all: gathered %s items from eventAnnounce\n%s", str(len(event)), payload(event))
             quests.append(weekly)
             quests.append(event)
             return(quests)
@@ -0,0 +1,76 @@
+#===============================================================================
+# Tests for DB_connection's connection manager.
+#
+# The bot's heartbeats run on the same event loop as every command, so a
+# query which blocked the loop would stop the bot from answering discord.
+#===============================================================================
+
+import asyncio
+import sqlite3
+import time
+from DB_connection import db_connection
+
+TICK = 0.01 # seconds between heartbeats
+SLEEP = 0.5 # seconds the writer query sleeps for
+
+def sleepy(connection, seconds):
+    """Runs a query which sleeps inside of sqlite for the given seconds"""
+    connection.create_function("sleep", 1, lambda seconds: time.sleep(seconds) or seconds)
+    return connection.execute("SELECT sleep(?)", (seconds,)).fetchone()[0]
+
+def count(connection, rows):
+    """Runs a large recursive query, returning the number of rows it made"""
+    return connection.execute("WITH RECURSIVE numbers(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM numbers WHERE n < ?) "
+                              "SELECT count(*), sum(n) FROM numbers", (rows,)).fetchone()[0]
+
+async def heartbeatDuring(*queries):
+    """Awaits the queries while a heartbeat ticks every TICK seconds.
+    Returns their results, how long they took and the time of each tick
+    """
+    ticks = []
+    stop = asyncio.Event()
+    async def heartbeat():
+        # The last tick is taken once the queries are done, so a
+        # blocked loop is seen even if the queries blocked until the end
+        while True:
+            ticks.append(time.perf_counter())
+            if stop.is_set():
+                break
+            await asyncio.sleep(TICK)
+    beating = asyncio.create_task(heartbeat())
+    # Let the heartbeat start before the queries do
+    await asyncio.sleep(TICK)
+    start = time.perf_counter()
+    results = await asyncio.gather(*queries)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await beating
+    return results, elapsed, ticks
+
+def longestGap(ticks):
+    """Returns the longest time between two heartbeats"""
+    return max(later - earlier for earlier, later in zip(ticks, ticks[1:]))
+
+def testEventLoopRunsDuringSlowQueries(tmp_path):
+    """The heartbeat keeps ticking while the writer and a reader run slow queries"""
+    dbconn = db_connection(str(tmp_path / "check.db"))
+    # The readers open the database read-only, so it has to exist first
+    dbconn.runBlocking(lambda connection: connection.execute("CREATE TABLE heartbeat (tick INTEGER)"))
+    try:
+        (slept, counted), elapsed, ticks = asyncio.run(heartbeatDuring(dbconn.transaction(sleepy, SLEEP), dbconn.read(count, 1000000)))
+    finally:
+        dbconn.close()
+    assert slept == SLEEP and counted == 1000000
+    assert elapsed >= SLEEP
+    assert len(ticks) >= elapsed / TICK / 2
+    assert longestGap(ticks) < 0.25
+
+def testHeartbeatNoticesABlockedLoop():
+    """The same query run on the event loop itself stops the heartbeat,
+    so the test above would notice a query which blocked it
+    """
+    async def blocking():
+        return sleepy(sqlite3.connect(":memory:"), SLEEP)
+    (slept,), elapsed, ticks = asyncio.run(heartbeatDuring(blocking()))
+    assert slept == SLEEP
+    assert longestGap(ticks) >= SLEEP
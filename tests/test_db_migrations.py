@@ -0,0 +1,115 @@
+#===============================================================================
+# Tests for DB_migrations, run on in-memory databases.
+#
+# Covers a new database, one from before the shared questLog table, and
+# the triggers which keep memberNames and memberAliases up to date.
+#===============================================================================
+
+import sqlite3
+import pytest
+from DB_migrations import runMigrations, schemaVersion, MIGRATIONS, QUEST_LOG_COLUMNS
+
+@pytest.fixture
+def connection():
+    connection = sqlite3.connect(":memory:")
+    yield connection
+    connection.close()
+
+def tables(connection):
+    """The names of every table in the database"""
+    return {name for (name,) in connection.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+
+def testNewDatabase(connection):
+    assert runMigrations(connection) == MIGRATIONS[-1][0]
+    assert schemaVersion(connection) == MIGRATIONS[-1][0]
+    assert {"adventurers", "quests", "questLog", "memberNames", "memberAliases", "memberChanges"} <= tables(connection)
+    assert connection.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+
+def testMigrationsOnlyRunOnce(connection):
+    runMigrations(connection)
+    changes = connection.total_changes
+    assert runMigrations(connection) == MIGRATIONS[-1][0]
+    assert connection.total_changes == changes
+
+def testFailedMigrationIsRolledBack(connection):
+    def broken(connection):
+        connection.execute("CREATE TABLE halfDone (id INTEGER)")
+        raise RuntimeError("broken migration")
+    with pytest.raises(RuntimeError):
+        runMigrations(connection, MIGRATIONS[:1] + ((2, broken),))
+    assert schemaVersion(connection) == 1
+    assert "halfDone" not in tables(connection)
+
+def testOldQuestLogsAreFolded(connection):
+    """Each member's own quest log table is moved into questLog, keeping
+    the latest completion of each quest
+    """
+    connection.execute(f"CREATE TABLE '55questLog' ({QUEST_LOG_COLUMNS})")
+    connection.executemany("INSERT INTO '55questLog' VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                           [(1, "Rat", 0, 5, 1, "ranked", 3, "05/01/2022"),
+                            (1, "Rat", 0, 5, 1, "ranked", 1, "01/09/2023"),
+                            (1, "Rat", 0, 5, 1, "ranked", 2, "12/30/2022"),
+                            (2, "Wolf", 0, 5, 1, "ranked", 1, "01/01/2022"),
+                            (2, "Wolf", 0, 5, 1, "ranked", 7, "01/01/2022")])
+    runMigrations(connection)
+    assert "55questLog" not in tables(connection)
+    rows = connection.execute("SELECT memberId, number, timesCompleted, dateCompleted FROM questLog ORDER BY number").fetchall()
+    # The latest date wins, and the last row added wins a tie
+    assert rows == [(55, 1, 1, "01/09/2023"), (55, 2, 7, "01/01/2022")]
+
+class names:
+    """Changes the discord names in a migrated database and reads back
+    the memberNames and memberAliases tables
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        runMigrations(connection)
+    def add(self, memberId, name):
+        self.connection.execute("INSERT INTO adventurers (ID, discordName) VALUES (?, ?)", (memberId, name))
+    def rename(self, memberId, name):
+        self.connection.execute("UPDATE adventurers SET discordName=? WHERE ID=?", (name, memberId))
+    def current(self):
+        return dict(self.connection.execute("SELECT memberId, nameKey FROM memberNames"))
+    def aliases(self):
+        return dict(self.connection.execute("SELECT nameKey, memberId FROM memberAliases"))
+
+def testNamesAreNormalised(connection):
+    members = names(connection)
+    members.add(1, "  Ann#0001 ")
+    assert members.current() == {1: "ann#0001"}
+
+def testRenameKeepsTheOldNameAsAnAlias(connection):
+    members = names(connection)
+    members.add(1, "Ann#0001")
+    members.rename(1, "Cat#0003")
+    assert members.current() == {1: "cat#0003"}
+    assert members.aliases() == {"ann#0001": 1}
+
+def testAHeldNameIsNeverTaken(connection):
+    """A member given another member's name is left without one,
+    whether they join with it or rename to it
+    """
+    members = names(connection)
+    members.add(1, "Ann#0001")
+    members.add(2, "ANN#0001")
+    assert members.current() == {1: "ann#0001"}
+    members.rename(2, "Bob#0002")
+    members.rename(2, " ann#0001")
+    assert members.current() == {1: "ann#0001"}
+    assert members.aliases() == {"bob#0002": 2}
+
+def testCurrentNamesReplaceOldNames(connection):
+    members = names(connection)
+    members.add(1, "Ann#0001")
+    members.add(2, "Bob#0002")
+    members.rename(1, "Cat#0003")
+    members.rename(2, "Ann#0001")
+    assert members.current() == {1: "cat#0003", 2: "ann#0001"}
+    assert members.aliases() == {"bob#0002": 2}
+
+def testDeletedMembersLoseTheirNames(connection):
+    members = names(connection)
+    members.add(1, "Ann#0001")
+    members.rename(1, "Cat#0003")
+    connection.execute("DELETE FROM adventurers WHERE ID=1")
+    assert members.current() == {} and members.aliases() == {}
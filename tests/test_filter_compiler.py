@@ -0,0 +1,85 @@
+#===============================================================================
+# Tests for Filter_compiler's parsing, plan cache and the queries it builds.
+#
+# The queries are run against an in-memory quests table, with and without
+# the questSearch full text index, so both ways of searching are checked
+# to find the same quests.
+#===============================================================================
+
+import sqlite3
+import timeit
+import pytest
+# Dates in filters are read with dateparser
+pytest.importorskip("dateparser")
+from Filter_compiler import parseFilter, compileFilter, condition, ordering, QUEST_FILTER
+
+QUESTS = [(1, "Dragon", "Slay the great dragon", 7, 900, 100, "heroic"),
+          (2, "Giant Spider", "Clear the webs from the old mill", 3, 50, 20, "ranked"),
+          (3, "Rat", "Clear the cellar of rats", 0, 5, 1, "ranked"),
+          (4, "Wyrm", "A lesser dragon", 3, 60, 30, "ranked"),
+          (5, "Wolf", "Drive off the wolves", 0, 10, 5, "repeatable")]
+
+SAMPLES = ("r:c exp>=50 sort by gold desc", "n:giant spider t:h", "type:ranked g>10 e<100 o=exp d",
+           "description:the old mill rank!=none", "n:wolf r:f sort by rank")
+
+@pytest.fixture(scope="module")
+def connection():
+    connection = sqlite3.connect(":memory:")
+    connection.execute("CREATE TABLE quests (number INTEGER PRIMARY KEY, name TEXT, description TEXT, rank INTEGER, expReward INTEGER, goldReward INTEGER, type TEXT)")
+    connection.executemany("INSERT INTO quests VALUES (?, ?, ?, ?, ?, ?, ?)", QUESTS)
+    connection.execute("CREATE VIRTUAL TABLE questSearch USING fts5(number UNINDEXED, name, description, tokenize='trigram')")
+    connection.execute("INSERT INTO questSearch SELECT number, name, description FROM quests")
+    yield connection
+    connection.close()
+
+def search(connection, args, useIndex=True):
+    """Returns the numbers of the quests the filter finds, in order"""
+    plan = compileFilter("quests", args, "number ASC", useIndex)
+    return [row[0] for row in connection.execute(plan.command("quests"), plan.parameters())]
+
+def testParsesFieldsShorthandsAndOrder():
+    conditions, order, chosen = parseFilter(QUEST_FILTER, "r:c exp>=50 sort by gold desc", "number ASC")
+    assert conditions == (condition("rank", "=", "numeric", 3), condition("expReward", ">=", "numeric", 50))
+    assert order == ordering("goldReward", "DESC") and chosen
+
+def testPlainWordsExtendTheLastValue():
+    conditions, order, chosen = parseFilter(QUEST_FILTER, "n:giant spider t:h", "number ASC")
+    assert conditions == (condition("name", "=", "string", "giant spider"), condition("type", "=", "string", "heroic"))
+    assert order == ordering("number", "ASC") and not chosen
+
+def testInvalidFieldsAndOrdersAreIgnored():
+    conditions, order, chosen = parseFilter(QUEST_FILTER, "colour:red o=colour", "number ASC")
+    assert conditions == ()
+    assert order == ordering("number", "ASC") and not chosen
+
+def testValuesArePassedAsParameters():
+    plan = compileFilter("quests", "n:x');DROP", "number ASC", False)
+    assert "DROP" not in plan.command("quests")
+    assert "%x');DROP%" in plan.parameters()
+
+def testPlansAreCached():
+    first = compileFilter("quests", "n:wolf r:f", "number ASC")
+    hits = compileFilter.cache_info().hits
+    assert compileFilter("quests", "n:wolf r:f", "number ASC") is first
+    assert compileFilter.cache_info().hits == hits + 1
+
+@pytest.mark.parametrize("args, found", [("n:agon", [1]), ("n:AGON", [1]), ("n:ra", [1, 3]), ("d:old mill", [2]),
+                                         ("d:dragon", [1, 4]), ("n!=agon", [2, 3, 4, 5]), ("d:rats n:ra", [3]),
+                                         ("n:x", []), ("r:c e>55", [4])])
+def testIndexFindsTheSameQuestsAsLike(connection, args, found):
+    """The index matches any part of a name or description, like LIKE '%...%'"""
+    assert sorted(search(connection, args)) == found
+    assert search(connection, args, useIndex=False) == found
+
+def testIndexedSearchesAreRankedUnlessOrdered(connection):
+    assert compileFilter("quests", "d:dragon", "number ASC").order == "searchRank, number ASC"
+    assert compileFilter("quests", "d:dragon sort by exp desc", "number ASC").order == "expReward DESC"
+    assert search(connection, "d:dragon sort by exp desc") == [1, 4]
+
+def testCachedPlansAreFasterThanParsing():
+    """Each sample parsed 2000 times, then compiled through the cache 2000 times"""
+    rounds = 2000
+    parseTime = timeit.timeit(lambda: [parseFilter(QUEST_FILTER, args, "number ASC") for args in SAMPLES], number=rounds)
+    compileTime = timeit.timeit(lambda: [compileFilter("quests", args, "number ASC") for args in SAMPLES], number=rounds)
+    print(f"parsed in {parseTime:.3f}s, compiled in {compileTime:.3f}s ({compileFilter.cache_info()})")
+    assert compileTime < parseTime
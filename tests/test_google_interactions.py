@@ -0,0 +1,112 @@
+#===============================================================================
+# Tests for how google_interact reads the quest sheets.
+#
+# The Sheets service is replaced by one which records every request made
+# and answers from the rows below, so nothing is sent to Google.
+#===============================================================================
+
+import asyncio
+import logging
+import pytest
+# The cog needs discord and the Google client libraries to be imported
+pytest.importorskip("discord")
+pytest.importorskip("googleapiclient")
+from Google_interactions import google_interact, questFromRow, QUEST_RANGES
+
+# Rows as the quest sheets return them: blank rows come back as [], and
+# rows with empty cells at the end come back short
+SHEETS = {
+    "Repeatable!A2:G": [["1", "Wash", "Wash a dish", "5", "1", "daily"], ["2", "Cook", "Cook", "10", "2", "daily", "Rank C"],
+                        ["3", "short"], [], ["4", "Run", "Run", "5", "1", "weekly", "Heroic, Rank S+"]],
+    "F Rank!A2:G": [["10", "Rat", "Kill a rat", "5", "1", "cellar"], ["11", "Boar", "Boar", "5", "1", "woods", "Heroic"], [""]],
+    "C Rank!A2:G": [["40", "Wolf", "Wolf", "50", "10", "hills", "", "extra"], ["41", "", "", "", ""]],
+    "S+ Rank!A2:G": [["90", "Dragon", "Dragon", "900", "100", "peak", "Heroic quest"]],
+    "Event Specific!A2:F": [["100", "Fair", "Fair", "5", "5", "town"], ["101", "Ball", "Ball", "5", "5"],
+                            ["102", "Joust", "Joust", "5", "5", "field", "Rank B, Heroic, Repeatable"]],
+    }
+
+RANKS = {"F":0, "E":1, "D":2, "C":3, "B":4, "A":5, "S":6, "S+":7}
+
+def perSheetParse(sheets):
+    """The quests as they were parsed when each sheet was read on its own"""
+    quests = []
+    for row in sheets.get("Repeatable!A2:G", []):
+        if len(row) >= 6:
+            rank = -1
+            if len(row) > 6 and "Rank " in row[6]:
+                rank = RANKS[row[6][row[6].find("Rank ") + 5]]
+            quests.append((row[0], row[1], row[2] + " - " + row[5], rank, row[3], row[4], "repeatable"))
+    for rank, range_ in enumerate(("F Rank!A2:G", "E Rank!A2:G", "D Rank!A2:G", "C Rank!A2:G",
+                                   "B Rank!A2:G", "A Rank!A2:G", "S Rank!A2:G", "S+ Rank!A2:G")):
+        for row in sheets.get(range_, []):
+            if len(row) >= 6:
+                questType = "heroic" if len(row) > 6 and "Heroic" in row[6] else "ranked"
+                quests.append((row[0], row[1], row[2] + " - " + row[5], rank, row[3], row[4], questType))
+    for row in sheets.get("Event Specific!A2:F", []):
+        if len(row) >= 6:
+            rank = -1
+            questType = "special"
+            if len(row) > 6:
+                if "Rank " in row[6]:
+                    rank = RANKS[row[6][row[6].find("Rank ") + 5]]
+                if "Heroic" in row[6]:
+                    questType = questType + " - heroic"
+                if "Repeatable" in row[6]:
+                    questType = questType + " - repeatable"
+            quests.append((row[0], row[1], row[2] + " - " + row[5], rank, row[3], row[4], questType))
+    return quests
+
+class recordingService:
+    """Stands in for both the Sheets service and the asyncGoogle adapter,
+    recording each request built and answering from sheets
+    """
+    def __init__(self, sheets):
+        self.sheets = sheets
+        self.requests = []
+    def spreadsheets(self):
+        return self
+    def values(self):
+        return self
+    def batchGet(self, spreadsheetId, ranges):
+        self.requests.append(("batchGet", spreadsheetId, tuple(ranges)))
+        return {"valueRanges": [{"range": range_, "values": self.sheets[range_]} if range_ in self.sheets else {"range": range_}
+                                for range_ in ranges]}
+    def get(self, **kwargs):
+        self.requests.append(("get", kwargs))
+        return {}
+    async def execute(self, request, timeout=None):
+        return request
+
+def makeCog(service):
+    """Creates the cog without signing in to Google"""
+    cog = google_interact.__new__(google_interact)
+    cog._logger = logging.getLogger('bot activity')
+    cog._sheetService = service
+    cog._google = service
+    cog._spreadsheetID = ("master", "quests", "submissions")
+    return cog
+
+def testOneBatchGetPerRefresh():
+    service = recordingService(SHEETS)
+    cog = makeCog(service)
+    for refresh in range(3):
+        asyncio.run(cog._readQuests())
+        assert len(service.requests) == refresh + 1
+    ranges = tuple(range_ for range_, sheet, rank in QUEST_RANGES)
+    assert service.requests == [("batchGet", "quests", ranges)] * 3
+
+def testParsedTheSameAsPerSheet():
+    quests = asyncio.run(makeCog(recordingService(SHEETS))._readQuests())
+    assert quests == perSheetParse(SHEETS)
+
+@pytest.mark.parametrize("row", [[], [""], ["3", "short"], ["41", "", "", "", ""]])
+def testShortRowsAreSkipped(row):
+    for range_, sheet, rank in QUEST_RANGES:
+        assert questFromRow(row, sheet, rank) is None
+
+def testMissingRangesLoadNothing():
+    """A partial answer would delete the quests of the missing sheets"""
+    class partialService(recordingService):
+        def batchGet(self, spreadsheetId, ranges):
+            return {"valueRanges": super().batchGet(spreadsheetId, ranges)["valueRanges"][:-1]}
+    assert asyncio.run(makeCog(partialService(SHEETS))._readQuests()) is None
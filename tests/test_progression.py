@@ -0,0 +1,99 @@
+#===============================================================================
+# Tests for Progression's level and rank table.
+#
+# The table replaced the loops checkMemberLevel used to run over the level
+# and rank requirements, so every member must get the same level, rank and
+# class from it as they did from the loops.
+#===============================================================================
+
+import os
+import random
+import timeit
+import pytest
+from Progression import progressionTable
+
+REFERENCES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "references")
+LEVELS = os.path.join(REFERENCES, "levels.txt")
+RANKS = os.path.join(REFERENCES, "ranks.txt")
+
+def readReferences():
+    """Reads the requirements the way checkMemberLevel did before the table,
+    keeping the order of the files
+    """
+    levelRef = {}
+    with open(LEVELS, "r") as file:
+        file.readline()
+        for item in file.read().split("\n"):
+            item = item.split(" - ")
+            if item != ['']:
+                levelRef[int(item[0])] = int(item[2])
+    rankRef = {}
+    with open(RANKS, "r") as file:
+        file.readline()
+        for item in file.read().split("\n"):
+            item = item.split(" - ")
+            if item != ['']:
+                rankRef[item[0]] = item[1].split("/")
+    return levelRef, rankRef
+
+LEVEL_REF, RANK_REF = readReferences()
+
+def loopLookup(memberExp, memberLevel=0):
+    """The level and rank the old checkMemberLevel loops found"""
+    for level, exp in LEVEL_REF.items():
+        # The first level the member can't reach, or the one past the max level
+        if memberExp < exp or exp < 0:
+            memberLevel = level - 1
+            break
+    memberRank = None
+    for rank, levels in RANK_REF.items():
+        if memberLevel >= int(levels[0]) and memberLevel <= int(levels[1]):
+            memberRank = rank
+            break
+    return memberLevel, memberRank
+
+@pytest.fixture(scope="module")
+def table():
+    return progressionTable.fromFiles(LEVELS, RANKS)
+
+def tableLookup(table, memberExp):
+    """The level and rank the table finds"""
+    level = table.levelFor(memberExp)
+    return level, table.rankFor(level)
+
+def boundaries():
+    """Every exp requirement, and one exp either side of it"""
+    return sorted({exp + offset for exp in LEVEL_REF.values() if exp >= 0 for offset in (-1, 0, 1)})
+
+def members(count=100000):
+    """The exp of count members, spread past the max level"""
+    spread = random.Random(2022)
+    top = max(LEVEL_REF.values())
+    return [spread.randint(0, top + 1000) for member in range(count)]
+
+@pytest.mark.parametrize("memberExp", boundaries())
+def testBoundariesMatchTheLoops(table, memberExp):
+    old = loopLookup(memberExp)
+    new = tableLookup(table, memberExp)
+    assert new == old
+    # Classes are every 10 levels, as counted by the congratulations
+    assert new[0] // 10 == old[0] // 10
+
+def testMembersMatchTheLoops(table):
+    for memberExp in members():
+        assert tableLookup(table, memberExp) == loopLookup(memberExp), f"{memberExp} exp"
+
+def testMaxLevel(table):
+    top = max(LEVEL_REF.values())
+    assert table.maxLevel == max(level for level, exp in LEVEL_REF.items() if exp >= 0)
+    assert table.levelFor(top * 10) == table.maxLevel
+    assert table.expForLevel(table.maxLevel + 1) is None
+    assert table.expForLevel(2) == LEVEL_REF[2]
+
+def testTableIsFasterThanTheLoops(table):
+    """100k member lookups, timed with each"""
+    exps = members()
+    loopTime = timeit.timeit(lambda: [loopLookup(memberExp) for memberExp in exps], number=1)
+    tableTime = timeit.timeit(lambda: [tableLookup(table, memberExp) for memberExp in exps], number=1)
+    print(f"loops: {loopTime * 1000:.1f}ms, table: {tableTime * 1000:.1f}ms for {len(exps)} members")
+    assert tableTime < loopTime